@@ -154,6 +154,10 @@ class MessageBubble(QFrame):
             self.label.setText(text)
             self.adjustSize()
     
+    def appendText(self, text):
+        """Acrescenta texto (usado durante o streaming da resposta)"""
+        self.setText(self._text + text)
+    
     def text(self):
         return self._text
 
@@ -386,7 +390,8 @@ class TerminalDetector(QWidget):
 
 class AIWorker(QThread):
     """Thread worker para processar IA em background"""
-    responseReady = pyqtSignal(str)
+    chunkReady = pyqtSignal(str)
+    responseFinished = pyqtSignal()
     
     def __init__(self, ai_engine, message):
         super().__init__()
@@ -395,14 +400,16 @@ class AIWorker(QThread):
     
     def run(self):
         try:
-            # Usar método chat ao invés de process_request
-            result = self.ai_engine.chat(self.message)
-            self.responseReady.emit(result)
+            # Streaming: cada trecho é emitido assim que o modelo o produz
+            for chunk in self.ai_engine.chat_stream(self.message):
+                self.chunkReady.emit(chunk)
         except Exception as e:
             import traceback
             error_detail = traceback.format_exc()
             print(f"❌ Erro completo:\n{error_detail}")
-            self.responseReady.emit(f"❌ Erro: {str(e)}")
+            self.chunkReady.emit(self.ai_engine.chat_error_message(e))
+        finally:
+            self.responseFinished.emit()
 
 
 class ChatInterface(QMainWindow):
@@ -415,6 +422,14 @@ class ChatInterface(QMainWindow):
         self.ai_engine = None
         self.current_worker = None
         
+        # Streaming: trechos acumulados e aplicados no balão em lotes
+        self.streaming_bubble = None
+        self.stream_buffer = []
+        self.streamFlushTimer = QTimer(self)
+        self.streamFlushTimer.setSingleShot(True)
+        self.streamFlushTimer.setInterval(50)
+        self.streamFlushTimer.timeout.connect(self.flushStreamBuffer)
+        
         # Carregar config e inicializar IA
         self.loadConfig()
         self.setupUI()
@@ -753,6 +768,8 @@ class ChatInterface(QMainWindow):
         
         # Scroll para baixo
         QTimer.singleShot(100, lambda: self.scrollToBottom())
+        
+        return bubble
     
     def scrollToBottom(self):
         """Scroll automático para última mensagem"""
@@ -786,7 +803,8 @@ class ChatInterface(QMainWindow):
         
         # Processar com IA em thread separada
         self.current_worker = AIWorker(self.ai_engine, text)
-        self.current_worker.responseReady.connect(self.onAIResponse)
+        self.current_worker.chunkReady.connect(self.onAIChunk)
+        self.current_worker.responseFinished.connect(self.onAIResponseFinished)
         self.current_worker.start()
     
     def showTypingIndicator(self):
@@ -826,10 +844,37 @@ class ChatInterface(QMainWindow):
             self.typing_container.deleteLater()
             self.typing_container = None
     
-    def onAIResponse(self, response):
-        """Callback quando IA responde"""
-        self.hideTypingIndicator()
-        self.addMessage(response, is_user=False)
+    def onAIChunk(self, chunk):
+        """Callback para cada trecho da resposta da IA"""
+        if self.streaming_bubble is None:
+            # Primeiro trecho: troca o 'digitando...' pelo balão da resposta
+            self.hideTypingIndicator()
+            self.streaming_bubble = self.addMessage(chunk, is_user=False)
+            self.setStatus("working", "Respondendo...")
+            return
+        
+        # Trechos seguintes são agrupados para evitar um repaint por token
+        self.stream_buffer.append(chunk)
+        if not self.streamFlushTimer.isActive():
+            self.streamFlushTimer.start()
+    
+    def flushStreamBuffer(self):
+        """Aplica os trechos acumulados no balão em streaming"""
+        if self.streaming_bubble is not None and self.stream_buffer:
+            self.streaming_bubble.appendText(''.join(self.stream_buffer))
+            self.stream_buffer = []
+            self.scrollToBottom()
+    
+    def onAIResponseFinished(self):
+        """Callback quando a IA termina de responder"""
+        self.streamFlushTimer.stop()
+        self.flushStreamBuffer()
+        
+        if self.streaming_bubble is None:
+            self.hideTypingIndicator()
+            self.addMessage("❌ A IA não retornou resposta.", is_user=False)
+        
+        self.streaming_bubble = None
         self.setStatus("idle", "Pronto")
         self.current_worker = None
     
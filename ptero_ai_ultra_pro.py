@@ -15,12 +15,39 @@ import tarfile
 import re
 import ast
 import time
+import sqlite3
+import threading
+from contextlib import contextmanager
 from datetime import datetime
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple, Any
-from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple, Any, Callable, Iterator, Set
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+from collections import OrderedDict, deque, Counter
+from dataclasses import dataclass, field, asdict, is_dataclass
 from enum import Enum
-import google.generativeai as genai
+import zlib
+import copy
+import tempfile
+import heapq
+import math
+import itertools
+import bisect
+import random
+import difflib
+import fnmatch
+import select
+import struct
+import ctypes
+import ctypes.util
+import mmap
+import multiprocessing
+
+try:
+    import google.generativeai as genai
+except ImportError:
+    # Sem o SDK apenas o backend local (LocalBackend) fica disponível
+    genai = None
 
 
 class SecurityLevel(Enum):
@@ -65,614 +92,3929 @@ class AIDecision:
     alternatives: List[str] = field(default_factory=list)
     validation: Optional[ValidationResult] = None
     execution_plan: List[str] = field(default_factory=list)
+    
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'AIDecision':
+        """Reconstrói decisão a partir do formato serializado no cache"""
+        data = dict(data)
+        validation = data.get('validation')
+        if isinstance(validation, dict):
+            validation = dict(validation)
+            validation['security_level'] = SecurityLevel(validation['security_level'])
+            data['validation'] = ValidationResult(**validation)
+        return cls(**data)
+
+
+def _json_default(obj: Any) -> Any:
+    """Serializa dataclasses e enums para JSON"""
+    if isinstance(obj, Enum):
+        return obj.value
+    if is_dataclass(obj) and not isinstance(obj, type):
+        return asdict(obj)
+    if isinstance(obj, Path):
+        return str(obj)
+    raise TypeError(f"Objeto não serializável: {type(obj).__name__}")
+
+
+_fingerprint_memo: Dict[str, Tuple[int, int, str]] = {}
+_fingerprint_lock = threading.Lock()
+
+
+def file_fingerprint(path: str) -> str:
+    """Hash do conteúdo de um arquivo (memorizado por mtime e tamanho)"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return 'missing'
+    
+    with _fingerprint_lock:
+        memo = _fingerprint_memo.get(path)
+    if memo and memo[0] == stat.st_mtime_ns and memo[1] == stat.st_size:
+        return memo[2]
+    
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    fingerprint = digest.hexdigest()
+    
+    with _fingerprint_lock:
+        _fingerprint_memo[path] = (stat.st_mtime_ns, stat.st_size, fingerprint)
+    return fingerprint
+
+
+def context_version(system_context: Dict) -> str:
+    """Versão do contexto do sistema (ignora o timestamp da análise)"""
+    if system_context.get('version'):
+        return system_context['version']
+    relevant = {k: v for k, v in system_context.items() if k not in ('timestamp', 'version')}
+    return hashlib.md5(json.dumps(relevant, sort_keys=True, default=_json_default).encode()).hexdigest()
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimativa barata de tokens (~4 caracteres por token)"""
+    return len(text) // 4 + 1
+
+
+# Arquivos a partir deste tamanho são lidos por mmap em vez de linha a linha
+MMAP_THRESHOLD = 256 * 1024
+
+
+def read_lines(path: str, start: int, end: int) -> str:
+    """Linhas start..end (1-based, inclusive) de um arquivo, sem ler o resto
+    
+    Arquivos grandes são mapeados em memória: as quebras de linha são
+    localizadas direto nas páginas do arquivo e só o trecho pedido vira str.
+    """
+    try:
+        if os.path.getsize(path) < MMAP_THRESHOLD:
+            with open(path, encoding='utf-8', errors='ignore') as f:
+                return ''.join(itertools.islice(f, start - 1, end)).rstrip('\n')
+        
+        with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            begin = 0
+            for _ in range(start - 1):
+                begin = mm.find(b'\n', begin) + 1
+                if not begin:
+                    return ''
+            stop = begin
+            for _ in range(end - start + 1):
+                stop = mm.find(b'\n', stop) + 1
+                if not stop:
+                    stop = len(mm)
+                    break
+            return mm[begin:stop].decode('utf-8', errors='ignore').replace('\r\n', '\n').rstrip('\n')
+    except (OSError, ValueError):
+        return ''
+
+
+class SQLiteCacheStore:
+    """Armazenamento transacional do cache (SQLite em modo WAL)
+    
+    Cada set() vira um upsert de uma única chave. Escritas agrupadas com
+    batch() são gravadas num único commit. O WAL garante que um crash no
+    meio de uma escrita nunca corrompe as entradas já confirmadas.
+    """
+    
+    def __init__(self, db_path: Path):
+        self.db_path = db_path
+        self.lock = threading.RLock()
+        self._batch_depth = 0
+        try:
+            self.conn = self._connect()
+        except sqlite3.DatabaseError:
+            # Banco corrompido: preservar para análise e recomeçar do zero
+            corrupt = db_path.with_name(f"{db_path.name}.corrupt-{int(time.time())}")
+            db_path.rename(corrupt)
+            print(f"⚠️  Cache corrompido movido para {corrupt}")
+            self.conn = self._connect()
+    
+    def _connect(self) -> sqlite3.Connection:
+        """Abre conexão em autocommit com WAL"""
+        conn = sqlite3.connect(str(self.db_path), check_same_thread=False, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS cache ('
+            'key TEXT PRIMARY KEY, data TEXT NOT NULL, timestamp REAL NOT NULL)'
+        )
+        return conn
+    
+    @contextmanager
+    def batch(self):
+        """Agrupa várias escritas numa única transação"""
+        with self.lock:
+            if self._batch_depth == 0:
+                self.conn.execute('BEGIN')
+            self._batch_depth += 1
+            try:
+                yield self
+            except BaseException:
+                self._batch_depth -= 1
+                if self._batch_depth == 0:
+                    self.conn.execute('ROLLBACK')
+                raise
+            else:
+                self._batch_depth -= 1
+                if self._batch_depth == 0:
+                    self.conn.execute('COMMIT')
+    
+    def load_all(self, resident: Callable[[str], bool] = lambda key: True) -> Dict[str, Dict]:
+        """Carrega todas as entradas válidas (mais antigas primeiro)
+        
+        Só as chaves aceitas por 'resident' têm o valor decodificado; as
+        demais voltam apenas com timestamp e tamanho (ver fetch()).
+        """
+        entries = {}
+        with self.lock:
+            rows = self.conn.execute(
+                'SELECT key, data, timestamp FROM cache ORDER BY timestamp'
+            ).fetchall()
+        for key, data, timestamp in rows:
+            if not resident(key):
+                entries[key] = {'timestamp': timestamp, 'size': len(data)}
+                continue
+            try:
+                entries[key] = {'data': json.loads(data), 'timestamp': timestamp, 'size': len(data)}
+            except ValueError:
+                # Entrada ilegível: ignorar sem perder o restante do cache
+                continue
+        return entries
+    
+    def fetch(self, key: str) -> Optional[Any]:
+        """Lê e decodifica o valor de uma chave (None se ausente ou ilegível)"""
+        with self.lock:
+            row = self.conn.execute('SELECT data FROM cache WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        try:
+            return json.loads(row[0])
+        except ValueError:
+            return None
+    
+    def upsert(self, key: str, entry: Dict) -> int:
+        """Insere ou atualiza uma única chave, retornando o tamanho serializado"""
+        data = json.dumps(entry['data'], default=_json_default, separators=(',', ':'))
+        with self.lock:
+            self.conn.execute(
+                'INSERT INTO cache (key, data, timestamp) VALUES (?, ?, ?) '
+                'ON CONFLICT(key) DO UPDATE SET data = excluded.data, timestamp = excluded.timestamp',
+                (key, data, entry['timestamp'])
+            )
+        return len(data)
+    
+    def delete(self, key: str):
+        """Remove uma chave"""
+        with self.lock:
+            self.conn.execute('DELETE FROM cache WHERE key = ?', (key,))
+    
+    def delete_many(self, keys: List[str]):
+        """Remove várias chaves numa única transação"""
+        if not keys:
+            return
+        with self.batch():
+            self.conn.executemany('DELETE FROM cache WHERE key = ?', [(key,) for key in keys])
+    
+    def clear(self):
+        """Remove todas as chaves"""
+        with self.lock:
+            self.conn.execute('DELETE FROM cache')
+    
+    def is_empty(self) -> bool:
+        """Indica se o banco ainda não tem nenhuma entrada"""
+        with self.lock:
+            return self.conn.execute('SELECT 1 FROM cache LIMIT 1').fetchone() is None
+    
+    def close(self):
+        """Fecha a conexão"""
+        with self.lock:
+            self.conn.close()
+
+
+# Limites padrão por namespace (prefixo da chave). 'ttl' None = nunca expira.
+# 'resident' False: só metadados ficam em memória e o valor é lido do banco no get()
+DEFAULT_CACHE_NAMESPACES = {
+    'request_': {'max_entries': 500, 'max_bytes': 20 * 1024 * 1024, 'ttl': 86400},
+    'full_system_analysis': {'max_entries': 1, 'ttl': 86400},
+    'analysis_': {'max_entries': 2000, 'max_bytes': 30 * 1024 * 1024, 'ttl': None, 'resident': False},
+}
 
 
 class ContextCache:
-    """Cache inteligente de contexto"""
+    """Cache inteligente de contexto
+    
+    Limitado por número de entradas e bytes (global e por namespace), com
+    despejo LRU e varredura periódica de entradas expiradas em background.
+    Namespaces não residentes (análises de arquivos) guardam em memória só
+    timestamp e tamanho; o valor é lido do banco a cada acesso.
+    """
     
-    def __init__(self, cache_dir: Path):
+    def __init__(self, cache_dir: Path, max_entries: int = 5000,
+                 max_bytes: int = 50 * 1024 * 1024, ttl: Optional[float] = 86400,
+                 namespaces: Optional[Dict[str, Dict]] = None, sweep_interval: float = 300):
         self.cache_dir = cache_dir
         self.cache_dir.mkdir(parents=True, exist_ok=True)
-        self.memory = {}
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.namespaces = {
+            ns: {**DEFAULT_CACHE_NAMESPACES.get(ns, {}), **limits}
+            for ns, limits in {**DEFAULT_CACHE_NAMESPACES, **(namespaces or {})}.items()
+        }
+        # Prefixos mais longos primeiro para resolver o namespace mais específico
+        self._prefixes = sorted(self.namespaces, key=len, reverse=True)
+        self.memory: 'OrderedDict[str, Dict]' = OrderedDict()  # ordem = LRU global
+        self._ns_lru: Dict[str, OrderedDict] = {}
+        self._ns_bytes: Dict[str, int] = {}
+        self.total_bytes = 0
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'expirations': 0}
+        self.lock = threading.RLock()
+        self.store = SQLiteCacheStore(self.cache_dir / 'context_cache.db')
         self.load_cache()
+        
+        self._stop_sweeper = threading.Event()
+        self._sweeper = None
+        if sweep_interval:
+            self._sweeper = threading.Thread(
+                target=self._sweep_loop, args=(sweep_interval,), daemon=True
+            )
+            self._sweeper.start()
     
     def load_cache(self):
-        """Carrega cache do disco"""
-        cache_file = self.cache_dir / 'context_cache.json'
-        if cache_file.exists():
-            try:
-                with open(cache_file) as f:
-                    self.memory = json.load(f)
-            except:
-                self.memory = {}
+        """Carrega cache do disco (migrando o JSON legado uma única vez)"""
+        legacy_file = self.cache_dir / 'context_cache.json'
+        if legacy_file.exists():
+            self._migrate_legacy_json(legacy_file)
+        
+        with self.lock:
+            self.memory.clear()
+            self._ns_lru.clear()
+            self._ns_bytes.clear()
+            self.total_bytes = 0
+            expired = []
+            for key, entry in self.store.load_all(self._resident).items():
+                if self._is_expired(key, entry):
+                    expired.append(key)
+                else:
+                    self._track(key, entry)
+            self.store.delete_many(expired)
+            self._enforce_limits()
+    
+    def _migrate_legacy_json(self, legacy_file: Path):
+        """Importa o context_cache.json antigo para o banco"""
+        try:
+            with open(legacy_file) as f:
+                legacy = json.load(f)
+        except (OSError, ValueError):
+            legacy = {}
+        
+        if legacy and self.store.is_empty():
+            with self.store.batch():
+                for key, entry in legacy.items():
+                    if isinstance(entry, dict) and 'timestamp' in entry:
+                        self.store.upsert(key, entry)
+            print(f"💾 Cache migrado: {len(legacy)} entradas de {legacy_file.name}")
+        
+        legacy_file.rename(legacy_file.with_name(legacy_file.name + '.migrated'))
+    
+    def _namespace(self, key: str) -> str:
+        """Namespace de uma chave ('' = namespace padrão)"""
+        for prefix in self._prefixes:
+            if key.startswith(prefix):
+                return prefix
+        return ''
+    
+    def _resident(self, key: str) -> bool:
+        """Indica se o valor da chave fica em memória"""
+        return self.namespaces.get(self._namespace(key), {}).get('resident', True)
+    
+    def _ttl_for(self, key: str) -> Optional[float]:
+        """TTL efetivo de uma chave"""
+        return self.namespaces.get(self._namespace(key), {}).get('ttl', self.ttl)
+    
+    def _is_expired(self, key: str, entry: Dict) -> bool:
+        """Verifica se a entrada passou do TTL"""
+        ttl = self._ttl_for(key)
+        return ttl is not None and time.time() - entry.get('timestamp', 0) >= ttl
     
-    def save_cache(self):
-        """Salva cache no disco"""
-        cache_file = self.cache_dir / 'context_cache.json'
-        with open(cache_file, 'w') as f:
-            json.dump(self.memory, indent=2, fp=f)
+    def _track(self, key: str, entry: Dict):
+        """Registra entrada nas estruturas LRU"""
+        ns = self._namespace(key)
+        size = entry.get('size', 0)
+        self.memory[key] = entry
+        self._ns_lru.setdefault(ns, OrderedDict())[key] = size
+        self._ns_bytes[ns] = self._ns_bytes.get(ns, 0) + size
+        self.total_bytes += size
+    
+    def _untrack(self, key: str) -> Optional[Dict]:
+        """Remove entrada das estruturas LRU"""
+        entry = self.memory.pop(key, None)
+        if entry is not None:
+            ns = self._namespace(key)
+            size = entry.get('size', 0)
+            self._ns_lru[ns].pop(key, None)
+            self._ns_bytes[ns] -= size
+            self.total_bytes -= size
+        return entry
+    
+    def _enforce_limits(self, namespace: Optional[str] = None):
+        """Despeja entradas menos usadas até respeitar os limites"""
+        evicted = []
+        namespaces = [namespace] if namespace is not None else list(self._ns_lru)
+        
+        for ns in namespaces:
+            limits = self.namespaces.get(ns, {})
+            lru = self._ns_lru.get(ns)
+            if not lru:
+                continue
+            max_entries = limits.get('max_entries')
+            max_bytes = limits.get('max_bytes')
+            while lru and (
+                (max_entries is not None and len(lru) > max_entries) or
+                (max_bytes is not None and self._ns_bytes[ns] > max_bytes)
+            ):
+                key = next(iter(lru))
+                self._untrack(key)
+                evicted.append(key)
+        
+        while self.memory and (len(self.memory) > self.max_entries or self.total_bytes > self.max_bytes):
+            key = next(iter(self.memory))
+            self._untrack(key)
+            evicted.append(key)
+        
+        if evicted:
+            self.stats['evictions'] += len(evicted)
+            self.store.delete_many(evicted)
+    
+    @contextmanager
+    def batch(self):
+        """Agrupa várias chamadas a set() num único commit"""
+        with self.lock, self.store.batch():
+            yield self
     
     def get(self, key: str) -> Optional[Any]:
         """Obtém valor do cache"""
-        entry = self.memory.get(key)
-        if entry:
-            # Verificar se cache ainda é válido (24h)
-            timestamp = entry.get('timestamp', 0)
-            if time.time() - timestamp < 86400:  # 24 horas
-                return entry.get('data')
-        return None
+        with self.lock:
+            entry = self.memory.get(key)
+            if entry is None:
+                self.stats['misses'] += 1
+                return None
+            
+            if self._is_expired(key, entry):
+                self._untrack(key)
+                self.store.delete(key)
+                self.stats['expirations'] += 1
+                self.stats['misses'] += 1
+                return None
+            
+            if 'data' in entry:
+                data = entry['data']
+            else:
+                data = self.store.fetch(key)
+                if data is None:
+                    self._untrack(key)
+                    self.stats['misses'] += 1
+                    return None
+            
+            # Marcar como usado recentemente
+            self.memory.move_to_end(key)
+            self._ns_lru[self._namespace(key)].move_to_end(key)
+            self.stats['hits'] += 1
+            return data
     
     def set(self, key: str, value: Any):
         """Define valor no cache"""
-        self.memory[key] = {
+        entry = {
             'data': value,
             'timestamp': time.time()
         }
-        self.save_cache()
+        with self.lock:
+            entry['size'] = self.store.upsert(key, entry)
+            if not self._resident(key):
+                del entry['data']
+            self._untrack(key)
+            self._track(key, entry)
+            self._enforce_limits(self._namespace(key))
+    
+    def delete(self, key: str):
+        """Remove valor do cache"""
+        with self.lock:
+            self._untrack(key)
+            self.store.delete(key)
+    
+    def clear(self):
+        """Limpa todo o cache (memória e disco)"""
+        with self.lock:
+            self.memory.clear()
+            self._ns_lru.clear()
+            self._ns_bytes.clear()
+            self.total_bytes = 0
+            self.store.clear()
+    
+    def sweep_expired(self) -> int:
+        """Remove proativamente todas as entradas expiradas"""
+        with self.lock:
+            expired = [key for key, entry in self.memory.items() if self._is_expired(key, entry)]
+            for key in expired:
+                self._untrack(key)
+            self.store.delete_many(expired)
+            self.stats['expirations'] += len(expired)
+        return len(expired)
+    
+    def _sweep_loop(self, interval: float):
+        """Thread de varredura periódica"""
+        while not self._stop_sweeper.wait(interval):
+            try:
+                self.sweep_expired()
+            except sqlite3.Error as e:
+                print(f"⚠️  Erro na limpeza do cache: {e}")
+    
+    def usage(self) -> Dict:
+        """Resumo de ocupação do cache"""
+        with self.lock:
+            return {
+                'entries': len(self.memory),
+                'bytes': self.total_bytes,
+                'namespaces': {ns or '*': len(lru) for ns, lru in self._ns_lru.items() if lru},
+                **self.stats
+            }
+    
+    def close(self):
+        """Para a varredura e fecha o banco"""
+        self._stop_sweeper.set()
+        self.store.close()
 
 
-class AIValidator:
-    """Sistema de validação inteligente em múltiplas camadas"""
+# Prioridade de cada etapa na disputa pela cota (menor = mais urgente)
+STAGE_PRIORITIES = {
+    'chat': 0,
+    'intent': 0,
+    'plan': 0,
+    'deep_read': 1,
+    'chunk_summary': 1,
+    'code_validation': 2,
+    'plan_validation': 2,
+    'alternatives': 3,
+}
+
+
+class PriorityRateLimiter:
+    """Token bucket compartilhado com fila por prioridade
     
-    def __init__(self, model):
-        self.model = model
+    Quando há disputa pela cota, o próximo token vai sempre para o chamador
+    de menor prioridade numérica (ordem de chegada como desempate).
+    """
     
-    def validate_code_change(self, file_path: str, old_code: str, new_code: str) -> ValidationResult:
-        """Valida mudança de código com análise profunda"""
-        
-        risks = []
-        suggestions = []
-        dependencies = []
-        
-        # Camada 1: Análise sintática
-        if file_path.endswith(('.py', '.js', '.jsx', '.ts', '.tsx')):
-            syntax_valid = self._check_syntax(file_path, new_code)
-            if not syntax_valid:
-                risks.append("Erro de sintaxe detectado")
-                return ValidationResult(
-                    valid=False,
-                    security_level=SecurityLevel.HIGH,
-                    risks=risks
-                )
-        
-        # Camada 2: Análise de segurança
-        security_issues = self._analyze_security(new_code)
-        if security_issues:
-            risks.extend(security_issues)
-        
-        # Camada 3: Análise de dependências
-        deps = self._extract_dependencies(new_code)
-        dependencies.extend(deps)
-        
-        # Camada 4: Análise de impacto
-        impact = self._analyze_impact(old_code, new_code)
-        
-        # Camada 5: Validação por IA
-        ai_validation = self._ai_deep_validation(file_path, old_code, new_code)
-        
-        # Determinar nível de segurança
-        security_level = self._calculate_security_level(risks, impact, ai_validation)
-        
-        return ValidationResult(
-            valid=len(risks) == 0 or security_level != SecurityLevel.CRITICAL,
-            security_level=security_level,
-            risks=risks,
-            suggestions=suggestions,
-            estimated_impact=impact,
-            dependencies=dependencies,
-            tests_required=impact in ['medium', 'high'],
-            rollback_plan=self._generate_rollback_plan(file_path)
-        )
+    def __init__(self, requests_per_minute: float, burst: int):
+        self.rate = requests_per_minute / 60.0
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.cond = threading.Condition()
+        self.waiting: List[Tuple[int, int]] = []
+        self._seq = itertools.count()
     
-    def _check_syntax(self, file_path: str, code: str) -> bool:
-        """Verifica sintaxe do código"""
-        try:
-            if file_path.endswith('.py'):
-                ast.parse(code)
-            elif file_path.endswith(('.js', '.jsx', '.ts', '.tsx')):
-                # Verificação básica de brackets
-                if code.count('{') != code.count('}'):
-                    return False
-                if code.count('(') != code.count(')'):
-                    return False
-                if code.count('[') != code.count(']'):
-                    return False
-            return True
-        except:
-            return False
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
     
-    def _analyze_security(self, code: str) -> List[str]:
-        """Analisa questões de segurança"""
-        issues = []
-        
-        # Padrões perigosos
-        dangerous_patterns = [
-            (r'eval\s*\(', "Uso de eval() detectado - PERIGOSO"),
-            (r'exec\s*\(', "Uso de exec() detectado - PERIGOSO"),
-            (r'__import__\s*\(', "Import dinâmico detectado"),
-            (r'subprocess\.call\s*\(.*shell\s*=\s*True', "Shell=True em subprocess - RISCO"),
-            (r'password\s*=\s*["\'].*["\']', "Senha em texto plano detectada"),
-            (r'api[_-]?key\s*=\s*["\'].*["\']', "API key em texto plano detectada"),
-        ]
-        
-        for pattern, message in dangerous_patterns:
-            if re.search(pattern, code, re.IGNORECASE):
-                issues.append(message)
-        
-        return issues
+    def acquire(self, priority: int = 0, deadline: Optional[float] = None) -> bool:
+        """Aguarda um token; retorna False se o prazo (monotonic) acabar antes"""
+        ticket = (priority, next(self._seq))
+        with self.cond:
+            heapq.heappush(self.waiting, ticket)
+            try:
+                while True:
+                    self._refill()
+                    if self.waiting[0] == ticket and self.tokens >= 1:
+                        self.tokens -= 1
+                        return True
+                    
+                    now = time.monotonic()
+                    if deadline is not None and now >= deadline:
+                        return False
+                    
+                    # O primeiro da fila dorme até o próximo token; os demais até serem notificados
+                    timeout = (1 - self.tokens) / self.rate if self.waiting[0] == ticket else 1.0
+                    if deadline is not None:
+                        timeout = min(timeout, deadline - now)
+                    self.cond.wait(max(timeout, 0.001))
+            finally:
+                self.waiting.remove(ticket)
+                heapq.heapify(self.waiting)
+                self.cond.notify_all()
+
+
+@dataclass
+class RetryPolicy:
+    """Política de novas tentativas para erros transitórios do LLM"""
+    max_retries: int = 4
+    backoff_base: float = 1.0
+    backoff_max: float = 30.0
+    call_deadline: float = 90.0  # prazo total da chamada, incluindo esperas
     
-    def _extract_dependencies(self, code: str) -> List[str]:
-        """Extrai dependências do código"""
-        deps = []
-        
-        # Python imports
-        for match in re.finditer(r'^import\s+(\S+)', code, re.MULTILINE):
-            deps.append(match.group(1))
-        for match in re.finditer(r'^from\s+(\S+)\s+import', code, re.MULTILINE):
-            deps.append(match.group(1))
-        
-        # JavaScript/TypeScript imports
-        for match in re.finditer(r'import\s+.*?\s+from\s+["\'](.+?)["\']', code):
-            deps.append(match.group(1))
-        
-        return list(set(deps))
+    def backoff(self, attempt: int) -> float:
+        """Espera exponencial com jitter completo"""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+
+def is_retryable_error(error: Exception) -> bool:
+    """Indica se o erro é transitório (cota, sobrecarga, timeout)"""
+    if isinstance(error, TimeoutError):
+        return True
+    name = type(error).__name__
+    if name in ('ResourceExhausted', 'TooManyRequests', 'ServiceUnavailable',
+                'DeadlineExceeded', 'InternalServerError', 'GatewayTimeout'):
+        return True
+    text = str(error).lower()
+    return any(marker in text for marker in ('429', '503', 'quota', 'rate limit', 'timed out', 'timeout'))
+
+
+@dataclass
+class LLMResponse:
+    """Resposta (ou trecho de resposta em streaming) de um backend"""
+    text: str
+
+
+class LLMBackend:
+    """Interface comum para todas as chamadas generate_content
     
-    def _analyze_impact(self, old_code: str, new_code: str) -> str:
-        """Analisa impacto da mudança"""
-        
-        # Calcular diferença
-        old_lines = old_code.split('\n')
-        new_lines = new_code.split('\n')
-        
-        lines_added = len(new_lines) - len(old_lines)
-        lines_changed = sum(1 for old, new in zip(old_lines, new_lines) if old != new)
+    'stage' identifica a etapa do pipeline que faz a chamada (intent, plan,
+    deep_read, ...). Backends reais podem ignorá-lo; o backend local usa para
+    escolher a resposta simulada.
+    """
+    
+    name = 'base'
+    
+    def __init__(self):
+        self.calls = 0
+        self.retries = 0
+        self.calls_lock = threading.Lock()
+        self.limiter: Optional[PriorityRateLimiter] = None
+        self.retry_policy = RetryPolicy()
+    
+    def generate_content(self, prompt: str, generation_config: Optional[Dict] = None,
+                         stream: bool = False, stage: str = 'generic'):
+        """Gera conteúdo; com stream=True retorna um iterável de trechos
         
-        total_change = abs(lines_added) + lines_changed
+        Cada tentativa consome um token do limitador (com a prioridade da
+        etapa). Erros transitórios são repetidos com backoff exponencial até
+        o prazo total da chamada.
+        """
+        policy = self.retry_policy
+        deadline = time.monotonic() + policy.call_deadline
+        priority = STAGE_PRIORITIES.get(stage, 2)
+        attempt = 0
         
-        if total_change < 5:
-            return "low"
-        elif total_change < 20:
-            return "medium"
-        else:
-            return "high"
+        while True:
+            if self.limiter and not self.limiter.acquire(priority, deadline):
+                raise TimeoutError(f"Prazo esgotado aguardando cota do LLM ({stage})")
+            
+            with self.calls_lock:
+                self.calls += 1
+            try:
+                return self._generate(prompt, generation_config, stream, stage,
+                                      timeout=max(1.0, deadline - time.monotonic()))
+            except Exception as e:
+                delay = policy.backoff(attempt)
+                if (not is_retryable_error(e) or attempt >= policy.max_retries or
+                        time.monotonic() + delay >= deadline):
+                    raise
+                attempt += 1
+                with self.calls_lock:
+                    self.retries += 1
+                print(f"   ⏳ {stage}: {type(e).__name__}, nova tentativa em {delay:.1f}s "
+                      f"({attempt}/{policy.max_retries})")
+                time.sleep(delay)
     
-    def _ai_deep_validation(self, file_path: str, old_code: str, new_code: str) -> Dict:
-        """Validação profunda usando IA"""
-        
-        prompt = f"""Analise esta mudança de código como um especialista em segurança:
+    def _generate(self, prompt: str, generation_config: Optional[Dict], stream: bool,
+                  stage: str, timeout: float):
+        raise NotImplementedError
 
-ARQUIVO: {file_path}
 
-CÓDIGO ANTIGO (primeiras 50 linhas):
-{chr(10).join(old_code.split(chr(10))[:50])}
+class GeminiBackend(LLMBackend):
+    """Backend Google Gemini (google-generativeai)"""
+    
+    name = 'gemini'
+    
+    def __init__(self, model_name: str):
+        super().__init__()
+        self.model_name = model_name
+        self.model = genai.GenerativeModel(model_name)
+    
+    def _generate(self, prompt, generation_config, stream, stage, timeout):
+        return self.model.generate_content(
+            prompt,
+            generation_config=generation_config,
+            stream=stream,
+            request_options={'timeout': timeout}
+        )
 
-CÓDIGO NOVO (primeiras 50 linhas):
-{chr(10).join(new_code.split(chr(10))[:50])}
 
-Analise:
-1. Potenciais bugs
-2. Problemas de segurança
-3. Impacto em performance
-4. Quebra de compatibilidade
-5. Boas práticas violadas
+# Respostas simuladas do backend local, por etapa do pipeline
+DEFAULT_LOCAL_RESPONSES = {
+    'intent': {
+        'type': 'edit',
+        'target': 'arquivo mencionado',
+        'reasoning': 'Intenção simulada pelo backend local',
+        'confidence': 0.9,
+        'requires_files': [],
+        'action_verb': 'editar'
+    },
+    'deep_read': {
+        'purpose': 'Análise simulada pelo backend local',
+        'main_components': [],
+        'key_functions': [],
+        'state_management': 'n/a',
+        'dependencies': [],
+        'complexity_level': 'low',
+        'safe_edit_zones': ['final do arquivo'],
+        'danger_zones': [],
+        'recommendations': ['Criar backup antes de editar'],
+        'understanding_score': 0.9
+    },
+    'plan': {
+        'steps': [
+            {'order': 1, 'action': 'Criar backup do arquivo', 'type': 'backup', 'files': [],
+             'reasoning': 'Permitir rollback', 'safe_zone': '', 'reversible': True, 'risk_level': 'low'},
+            {'order': 2, 'action': 'Aplicar a mudança na zona segura', 'type': 'edit', 'files': [],
+             'reasoning': 'Mudança solicitada', 'safe_zone': 'final do arquivo', 'reversible': True,
+             'risk_level': 'low'},
+            {'order': 3, 'action': 'Validar sintaxe e testar', 'type': 'test', 'files': [],
+             'reasoning': 'Garantir que nada quebrou', 'safe_zone': '', 'reversible': True,
+             'risk_level': 'low'}
+        ],
+        'estimated_time': '1 minuto',
+        'dependencies': [],
+        'rollback_strategy': 'Restaurar backup',
+        'impact_assessment': 'Baixo',
+        'confidence': 0.9
+    },
+    'chunk_summary': {
+        'summary': 'Bloco resumido pelo backend local',
+        'symbols': [],
+        'state': 'n/a',
+        'dependencies': [],
+        'danger_zones': [],
+        'safe_edit_zones': []
+    },
+    'plan_validation': {'safe': True, 'risks': [], 'missing_steps': [], 'recommendation': 'approve'},
+    'code_validation': {
+        'bugs_potential': [],
+        'security_issues': [],
+        'performance_impact': 'none',
+        'breaking_changes': False,
+        'best_practices_violated': [],
+        'recommendation': 'approve',
+        'confidence': 0.9
+    },
+    'alternatives': 'Aplicar a mudança via tema/override\nTestar antes em ambiente de staging',
+    'chat': 'Olá! Sou a PTERO-AI Ultra Pro (backend local). Como posso ajudar?',
+}
 
-Responda em JSON:
-{{
-  "bugs_potential": [],
-  "security_issues": [],
-  "performance_impact": "none|low|medium|high",
-  "breaking_changes": bool,
-  "best_practices_violated": [],
-  "recommendation": "approve|review|reject",
-  "confidence": 0.0-1.0
-}}
-"""
-        
-        try:
-            response = self.model.generate_content(prompt)
-            text = response.text
-            
-            # Extrair JSON
-            start = text.find('{')
-            end = text.rfind('}') + 1
-            
-            if start >= 0 and end > start:
-                return json.loads(text[start:end])
-        except:
-            pass
-        
-        return {
-            "recommendation": "review",
-            "confidence": 0.5
-        }
+
+class LocalBackend(LLMBackend):
+    """Backend local determinístico, sem rede
     
-    def _calculate_security_level(self, risks: List[str], impact: str, ai_validation: Dict) -> SecurityLevel:
-        """Calcula nível de segurança geral"""
-        
-        # Score system
-        score = 0
-        
-        # Riscos críticos
-        critical_keywords = ['PERIGOSO', 'CRÍTICO', 'senha', 'password', 'api key']
-        for risk in risks:
-            if any(kw in risk for kw in critical_keywords):
-                score += 10
-            else:
-                score += 2
+    Responde com JSON pré-definido por etapa após uma latência configurável
+    (com jitter determinístico derivado do prompt). Permite medir vazão,
+    eficiência de cache e latência de cauda do pipeline numa máquina isolada.
+    """
+    
+    name = 'local'
+    
+    def __init__(self, latency_ms: float = 0, jitter_ms: float = 0,
+                 responses: Optional[Dict[str, Any]] = None, failure_every: int = 0):
+        super().__init__()
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.responses = {**DEFAULT_LOCAL_RESPONSES, **(responses or {})}
+        # Simula um erro 429 a cada N chamadas (0 = nunca) para testar retries
+        self.failure_every = failure_every
+    
+    @classmethod
+    def from_config(cls, config: Dict) -> 'LocalBackend':
+        """Cria o backend a partir da seção 'local_backend' da configuração"""
+        responses = None
+        if config.get('responses_file'):
+            with open(config['responses_file']) as f:
+                responses = json.load(f)
+        return cls(config.get('latency_ms', 0), config.get('jitter_ms', 0), responses,
+                   config.get('failure_every', 0))
+    
+    def _generate(self, prompt, generation_config, stream, stage, timeout):
+        delay = self.latency_ms
+        if self.jitter_ms:
+            delay += (zlib.crc32(prompt.encode('utf-8')) % 1000) / 1000 * self.jitter_ms
+        time.sleep(min(delay / 1000, timeout))
         
-        # Impacto
-        impact_scores = {'low': 0, 'medium': 3, 'high': 6}
-        score += impact_scores.get(impact, 0)
+        if self.failure_every and self.calls % self.failure_every == 0:
+            raise RuntimeError("429 Resource has been exhausted (simulado pelo backend local)")
         
-        # Recomendação da IA
-        ai_rec = ai_validation.get('recommendation', 'review')
-        if ai_rec == 'reject':
-            score += 8
-        elif ai_rec == 'review':
-            score += 3
+        canned = self.responses.get(stage, self.responses['chat'])
+        text = canned if isinstance(canned, str) else json.dumps(canned, ensure_ascii=False)
         
-        # Converter score em nível
-        if score >= 15:
-            return SecurityLevel.CRITICAL
-        elif score >= 10:
-            return SecurityLevel.HIGH
-        elif score >= 5:
-            return SecurityLevel.MEDIUM
-        elif score >= 2:
-            return SecurityLevel.LOW_RISK
-        else:
-            return SecurityLevel.SAFE
-    
-    def _generate_rollback_plan(self, file_path: str) -> str:
-        """Gera plano de rollback"""
-        return f"Restaurar {file_path} do backup mais recente usando comando 'restore'"
+        if stream:
+            return iter([LLMResponse(text[i:i + 32]) for i in range(0, len(text), 32)])
+        return LLMResponse(text)
 
 
-class CodeAnalyzer:
-    """Analisador profundo de código - LÊ e ENTENDE completamente"""
-    
-    def __init__(self, model):
-        self.model = model
-    
-    def deep_analyze_file(self, file_path: str) -> Dict:
+# Schemas de saída estruturada por etapa (subconjunto de JSON Schema)
+STAGE_SCHEMAS = {
+    'intent': {
+        'type': 'object',
+        'properties': {
+            'type': {'type': 'string'},
+            'target': {'type': 'string'},
+            'reasoning': {'type': 'string'},
+            'confidence': {'type': 'number'},
+            'requires_files': {'type': 'array'},
+            'action_verb': {'type': 'string'}
+        },
+        'required': ['type', 'reasoning', 'confidence']
+    },
+    'deep_read': {
+        'type': 'object',
+        'properties': {
+            'purpose': {'type': 'string'},
+            'main_components': {'type': 'array'},
+            'key_functions': {'type': 'array'},
+            'state_management': {'type': 'string'},
+            'dependencies': {'type': 'array'},
+            'complexity_level': {'type': 'string'},
+            'safe_edit_zones': {'type': 'array'},
+            'danger_zones': {'type': 'array'},
+            'recommendations': {'type': 'array'},
+            'understanding_score': {'type': 'number'}
+        },
+        'required': ['purpose', 'complexity_level', 'safe_edit_zones', 'danger_zones',
+                     'recommendations', 'understanding_score']
+    },
+    'chunk_summary': {
+        'type': 'object',
+        'properties': {
+            'summary': {'type': 'string'},
+            'symbols': {'type': 'array'},
+            'state': {'type': 'string'},
+            'dependencies': {'type': 'array'},
+            'danger_zones': {'type': 'array'},
+            'safe_edit_zones': {'type': 'array'}
+        },
+        'required': ['summary']
+    },
+    'plan': {
+        'type': 'object',
+        'properties': {
+            'steps': {'type': 'array'},
+            'estimated_time': {'type': 'string'},
+            'dependencies': {'type': 'array'},
+            'rollback_strategy': {'type': 'string'},
+            'impact_assessment': {'type': 'string'},
+            'confidence': {'type': 'number'}
+        },
+        'required': ['steps']
+    },
+    'plan_validation': {
+        'type': 'object',
+        'properties': {
+            'safe': {'type': 'boolean'},
+            'risks': {'type': 'array'},
+            'missing_steps': {'type': 'array'},
+            'recommendation': {'type': 'string'}
+        },
+        'required': ['risks', 'recommendation']
+    },
+    'code_validation': {
+        'type': 'object',
+        'properties': {
+            'bugs_potential': {'type': 'array'},
+            'security_issues': {'type': 'array'},
+            'performance_impact': {'type': 'string'},
+            'breaking_changes': {'type': 'boolean'},
+            'best_practices_violated': {'type': 'array'},
+            'recommendation': {'type': 'string'},
+            'confidence': {'type': 'number'}
+        },
+        'required': ['recommendation', 'confidence']
+    },
+}
+
+_SCHEMA_TYPES = {
+    'string': str,
+    'number': (int, float),
+    'integer': int,
+    'boolean': bool,
+    'array': list,
+    'object': dict,
+}
+
+structured_output_stats = {'calls': 0, 'repaired': 0, 'reasked': 0, 'failed': 0}
+_structured_stats_lock = threading.Lock()
+
+
+def _count_structured(key: str):
+    with _structured_stats_lock:
+        structured_output_stats[key] += 1
+
+
+def _close_json(text: str) -> str:
+    """Remove vírgulas finais e fecha strings/colchetes deixados abertos"""
+    out = []
+    stack = []
+    in_string = escape = False
+    
+    for ch in text:
+        if in_string:
+            out.append(ch)
+            if escape:
+                escape = False
+            elif ch == '\\':
+                escape = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+            out.append(ch)
+        elif ch in '{[':
+            stack.append('}' if ch == '{' else ']')
+            out.append(ch)
+        elif ch in '}]':
+            # Vírgula final antes do fechamento: {"a": 1,}
+            while out and out[-1].isspace():
+                out.pop()
+            if out and out[-1] == ',':
+                out.pop()
+            if stack:
+                stack.pop()
+            out.append(ch)
+        else:
+            out.append(ch)
+    
+    if in_string:
+        if escape:
+            out.pop()
+        out.append('"')
+    
+    result = ''.join(out).rstrip()
+    if result.endswith(','):
+        result = result[:-1]
+    if result.endswith(':'):
+        result += ' null'
+    return result + ''.join(reversed(stack))
+
+
+def _extract_json(text: str) -> Optional[Any]:
+    """Primeiro objeto JSON válido do texto (sem reparos)"""
+    start = text.find('{')
+    if start < 0:
+        return None
+    try:
+        return json.JSONDecoder().raw_decode(text, start)[0]
+    except ValueError:
+        return None
+
+
+def repair_json(text: str) -> Optional[Any]:
+    """Extrai um objeto JSON de uma resposta, reparando defeitos comuns
+    
+    Trata blocos ```json, texto ao redor, vírgulas finais e respostas
+    truncadas (strings e colchetes não fechados). Retorna None se nada
+    aproveitável for encontrado.
+    """
+    if not text:
+        return None
+    
+    fence = re.search(r'```(?:json)?\s*(.*?)(?:```|$)', text, re.DOTALL)
+    if fence and '{' in fence.group(1):
+        text = fence.group(1)
+    
+    data = _extract_json(text)
+    if data is not None:
+        return data
+    
+    start = text.find('{')
+    if start < 0:
+        return None
+    candidate = text[start:]
+    
+    # Resposta truncada: fechar o que ficou aberto, recuando até a última vírgula se preciso
+    for _ in range(8):
+        try:
+            return json.loads(_close_json(candidate))
+        except ValueError:
+            cut = candidate.rfind(',')
+            if cut <= 0:
+                return None
+            candidate = candidate[:cut]
+    return None
+
+
+def schema_errors(data: Dict, schema: Dict) -> List[str]:
+    """Campos obrigatórios ausentes ou com tipo errado"""
+    invalid = []
+    for name, spec in schema.get('properties', {}).items():
+        if name not in data:
+            if name in schema.get('required', []):
+                invalid.append(name)
+            continue
+        expected = _SCHEMA_TYPES.get(spec.get('type'))
+        value = data[name]
+        wrong_type = expected and (not isinstance(value, expected) or
+                                   (spec.get('type') in ('number', 'integer') and isinstance(value, bool)))
+        if wrong_type:
+            invalid.append(name)
+    return invalid
+
+
+# Campos que são a própria decisão da etapa: nunca re-perguntados isoladamente
+DECISION_FIELDS = {'steps', 'recommendation', 'confidence'}
+
+# Tamanho do contexto da tarefa reenviado numa re-pergunta (início e fim do prompt)
+REASK_CONTEXT_CHARS = 3000
+
+
+def _compact_prompt(prompt: str, limit: int = REASK_CONTEXT_CHARS) -> str:
+    """Versão resumida do prompt: começo (tarefa) e fim (formato), sem o miolo"""
+    if len(prompt) <= limit:
+        return prompt
+    head = limit * 2 // 3
+    return f"{prompt[:head]}\n[...]\n{prompt[-(limit - head):]}"
+
+
+def generate_structured(model: 'LLMBackend', prompt: str, stage: str,
+                        generation_config: Optional[Dict] = None) -> Optional[Dict]:
+    """Chamada ao LLM com saída JSON validada contra o schema da etapa
+    
+    Pede JSON mode ao modelo e repara localmente a resposta. Se faltarem
+    campos obrigatórios descritivos, faz uma nova pergunta com o JSON parcial
+    e uma versão resumida da tarefa original. Campos de decisão (passos,
+    recomendação, confiança) não são re-perguntados: a chamada falha e o
+    chamador usa o seu fallback. Se algo obrigatório continuar faltando, o
+    resultado volta marcado com 'fallback' (não deve ser persistido).
+    Retorna None se nada aproveitável vier do modelo.
+    """
+    schema = STAGE_SCHEMAS[stage]
+    config = {**(generation_config or {}), 'response_mime_type': 'application/json'}
+    _count_structured('calls')
+    
+    text = model.generate_content(prompt, generation_config=config, stage=stage).text
+    data = _extract_json(text)
+    if data is None:
+        data = repair_json(text)
+        if isinstance(data, dict):
+            _count_structured('repaired')
+    if not isinstance(data, dict):
+        data = {}
+    
+    invalid = schema_errors(data, schema)
+    for name in invalid:
+        data.pop(name, None)
+    if DECISION_FIELDS.intersection(invalid):
+        # Uma decisão inventada sem o contexto completo valeria como real
+        data = {}
+    elif invalid and data:
+        # Nova pergunta pelos campos que faltaram, com a tarefa resumida
+        _count_structured('reasked')
+        subset = {name: schema['properties'][name]['type'] for name in invalid}
+        reask = (
+            f"TAREFA ORIGINAL (resumida):\n{_compact_prompt(prompt)}\n\n"
+            "Sua resposta a essa tarefa veio incompleta:\n"
+            f"{json.dumps(data, ensure_ascii=False)[:2000]}\n\n"
+            "Complete-a. Responda APENAS com um objeto JSON contendo os campos (nome: tipo): "
+            f"{json.dumps(subset, ensure_ascii=False)}"
+        )
+        extra = repair_json(model.generate_content(reask, generation_config=config, stage=stage).text)
+        if isinstance(extra, dict):
+            fixed = {name: extra[name] for name in invalid if name in extra}
+            data.update({name: value for name, value in fixed.items()
+                         if name not in schema_errors(fixed, {'properties': schema['properties']})})
+    
+    if not data:
+        _count_structured('failed')
+        return None
+    if schema_errors(data, schema):
+        data['fallback'] = True
+    return data
+
+
+class ModelRegistry:
+    """Registro de modelos compartilhado por todo o processo
+    
+    Cada backend é construído uma única vez por nome de modelo e reaproveitado
+    pelo motor, pelo validador e pelo chat. A descoberta de modelos
+    (list_models, uma ida à rede) fica em cache por discovery_ttl segundos.
+    Com um backend local definido, ele atende todos os modelos.
+    """
+    
+    def __init__(self, discovery_ttl: float = 3600):
+        self.discovery_ttl = discovery_ttl
+        self.lock = threading.Lock()
+        self._models: Dict[str, LLMBackend] = {}
+        self._api_key = None
+        self._discovered: Optional[Tuple[float, List[str]]] = None
+        self.local_backend: Optional[LocalBackend] = None
+        # Cota compartilhada por todos os backends do processo
+        self.limiter: Optional[PriorityRateLimiter] = None
+        self.retry_policy = RetryPolicy()
+    
+    def configure_limits(self, requests_per_minute: float = 60, burst: int = 10,
+                         max_retries: int = 4, backoff_base: float = 1.0,
+                         backoff_max: float = 30.0, call_deadline: float = 90.0):
+        """Define limitador de taxa e política de retry para todas as chamadas"""
+        with self.lock:
+            self.limiter = PriorityRateLimiter(requests_per_minute, burst) if requests_per_minute else None
+            self.retry_policy = RetryPolicy(max_retries, backoff_base, backoff_max, call_deadline)
+            for backend in [*self._models.values(), self.local_backend]:
+                if backend:
+                    self._apply_limits(backend)
+    
+    def _apply_limits(self, backend: LLMBackend):
+        backend.limiter = self.limiter
+        backend.retry_policy = self.retry_policy
+    
+    def configure(self, api_key: str):
+        """Configura a API (clientes são recriados só se a chave mudar)"""
+        if self.local_backend:
+            return
+        if genai is None:
+            raise RuntimeError("google-generativeai não instalado (use 'llm_backend': 'local')")
+        with self.lock:
+            if api_key != self._api_key:
+                genai.configure(api_key=api_key)
+                self._api_key = api_key
+                self._models.clear()
+                self._discovered = None
+    
+    def use_local_backend(self, backend: Optional[LocalBackend]):
+        """Direciona todas as chamadas para um backend local (None = desativar)"""
+        with self.lock:
+            self.local_backend = backend
+            if backend:
+                self._apply_limits(backend)
+            self._models.clear()
+            self._discovered = None
+    
+    def get(self, model_name: str) -> LLMBackend:
+        """Retorna o backend compartilhado de um modelo"""
+        with self.lock:
+            if self.local_backend:
+                return self.local_backend
+            model = self._models.get(model_name)
+            if model is None:
+                model = GeminiBackend(model_name)
+                self._apply_limits(model)
+                self._models[model_name] = model
+            return model
+    
+    def available_models(self, refresh: bool = False) -> List[str]:
+        """Modelos que suportam generateContent (nomes curtos, em cache)"""
+        if self.local_backend:
+            return [LocalBackend.name]
+        with self.lock:
+            if (not refresh and self._discovered and
+                    time.time() - self._discovered[0] < self.discovery_ttl):
+                return self._discovered[1]
+        
+        # models/gemini-pro -> gemini-pro
+        names = [
+            m.name.replace('models/', '')
+            for m in genai.list_models()
+            if 'generateContent' in m.supported_generation_methods
+        ]
+        with self.lock:
+            self._discovered = (time.time(), names)
+        return names
+
+
+model_registry = ModelRegistry()
+
+
+class SingleFlight:
+    """Coalesce chamadas idênticas em andamento
+    
+    O primeiro chamador de uma chave executa a função; quem chegar com a
+    mesma chave antes do fim espera e recebe o mesmo resultado (ou a mesma
+    exceção). Vale para chamadas dentro do mesmo processo.
+    """
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls: Dict[str, Dict] = {}
+    
+    def do(self, key: str, func: Callable[[], Any]) -> Tuple[Any, bool]:
+        """Executa func uma única vez por chave; retorna (resultado, compartilhado)"""
+        with self.lock:
+            flight = self.calls.get(key)
+            leader = flight is None
+            if leader:
+                flight = {'done': threading.Event(), 'result': None, 'error': None}
+                self.calls[key] = flight
+        
+        if not leader:
+            flight['done'].wait()
+            if flight['error'] is not None:
+                raise flight['error']
+            return flight['result'], True
+        
+        try:
+            flight['result'] = func()
+            return flight['result'], False
+        except BaseException as e:
+            flight['error'] = e
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            flight['done'].set()
+
+
+class StageGraph:
+    """Executa etapas com dependências entre si em um pool de threads
+    
+    Cada etapa recebe como argumentos nomeados os resultados das etapas
+    das quais depende e é disparada assim que elas terminam.
+    """
+    
+    def __init__(self, max_workers: int = 4):
+        self.max_workers = max_workers
+        self.stages: Dict[str, Tuple[Callable, List[str]]] = {}
+    
+    def add(self, name: str, func: Callable, deps: Optional[List[str]] = None) -> 'StageGraph':
+        """Registra uma etapa"""
+        self.stages[name] = (func, list(deps or []))
+        return self
+    
+    def run(self) -> Dict[str, Any]:
+        """Executa o grafo e retorna o resultado de cada etapa"""
+        results = {}
+        pending = dict(self.stages)
+        running = {}
+        
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while pending or running:
+                ready = [name for name, (_, deps) in pending.items() if all(d in results for d in deps)]
+                for name in ready:
+                    func, deps = pending.pop(name)
+                    running[executor.submit(func, **{d: results[d] for d in deps})] = name
+                
+                if not running:
+                    raise ValueError(f"Dependências não satisfeitas: {sorted(pending)}")
+                
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    results[name] = future.result()
+        
+        return results
+
+
+# Regras de segurança padrão; gravadas no rule-pack na primeira execução.
+# 'anchors' são os literais (minúsculos) com que uma ocorrência pode começar:
+# o pré-filtro só roda a regex completa da regra onde um deles aparece.
+# Âncoras precisam ser raras no código: uma palavra comum ('api', 'system')
+# casa a cada poucas linhas e a regex completa passa a rodar quase em todo
+# lugar. Por isso elas incluem o que vem em seguida ('api_key', 'system(').
+# O custo é perder grafias fora das âncoras, como 'system\t(' ou quebra de
+# linha antes do parêntese.
+DEFAULT_SECURITY_RULES = [
+    {'id': 'eval', 'pattern': r'eval\s*\(', 'anchors': ['eval'],
+     'message': "Uso de eval() detectado - PERIGOSO", 'severity': 'critical'},
+    {'id': 'exec', 'pattern': r'exec\s*\(', 'anchors': ['exec'],
+     'message': "Uso de exec() detectado - PERIGOSO", 'severity': 'critical'},
+    {'id': 'dynamic-import', 'pattern': r'__import__\s*\(', 'anchors': ['__import__'],
+     'message': "Import dinâmico detectado", 'severity': 'medium'},
+    {'id': 'shell-true', 'pattern': r'subprocess\.call\s*\(.*shell\s*=\s*True', 'anchors': ['subprocess.call'],
+     'message': "Shell=True em subprocess - RISCO", 'severity': 'high'},
+    {'id': 'plain-password', 'pattern': r'password\s*=\s*["\'].*["\']', 'anchors': ['password'],
+     'message': "Senha em texto plano detectada", 'severity': 'high'},
+    {'id': 'plain-api-key', 'pattern': r'api[_-]?key\s*=\s*["\'].*["\']',
+     'anchors': ['api_key', 'api-key', 'apikey'],
+     'message': "API key em texto plano detectada", 'severity': 'high'},
+    # Só funções globais: $this->system() e Foo::popen() são métodos comuns
+    {'id': 'php-shell', 'pattern': r'(?<![\w$>:])(?:passthru|system|proc_open|popen)\s*\(',
+     'anchors': ['passthru', 'system(', 'system (', 'proc_open', 'popen'], 'extensions': ['.php'],
+     'message': "Execução de comando do sistema no PHP - PERIGOSO", 'severity': 'critical'},
+    {'id': 'php-unserialize', 'pattern': r'\bunserialize\s*\(', 'anchors': ['unserialize'],
+     'extensions': ['.php'], 'message': "unserialize() com dados externos permite injeção de objetos",
+     'severity': 'high'},
+    {'id': 'raw-sql-interpolation', 'pattern': r'DB::raw\s*\(\s*["\'][^"\'\n]*\$', 'anchors': ['db::raw'],
+     'extensions': ['.php'], 'message': "SQL bruto com variável interpolada - risco de SQL injection",
+     'severity': 'high'},
+    {'id': 'react-inner-html', 'pattern': r'dangerouslySetInnerHTML', 'anchors': ['dangerouslysetinnerhtml'],
+     'extensions': ['.js', '.jsx', '.ts', '.tsx'], 'message': "HTML injetado sem escape (dangerouslySetInnerHTML)",
+     'severity': 'medium'},
+    {'id': 'inner-html', 'pattern': r'\.innerHTML\s*=(?!=)', 'anchors': ['.innerhtml'],
+     'extensions': ['.js', '.jsx', '.ts', '.tsx', '.html'], 'message': "Atribuição direta a innerHTML - risco de XSS",
+     'severity': 'medium'},
+]
+
+
+def _literal_trie(literals: List[bytes]) -> bytes:
+    """Regex que reconhece qualquer um dos literais, fatorada por prefixos comuns"""
+    trie: Dict = {}
+    for literal in literals:
+        node = trie
+        for byte in literal:
+            node = node.setdefault(byte, {})
+        node[None] = True
+    
+    def build(node: Dict) -> bytes:
+        branches = [re.escape(bytes([byte])) + build(child)
+                    for byte, child in sorted((k, v) for k, v in node.items() if k is not None)]
+        if not branches:
+            return b''
+        body = branches[0] if len(branches) == 1 else b'(?:' + b'|'.join(branches) + b')'
+        return b'(?:' + body + b')?' if None in node else body
+    
+    return build(trie)
+
+
+class SecurityRuleEngine:
+    """Motor de regras de segurança com pré-filtro de literais numa única passada
+    
+    As âncoras de todas as regras viram uma só regex (uma trie de literais,
+    no espírito do Aho-Corasick) que percorre o texto uma vez; a regex
+    completa de uma regra só é testada nas posições onde uma das suas âncoras
+    aparece. O pré-filtro ignora sempre a caixa; 'ignore_case' vale só para
+    a regex de cada regra. Regras sem âncora rodam cada uma com a sua própria
+    regex: os padrões do rule-pack são compilados e validados um a um e nunca
+    concatenados (grupos nomeados ou flags inline de uma regra não quebram as
+    outras). O plano é guardado por extensão de arquivo. Cada ocorrência
+    traz regra, linha e coluna.
+    """
+    
+    # Arquivos maiores que isso (bundles, dumps) ficam fora da varredura
+    MAX_FILE_BYTES = 8 * 1024 * 1024
+    
+    def __init__(self, rules: List[Dict], ignore_case: bool = True):
+        self.ignore_case = ignore_case
+        self.flags = re.IGNORECASE if ignore_case else 0
+        self.rules: List[Dict] = []
+        for rule in rules:
+            try:
+                rule['id'], rule['message']
+                SecurityLevel(rule.get('severity', 'medium'))
+                compiled = re.compile(rule['pattern'].encode('utf-8'), self.flags)
+                for key in ('anchors', 'extensions'):
+                    values = rule.get(key) or []
+                    if not isinstance(values, list) or not all(isinstance(v, str) and v for v in values):
+                        raise ValueError(f"'{key}' precisa ser uma lista de textos")
+            except (KeyError, ValueError, TypeError, AttributeError, re.error) as e:
+                print(f"⚠️  Regra de segurança ignorada ({rule.get('id', '?')}): {e}")
+                continue
+            self.rules.append({**rule, 'compiled': compiled})
+        self.lock = threading.Lock()
+        self._plans: Dict[str, Tuple] = {}
+    
+    @classmethod
+    def load(cls, path: str) -> 'SecurityRuleEngine':
+        """Carrega o rule-pack (JSON); cria o arquivo com as regras padrão se não existir"""
+        path = Path(path).expanduser()
+        if not path.exists():
+            try:
+                with open(path, 'w', encoding='utf-8') as f:
+                    json.dump({'version': 1, 'ignore_case': True, 'rules': DEFAULT_SECURITY_RULES},
+                              f, indent=2, ensure_ascii=False)
+            except OSError:
+                pass
+            return cls(DEFAULT_SECURITY_RULES)
+        
+        try:
+            with open(path, encoding='utf-8') as f:
+                pack = json.load(f)
+            return cls(pack['rules'], pack.get('ignore_case', True))
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            print(f"⚠️  Rule-pack inválido ({path}): {e} - usando regras padrão")
+            return cls(DEFAULT_SECURITY_RULES)
+    
+    def __len__(self):
+        return len(self.rules)
+    
+    def extensions(self) -> Optional[Set[str]]:
+        """Extensões cobertas pelas regras (None: alguma regra vale para qualquer arquivo)"""
+        covered = set()
+        for rule in self.rules:
+            if not rule.get('extensions'):
+                return None
+            covered.update(rule['extensions'])
+        return covered
+    
+    def _plan(self, extension: str) -> Tuple:
+        """(pré-filtro, regras por âncora, regras sem âncora) da extensão"""
+        with self.lock:
+            plan = self._plans.get(extension)
+            if plan is not None:
+                return plan
+            
+            by_anchor: Dict[bytes, List[Dict]] = {}
+            unanchored = []
+            for rule in self.rules:
+                if rule.get('extensions') and extension not in rule['extensions']:
+                    continue
+                anchors = rule.get('anchors')
+                if not anchors:
+                    unanchored.append(rule)
+                    continue
+                for anchor in anchors:
+                    key = anchor.lower()
+                    by_anchor.setdefault(key.encode('utf-8'), []).append(rule)
+            
+            prefilter = re.compile(_literal_trie(list(by_anchor))) if by_anchor else None
+            plan = self._plans[extension] = (prefilter, by_anchor, unanchored)
+            return plan
+    
+    def scan(self, data, extension: str = '') -> List[Dict]:
+        """Todas as ocorrências das regras no texto (str ou bytes), em ordem de posição"""
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        prefilter, by_anchor, unanchored = self._plan(extension.lower())
+        hits = []
+        
+        if prefilter is not None:
+            # O pré-filtro só escolhe candidatos: sempre sem caixa (ignore_case vale para a regra)
+            haystack = data.lower()
+            match = prefilter.search(haystack)
+            while match:
+                position, found = match.start(), match.group()
+                seen = set()
+                # Uma âncora pode ser prefixo de outra: considerar todas que casam aqui
+                for size in range(1, len(found) + 1):
+                    for rule in by_anchor.get(found[:size], ()):
+                        if rule['id'] in seen:
+                            continue
+                        seen.add(rule['id'])
+                        hit = rule['compiled'].match(data, position)
+                        if hit:
+                            hits.append((position, hit.end(), rule))
+                # Recomeçar logo após o início: ocorrências podem se sobrepor
+                match = prefilter.search(haystack, position + 1)
+        
+        for rule in unanchored:
+            hits.extend((hit.start(), hit.end(), rule) for hit in rule['compiled'].finditer(data))
+        
+        hits.sort(key=lambda h: h[0])
+        findings = []
+        line, line_start, last = 1, 0, 0
+        for start, end, rule in hits:
+            line += data.count(b'\n', last, start)
+            line_start = data.rfind(b'\n', 0, start) + 1
+            last = start
+            text = data[start:end].split(b'\n', 1)[0][:120].decode('utf-8', errors='replace')
+            findings.append({
+                'rule': rule['id'],
+                'message': rule['message'],
+                'severity': rule.get('severity', 'medium'),
+                'line': line,
+                'column': len(data[line_start:start].decode('utf-8', errors='ignore')) + 1,
+                'text': text
+            })
+        return findings
+    
+    def scan_file(self, path: str) -> Tuple[int, List[Dict]]:
+        """(bytes lidos, ocorrências) de um arquivo; binários e arquivos enormes são pulados"""
+        try:
+            if os.path.getsize(path) > self.MAX_FILE_BYTES:
+                return 0, []
+            with open(path, 'rb') as f:
+                data = f.read()
+        except OSError:
+            return 0, []
+        if b'\0' in data[:8192]:
+            return 0, []
+        return len(data), self.scan(data, os.path.splitext(path)[1])
+    
+    def sweep(self, paths: List[str], workers: Optional[int] = None) -> Dict:
+        """Varre vários arquivos em paralelo (um processo por núcleo)
+        
+        O re do Python não libera o GIL, por isso a varredura usa processos.
+        Os arquivos são distribuídos em lotes equilibrados por tamanho.
+        """
+        started = time.perf_counter()
+        workers = max(1, workers or os.cpu_count() or 1)
+        sized = []
+        for path in paths:
+            try:
+                sized.append((os.path.getsize(path), path))
+            except OSError:
+                continue
+        sized.sort(reverse=True)
+        batches = [[path for _, path in sized[i::workers * 4]] for i in range(min(len(sized), workers * 4))]
+        
+        results = None
+        if workers > 1 and len(batches) > 1:
+            rules = [{k: v for k, v in rule.items() if k != 'compiled'} for rule in self.rules]
+            try:
+                # forkserver/spawn: não herdar threads (observador) nem conexões SQLite abertas
+                context = multiprocessing.get_context(
+                    'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+                )
+                with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                                         initializer=_init_sweep_worker,
+                                         initargs=(rules, self.ignore_case)) as executor:
+                    results = list(executor.map(_sweep_batch, batches))
+            except (OSError, RuntimeError, BrokenProcessPool) as e:
+                print(f"   ⚠️  Varredura paralela indisponível ({e}) - seguindo num só processo")
+        if results is None:
+            workers = 1
+            results = [_sweep_batch(batch, self) for batch in batches]
+        
+        findings = [finding for _, _, batch_findings in results for finding in batch_findings]
+        findings.sort(key=lambda f: (f['path'], f['line'], f['column']))
+        return {
+            'files': sum(r[0] for r in results),
+            'bytes': sum(r[1] for r in results),
+            'seconds': time.perf_counter() - started,
+            'workers': workers,
+            'findings': findings
+        }
+
+
+# Motor de cada processo da varredura paralela (criado pelo initializer do pool)
+_sweep_engine: Optional[SecurityRuleEngine] = None
+
+
+def _init_sweep_worker(rules: List[Dict], ignore_case: bool):
+    global _sweep_engine
+    _sweep_engine = SecurityRuleEngine(rules, ignore_case)
+
+
+def _sweep_batch(paths: List[str], engine: Optional[SecurityRuleEngine] = None) -> Tuple[int, int, List[Dict]]:
+    """(arquivos, bytes, ocorrências com 'path') de um lote de arquivos"""
+    engine = engine or _sweep_engine
+    files = total = 0
+    findings = []
+    for path in paths:
+        size, found = engine.scan_file(path)
+        if size:
+            files += 1
+            total += size
+        findings.extend({**finding, 'path': path} for finding in found)
+    return files, total, findings
+
+
+class AIValidator:
+    """Sistema de validação inteligente em múltiplas camadas
+    
+    As camadas baratas (sintaxe, segurança por regex, impacto) formam uma
+    cascata com nível de confiança: a validação por IA só é chamada quando
+    elas não bastam para decidir.
+    """
+    
+    # Confiança mínima das camadas locais para dispensar a IA
+    CASCADE_THRESHOLD = 0.75
+    
+    # Arquivos de apresentação onde mudanças sem riscos raramente quebram algo
+    LOW_RISK_EXTENSIONS = ('.css', '.scss', '.less', '.md', '.txt')
+    
+    # Pontos de cada ocorrência de regra, pela severidade declarada no rule-pack:
+    # sozinha, uma regra já leva o nível de segurança à sua severidade
+    SEVERITY_SCORES = {'critical': 15, 'high': 10, 'medium': 5, 'low_risk': 2, 'safe': 0}
+    
+    # Quantos arquivos dependentes tornam uma mudança de impacto médio/alto
+    IMPACT_MEDIUM_DEPENDENTS = 1
+    IMPACT_HIGH_DEPENDENTS = 6
+    
+    # Linhas que só contêm comentário não contam como mudança de código
+    COMMENT_PREFIXES = ('#', '//', '/*', '*', '<!--')
+    
+    # Linhas de diff levadas ao prompt da validação por IA
+    PROMPT_DIFF_LINES = 200
+    
+    def __init__(self, model, symbol_index: Optional['SymbolIndex'] = None,
+                 rules: Optional[SecurityRuleEngine] = None):
+        self.model = model
+        self.symbol_index = symbol_index
+        self.rules = rules or SecurityRuleEngine(DEFAULT_SECURITY_RULES)
+        self.stats = {'validations': 0, 'ai_calls': 0, 'ai_skipped': 0}
+        self.stats_lock = threading.Lock()
+    
+    def validate_code_change(self, file_path: str, old_code: str, new_code: str) -> ValidationResult:
+        """Valida mudança de código com análise profunda"""
+        
+        risks = []
+        suggestions = []
+        dependencies = []
+        
+        # Camada 1: Análise sintática
+        if file_path.endswith(('.py', '.js', '.jsx', '.ts', '.tsx')):
+            syntax_valid = self._check_syntax(file_path, new_code)
+            if not syntax_valid:
+                risks.append("Erro de sintaxe detectado")
+                return ValidationResult(
+                    valid=False,
+                    security_level=SecurityLevel.HIGH,
+                    risks=risks
+                )
+        
+        # Camada 2: Análise de segurança
+        findings = self._analyze_security(new_code, file_path)
+        risks.extend(finding['message'] for finding in findings)
+        
+        # Camada 3: Análise de dependências
+        deps = self._extract_dependencies(new_code)
+        dependencies.extend(deps)
+        
+        # Camada 4: Análise de impacto (diff real + arquivos que dependem deste)
+        diff = diff_code(old_code, new_code, detect_language(file_path))
+        impact, dependents = self._analyze_impact(file_path, old_code, new_code, diff)
+        if dependents:
+            names = ', '.join(Path(p).name for p in sorted(dependents, key=dependents.get)[:5])
+            suggestions.append(f"Testar {len(dependents)} arquivos dependentes (ex.: {names})")
+        if diff['symbols']:
+            suggestions.append(f"Símbolos alterados: {', '.join(diff['symbols'][:8])}")
+        
+        # Camada 5: Validação por IA (apenas se as camadas locais forem inconclusivas)
+        recommendation, confidence = self._cascade_verdict(file_path, risks, impact, findings)
+        with self.stats_lock:
+            self.stats['validations'] += 1
+            self.stats['ai_skipped' if confidence >= self.CASCADE_THRESHOLD else 'ai_calls'] += 1
+        
+        if confidence >= self.CASCADE_THRESHOLD:
+            ai_validation = {
+                'recommendation': recommendation,
+                'confidence': confidence,
+                'source': 'cascade'
+            }
+        else:
+            ai_validation = self._ai_deep_validation(file_path, old_code, new_code, diff)
+        
+        # Determinar nível de segurança
+        security_level = self._calculate_security_level(findings, impact, ai_validation)
+        
+        return ValidationResult(
+            valid=len(risks) == 0 or security_level != SecurityLevel.CRITICAL,
+            security_level=security_level,
+            risks=risks,
+            suggestions=suggestions,
+            estimated_impact=impact,
+            dependencies=dependencies,
+            tests_required=impact in ['medium', 'high'],
+            rollback_plan=self._generate_rollback_plan(file_path)
+        )
+    
+    def _cascade_verdict(self, file_path: str, risks: List[str], impact: str,
+                         findings: List[Dict] = ()) -> Tuple[str, float]:
+        """Recomendação e confiança das camadas locais
+        
+        Regras de severidade crítica já decidem pela rejeição; mudanças
+        pequenas sem riscos (ou médias em arquivos de apresentação) já decidem
+        pela aprovação. O restante é ambíguo e fica para a IA.
+        """
+        if any(finding['severity'] == 'critical' for finding in findings):
+            return 'reject', 0.95
+        
+        if not risks:
+            if impact == 'low':
+                return 'approve', 0.9
+            if impact == 'medium' and file_path.lower().endswith(self.LOW_RISK_EXTENSIONS):
+                return 'approve', 0.8
+        
+        return 'review', 0.4
+    
+    def _check_syntax(self, file_path: str, code: str) -> bool:
+        """Verifica sintaxe do código"""
+        try:
+            if file_path.endswith('.py'):
+                ast.parse(code)
+            elif file_path.endswith(('.js', '.jsx', '.ts', '.tsx')):
+                # Verificação básica de brackets
+                if code.count('{') != code.count('}'):
+                    return False
+                if code.count('(') != code.count(')'):
+                    return False
+                if code.count('[') != code.count(']'):
+                    return False
+            return True
+        except:
+            return False
+    
+    def _analyze_security(self, code: str, file_path: str = '') -> List[Dict]:
+        """Analisa questões de segurança (uma passada do motor de regras)
+        
+        Cada regra violada vira um risco {'rule', 'severity', 'message'}, com a
+        linha da primeira ocorrência na mensagem.
+        """
+        issues = {}
+        for finding in self.rules.scan(code, os.path.splitext(file_path)[1]):
+            if finding['rule'] not in issues:
+                issues[finding['rule']] = {
+                    'rule': finding['rule'],
+                    'severity': finding['severity'],
+                    'message': f"{finding['message']} (linha {finding['line']})"
+                }
+        
+        return list(issues.values())
+    
+    def _extract_dependencies(self, code: str) -> List[str]:
+        """Extrai dependências do código"""
+        deps = []
+        
+        # Python imports
+        for match in re.finditer(r'^import\s+(\S+)', code, re.MULTILINE):
+            deps.append(match.group(1))
+        for match in re.finditer(r'^from\s+(\S+)\s+import', code, re.MULTILINE):
+            deps.append(match.group(1))
+        
+        # JavaScript/TypeScript imports
+        for match in re.finditer(r'import\s+.*?\s+from\s+["\'](.+?)["\']', code):
+            deps.append(match.group(1))
+        
+        return list(set(deps))
+    
+    def _analyze_impact(self, file_path: str, old_code: str, new_code: str,
+                        diff: Optional[Dict] = None) -> Tuple[str, Dict[str, int]]:
+        """Analisa impacto da mudança
+        
+        O impacto vem de quantos arquivos dependem deste (transitivamente, pelo
+        grafo do índice de símbolos), não do tamanho do diff: uma linha num
+        hook compartilhado pesa mais que um bloco de comentários. Sem índice,
+        vale o número de linhas de código inseridas, removidas e movidas.
+        
+        Linhas movidas mudam a ordem de execução (uma checagem de permissão
+        depois da ação, um dedent para fora de um if): contam como alteradas
+        e deixam o impacto no mínimo médio. Só reformatações verificadas pelo
+        diff (espaços, sem mudar a ordem) são ignoradas.
+        """
+        
+        def is_code(line):
+            stripped = line.strip()
+            return bool(stripped) and not stripped.startswith(self.COMMENT_PREFIXES)
+        
+        # Linhas de código alteradas (comentários e linhas vazias não contam)
+        diff = diff or diff_code(old_code, new_code, detect_language(file_path))
+        reformatted_old = {old for old, _, _ in diff['reformatted_lines']}
+        reformatted_new = {new for _, new, _ in diff['reformatted_lines']}
+        moved = sum(1 for old, _, line in diff['moved_lines'] if old not in reformatted_old and is_code(line))
+        changed = moved + sum(
+            1 for number, line in diff['inserted_lines'] if number not in reformatted_new and is_code(line)
+        ) + sum(
+            1 for number, line in diff['deleted_lines'] if number not in reformatted_old and is_code(line)
+        )
+        
+        if changed == 0:
+            return "low", {}
+        
+        if self.symbol_index is None:
+            dependents = {}
+            impact = "low" if changed < 5 else "medium" if changed < 20 else "high"
+        else:
+            dependents = self.symbol_index.dependents(file_path)
+            if len(dependents) >= self.IMPACT_HIGH_DEPENDENTS:
+                impact = "high"
+            elif len(dependents) >= self.IMPACT_MEDIUM_DEPENDENTS or changed >= 20:
+                impact = "medium"
+            else:
+                impact = "low"
+        
+        if moved and impact == "low":
+            impact = "medium"
+        return impact, dependents
+    
+    def _ai_deep_validation(self, file_path: str, old_code: str, new_code: str,
+                            diff: Optional[Dict] = None) -> Dict:
+        """Validação profunda usando IA (o prompt leva o diff, não o arquivo)"""
+        
+        diff = diff or diff_code(old_code, new_code, detect_language(file_path))
+        
+        prompt = f"""Analise esta mudança de código como um especialista em segurança:
+
+ARQUIVO: {file_path}
+MUDANÇA: +{diff['inserted']} -{diff['deleted']} linhas, {diff['moved']} movidas, {len(diff['hunks'])} trechos
+SÍMBOLOS ALTERADOS: {', '.join(diff['symbols']) or 'nenhum identificado'}
+
+DIFF (formato unificado):
+{format_diff(diff, self.PROMPT_DIFF_LINES)}
+
+Analise:
+1. Potenciais bugs
+2. Problemas de segurança
+3. Impacto em performance
+4. Quebra de compatibilidade
+5. Boas práticas violadas
+
+Responda em JSON:
+{{
+  "bugs_potential": [],
+  "security_issues": [],
+  "performance_impact": "none|low|medium|high",
+  "breaking_changes": bool,
+  "best_practices_violated": [],
+  "recommendation": "approve|review|reject",
+  "confidence": 0.0-1.0
+}}
+"""
+        
+        try:
+            result = generate_structured(self.model, prompt, 'code_validation')
+            if result:
+                return {'recommendation': 'review', 'confidence': 0.5, **result}
+        except Exception as e:
+            # Retries/backoff já foram esgotados no backend
+            print(f"   ⚠️  Erro na validação por IA: {e}")
+        
+        return {
+            "recommendation": "review",
+            "confidence": 0.5
+        }
+    
+    def _calculate_security_level(self, findings: List[Dict], impact: str, ai_validation: Dict) -> SecurityLevel:
+        """Calcula nível de segurança geral"""
+        
+        # Score system
+        score = 0
+        
+        # Riscos, pela severidade de cada regra
+        for finding in findings:
+            score += self.SEVERITY_SCORES.get(finding['severity'], 2)
+        
+        # Impacto
+        impact_scores = {'low': 0, 'medium': 3, 'high': 6}
+        score += impact_scores.get(impact, 0)
+        
+        # Recomendação da IA
+        ai_rec = ai_validation.get('recommendation', 'review')
+        if ai_rec == 'reject':
+            score += 8
+        elif ai_rec == 'review':
+            score += 3
+        
+        # Converter score em nível
+        if score >= 15:
+            return SecurityLevel.CRITICAL
+        elif score >= 10:
+            return SecurityLevel.HIGH
+        elif score >= 5:
+            return SecurityLevel.MEDIUM
+        elif score >= 2:
+            return SecurityLevel.LOW_RISK
+        else:
+            return SecurityLevel.SAFE
+    
+    def _generate_rollback_plan(self, file_path: str) -> str:
+        """Gera plano de rollback"""
+        return f"Restaurar {file_path} do backup mais recente usando comando 'restore'"
+
+
+def _compile_script_tokenizer(comment: str) -> re.Pattern:
+    """Tokenizador de passo único para JS/TS/TSX/PHP
+    
+    Comentários, strings, template literals e regex literais são consumidos
+    inteiros, de modo que chaves dentro deles não afetam a profundidade.
+    Palavras, espaços e pontuação são pulados de uma vez ('skip') para
+    que as alternativas não sejam testadas a cada caractere.
+    """
+    return re.compile(r"""
+        (?P<comment>""" + comment + r""")
+      | (?P<string>'(?:\\.|[^'\\\n])*'|"(?:\\.|[^"\\\n])*"|`(?:\\.|[^`\\])*`)
+      | (?P<regex>(?<=[=(,:;!&|?{}\[])[ \t]*/(?![/*])(?:\\.|\[(?:\\.|[^\]\\\n])*\]|[^/\\\n\[])+/[a-z]*)
+      | (?P<import>^[ \t]*import\b[^;'"`]*?['"][^'"\n]*['"][ \t]*;?)
+      | (?P<export>^[ \t]*export\b)
+      | (?P<use>^[ \t]*use[ \t]+[\w\\]+(?:[ \t]+as[ \t]+\w+)?[ \t]*;)
+      | (?P<cls>\b(?:class|interface|trait|enum)[ \t]+(\w+))
+      | (?P<function>\bfunction\b[ \t]*\*?[ \t]*&?[ \t]*(\w+)[ \t]*(?:<[^>\n]*>)?\((?:[^()]|\([^()]*\))*\))
+      | (?P<arrow>\b(?:const|let|var)[ \t]+(\w+)[ \t]*(?::[^=;\n]+?)?=[ \t]*(?:async[ \t]+)?
+            (?:function\b|(?:<[^>\n]*>)?\([^();]*(?:\([^();]*\)[^();]*)*\)[ \t]*(?::[^=;\n]+?)?=>|\w+[ \t]*=>))
+      | (?P<method>^[ \t]*(?:(?:public|private|protected|static|async|readonly|abstract|override|get|set)[ \t]+)*
+            ([A-Za-z_$][\w$]*)[ \t]*(?:<[^>\n]*>)?\([^();]*(?:\([^();]*\)[^();]*)*\)[ \t]*(?::[^{;\n]+)?\{)
+      | (?P<hook>\buse[A-Z]\w*(?=[ \t]*(?:<[^>\n]*>)?\())
+      | (?P<open>\{)
+      | (?P<close>\})
+      | (?P<popen>\()
+      | (?P<pclose>\))
+      | (?P<sep>[;,])
+      | (?P<skip>[\w$]+|[ \t]+|[^\w$\s'"`/{}#();,]+)
+    """, re.VERBOSE | re.MULTILINE | re.DOTALL)
+
+
+# Em JS/TS '#' marca campos privados; em PHP inicia comentário ('#[' é atributo)
+_JS_TOKENIZER = _compile_script_tokenizer(r"//[^\n]*|/\*.*?(?:\*/|\Z)")
+_PHP_TOKENIZER = _compile_script_tokenizer(r"//[^\n]*|/\*.*?(?:\*/|\Z)|\#(?!\[)[^\n]*")
+_BODY_START = re.compile(r'\s*\{')
+_NOT_METHODS = {'if', 'for', 'while', 'switch', 'catch', 'with', 'function', 'return', 'elseif', 'foreach'}
+_REACT_LANGUAGES = {'React JSX', 'React TypeScript'}
+_SCRIPT_LANGUAGES = {'JavaScript', 'TypeScript', 'React JSX', 'React TypeScript', 'PHP'}
+
+
+def _empty_structure() -> Dict:
+    return {
+        'functions': [],
+        'classes': [],
+        'imports': [],
+        'exports': [],
+        'components': [],
+        'hooks': [],
+        'summary': ''
+    }
+
+
+def _python_structure(content: str) -> Dict:
+    """Estrutura de código Python via ast (defs aninhadas e async incluídas)"""
+    structure = _empty_structure()
+    
+    try:
+        tree = ast.parse(content)
+    except (SyntaxError, ValueError):
+        # Código inválido: apenas as linhas de definição, sem corpo
+        for i, line in enumerate(content.split('\n'), 1):
+            match = re.match(r'\s*(?:async\s+)?(def|class)\s+(\w+)', line)
+            if match:
+                kind = 'functions' if match.group(1) == 'def' else 'classes'
+                structure[kind].append({'name': match.group(2), 'start': i, 'end': i})
+        return structure
+    
+    def visit(node, parent):
+        for child in ast.iter_child_nodes(node):
+            if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                # O span inclui os decoradores
+                start = min([d.lineno for d in child.decorator_list] + [child.lineno])
+                symbol = {'name': child.name, 'start': start, 'end': child.end_lineno}
+                if parent:
+                    symbol['parent'] = parent
+                if isinstance(child, ast.ClassDef):
+                    structure['classes'].append(symbol)
+                else:
+                    if isinstance(child, ast.AsyncFunctionDef):
+                        symbol['async'] = True
+                    structure['functions'].append(symbol)
+                visit(child, f"{parent}.{child.name}" if parent else child.name)
+            elif isinstance(child, (ast.Import, ast.ImportFrom)):
+                structure['imports'].append(ast.unparse(child))
+            elif (not parent and isinstance(child, ast.Assign)
+                  and any(isinstance(t, ast.Name) and t.id == '__all__' for t in child.targets)
+                  and isinstance(child.value, (ast.List, ast.Tuple))):
+                structure['exports'].extend(
+                    e.value for e in child.value.elts if isinstance(e, ast.Constant)
+                )
+            else:
+                visit(child, parent)
+    
+    visit(tree, '')
+    return structure
+
+
+def _script_structure(content: str, language: str) -> Dict:
+    """Estrutura de JS/TS/TSX/PHP em uma única passada do tokenizador
+    
+    Cada símbolo abre um escopo na primeira '{' após a declaração e termina
+    na '}' que fecha esse escopo. Funções de seta com corpo de expressão
+    (ex.: 'const X = () => (' ... ');') terminam no ';' ou ',' que encerra a
+    expressão, ou no último token antes de um ')'/'}' que a envolve.
+    """
+    structure = _empty_structure()
+    php = language == 'PHP'
+    react = language in _REACT_LANGUAGES
+    tokenizer = _PHP_TOKENIZER if php else _JS_TOKENIZER
+    hooks = {}
+    
+    line, last_pos = 1, 0
+    depth = parens = 0
+    pending = None      # símbolo aguardando a '{' do seu corpo
+    scopes = []         # (profundidade, símbolo) dos corpos abertos
+    expression = None   # (símbolo, profundidade, parênteses) de uma seta com corpo de expressão
+    
+    for match in tokenizer.finditer(content):
+        kind = match.lastgroup
+        if kind in ('skip', 'comment', 'string', 'regex'):
+            continue
+        
+        pos = match.start()
+        line += content.count('\n', last_pos, pos)
+        last_pos = pos
+        
+        if expression is not None:
+            symbol, at_depth, at_parens = expression
+            if depth == at_depth and parens == at_parens and kind not in ('open', 'popen', 'hook'):
+                # ';' ou ',' encerram a expressão; ')', '}' ou outra declaração já estão fora dela
+                if kind == 'sep':
+                    symbol['end'] = line
+                expression = None
+            else:
+                symbol['end'] = line
+        
+        if kind == 'popen':
+            parens += 1
+        
+        elif kind == 'pclose':
+            parens = max(0, parens - 1)
+        
+        elif kind == 'sep':
+            pass
+        
+        elif kind == 'open':
+            depth += 1
+            if pending is not None:
+                scopes.append((depth, pending))
+                pending = None
+        
+        elif kind == 'close':
+            if scopes and scopes[-1][0] == depth:
+                scopes.pop()[1]['end'] = line
+            depth = max(0, depth - 1)
+        
+        elif kind == 'import':
+            if depth == 0:
+                structure['imports'].append(' '.join(match.group().split()))
+        
+        elif kind == 'use':
+            if php and depth == 0:
+                structure['imports'].append(match.group().strip())
+        
+        elif kind == 'export':
+            end = content.find('\n', pos)
+            structure['exports'].append(content[pos:end if end != -1 else len(content)].strip())
+        
+        elif kind == 'hook':
+            hooks.setdefault(match.group(), line)
+        
+        else:
+            name = match.group(match.re.groupindex[kind] + 1)
+            parent = scopes[-1][1] if scopes else None
+            in_class = parent is not None and parent.get('kind') == 'class' and scopes[-1][0] == depth
+            
+            if kind == 'method':
+                # O padrão de método já consumiu a '{' do corpo
+                depth += 1
+                if not in_class or name in _NOT_METHODS:
+                    continue
+            
+            symbol = {'name': name, 'start': line, 'end': line}
+            if parent is not None:
+                symbol['parent'] = parent['name']
+            
+            if kind == 'cls':
+                symbol['kind'] = 'class'
+                structure['classes'].append(symbol)
+            elif react and name[:1].isupper() and kind in ('function', 'arrow'):
+                structure['components'].append(symbol)
+            else:
+                structure['functions'].append(symbol)
+            
+            if kind == 'method':
+                scopes.append((depth, symbol))
+            elif kind == 'arrow' and not _BODY_START.match(content, match.end()):
+                pending = None
+                expression = (symbol, depth, parens)
+            else:
+                pending = symbol
+    
+    for symbol in structure['classes']:
+        del symbol['kind']
+    structure['hooks'] = list(hooks)
+    return structure
+
+
+LANGUAGE_BY_EXTENSION = {
+    '.py': 'Python',
+    '.js': 'JavaScript',
+    '.jsx': 'React JSX',
+    '.ts': 'TypeScript',
+    '.tsx': 'React TypeScript',
+    '.php': 'PHP',
+    '.css': 'CSS',
+    '.html': 'HTML',
+    '.json': 'JSON',
+    '.md': 'Markdown'
+}
+
+
+def detect_language(file_path: str) -> str:
+    """Detecta linguagem do arquivo pela extensão"""
+    return LANGUAGE_BY_EXTENSION.get(os.path.splitext(file_path)[1].lower(), 'Unknown')
+
+
+def extract_structure(content: str, language: str) -> Dict:
+    """Extrai a estrutura do código em uma única passada
+    
+    Python usa o módulo ast; JS/TS/TSX/PHP usam um tokenizador. Cada
+    símbolo traz 'start' e 'end' (linhas, inclusive) e, se aninhado, 'parent'.
+    """
+    if language == 'Python':
+        structure = _python_structure(content)
+    elif language in _SCRIPT_LANGUAGES:
+        structure = _script_structure(content, language)
+    else:
+        structure = _empty_structure()
+    
+    parts = []
+    if structure['classes']:
+        parts.append(f"{len(structure['classes'])} classes")
+    if structure['components']:
+        parts.append(f"{len(structure['components'])} components")
+    if structure['functions']:
+        parts.append(f"{len(structure['functions'])} functions")
+    if structure['hooks']:
+        parts.append(f"{len(structure['hooks'])} hooks")
+    
+    structure['summary'] = ', '.join(parts) if parts else 'código simples'
+    
+    return structure
+
+
+# Passos da busca de Myers antes de desistir do caminho mínimo (arquivos reescritos)
+DIFF_MAX_COST = 64
+
+
+def _middle_snake(a: List[int], b: List[int], a0: int, a1: int, b0: int, b1: int) -> Tuple[int, int, int, int]:
+    """Trecho diagonal (x, y) -> (u, v) no meio de um caminho de edição mínimo
+    
+    Busca de Myers simultânea do início e do fim, em espaço linear; as
+    coordenadas retornadas são absolutas. Se o caminho passa de
+    DIFF_MAX_COST passos, corta no ponto mais avançado da busca direta
+    (como o GNU diff): o diff deixa de ser mínimo, mas o custo fica limitado.
+    """
+    n, m = a1 - a0, b1 - b0
+    delta = n - m
+    odd = delta & 1
+    limit = (n + m + 1) // 2
+    offset = limit + 1
+    forward = [0] * (2 * offset + 1)
+    backward = [0] * (2 * offset + 1)
+    
+    for d in range(limit + 1):
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and forward[offset + k - 1] < forward[offset + k + 1]):
+                x = forward[offset + k + 1]
+            else:
+                x = forward[offset + k - 1] + 1
+            y = x - k
+            start_x, start_y = x, y
+            while x < n and y < m and a[a0 + x] == b[b0 + y]:
+                x += 1
+                y += 1
+            forward[offset + k] = x
+            if odd and -(d - 1) <= delta - k <= d - 1 and x + backward[offset + delta - k] >= n:
+                return a0 + start_x, b0 + start_y, a0 + x, b0 + y
+        
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and backward[offset + k - 1] < backward[offset + k + 1]):
+                x = backward[offset + k + 1]
+            else:
+                x = backward[offset + k - 1] + 1
+            y = x - k
+            start_x, start_y = x, y
+            while x < n and y < m and a[a1 - 1 - x] == b[b1 - 1 - y]:
+                x += 1
+                y += 1
+            backward[offset + k] = x
+            if not odd and -d <= delta - k <= d and x + forward[offset + delta - k] >= n:
+                return a1 - x, b1 - y, a1 - start_x, b1 - start_y
+        
+        if d >= DIFF_MAX_COST:
+            reached = [(forward[offset + k], forward[offset + k] - k) for k in range(-d, d + 1, 2)]
+            inside = [(x, y) for x, y in reached if x <= n and 0 <= y <= m and x + y < n + m]
+            if inside:
+                x, y = max(inside, key=sum)
+                return a0 + x, b0 + y, a0 + x, b0 + y
+    
+    raise AssertionError('caminho de edição não encontrado')
+
+
+def _common_pairs(a: List[int], b: List[int], a0: int, a1: int, b0: int, b1: int,
+                  pairs: List[Tuple[int, int]]):
+    """Acrescenta a pairs os pares (i, j) de uma maior subsequência comum
+    
+    Divisão e conquista com pilha explícita em vez de recursão: a
+    profundidade cresce com o tamanho da mudança e estouraria o limite de
+    recursão em arquivos grandes muito alterados. Cada tarefa é um trecho a
+    resolver ou, com 'diagonal', um trecho já casado a emitir em ordem.
+    """
+    stack = [(a0, a1, b0, b1, False)]
+    while stack:
+        a0, a1, b0, b1, diagonal = stack.pop()
+        if diagonal:
+            pairs.extend(zip(range(a0, a1), range(b0, b1)))
+            continue
+        
+        while a0 < a1 and b0 < b1 and a[a0] == b[b0]:
+            pairs.append((a0, b0))
+            a0 += 1
+            b0 += 1
+        suffix = 0
+        while a0 < a1 and b0 < b1 and a[a1 - 1] == b[b1 - 1]:
+            a1 -= 1
+            b1 -= 1
+            suffix += 1
+        
+        if a0 < a1 and b0 < b1:
+            x, y, u, v = _middle_snake(a, b, a0, a1, b0, b1)
+            # Empilhados ao contrário: a pilha devolve na ordem do arquivo
+            stack.append((a1, a1 + suffix, b1, b1 + suffix, True))
+            stack.append((u, a1, v, b1, False))
+            stack.append((x, u, y, v, True))
+            stack.append((a0, x, b0, y, False))
+        else:
+            pairs.extend((a1 + i, b1 + i) for i in range(suffix))
+
+
+def diff_opcodes(old: List[str], new: List[str]) -> List[Tuple[str, int, int, int, int]]:
+    """Diff mínimo entre duas listas de linhas (Myers em espaço linear)
+    
+    Retorna opcodes (tag, i1, i2, j1, j2) como os do difflib, com tag em
+    'equal', 'delete', 'insert' ou 'replace'. Linhas são trocadas por inteiros
+    e as que só existem de um lado saem antes da busca: não podem casar e,
+    sem elas, arquivos muito diferentes não custam O(N·D).
+    """
+    ids: Dict[str, int] = {}
+    a = [ids.setdefault(line, len(ids)) for line in old]
+    b = [ids.setdefault(line, len(ids)) for line in new]
+    in_a, in_b = set(a), set(b)
+    a_index = [i for i, token in enumerate(a) if token in in_b]
+    b_index = [j for j, token in enumerate(b) if token in in_a]
+    
+    pairs: List[Tuple[int, int]] = []
+    _common_pairs([a[i] for i in a_index], [b[j] for j in b_index],
+                  0, len(a_index), 0, len(b_index), pairs)
+    
+    opcodes = []
+    i = j = 0
+    for x, y in [(a_index[p], b_index[q]) for p, q in pairs] + [(len(a), len(b))]:
+        if i < x or j < y:
+            tag = 'replace' if i < x and j < y else 'delete' if i < x else 'insert'
+            opcodes.append((tag, i, x, j, y))
+        if x < len(a):
+            if opcodes and opcodes[-1][0] == 'equal':
+                opcodes[-1] = ('equal', opcodes[-1][1], x + 1, opcodes[-1][3], y + 1)
+            else:
+                opcodes.append(('equal', x, x + 1, y, y + 1))
+        i, j = x + 1, y + 1
+    return opcodes
+
+
+# Linguagens em que mudar só a indentação/espaços de uma linha não muda o código
+_WHITESPACE_INSENSITIVE_LANGUAGES = {'JavaScript', 'TypeScript', 'React JSX', 'React TypeScript',
+                                     'PHP', 'CSS', 'HTML', 'JSON'}
+
+
+def diff_code(old_code: str, new_code: str, language: Optional[str] = None, context: int = 3) -> Dict:
+    """Diff de código com estatísticas por hunk
+    
+    Retorna os hunks (formato unificado, com 'context' linhas ao redor), as
+    linhas inseridas e removidas, as movidas (mesmo conteúdo, sem contar a
+    indentação, removido num ponto e inserido em outro; não entram nas
+    inseridas/removidas), as reformatadas (movidas que só mudaram espaços,
+    sem mudar de ordem, em linguagem onde a indentação não importa) e, se a
+    linguagem for dada, os símbolos cujos spans contêm alguma linha alterada.
+    """
+    old_lines, new_lines = old_code.split('\n'), new_code.split('\n')
+    opcodes = diff_opcodes(old_lines, new_lines)
+    
+    removed = [(i + 1, old_lines[i]) for tag, i1, i2, _, _ in opcodes if tag in ('delete', 'replace')
+               for i in range(i1, i2)]
+    added = [(j + 1, new_lines[j]) for tag, _, _, j1, j2 in opcodes if tag in ('insert', 'replace')
+             for j in range(j1, j2)]
+    
+    # Movidas: só linhas com alguma palavra ('}' e linhas vazias não contam)
+    destinations: Dict[str, deque] = {}
+    for number, text in added:
+        key = text.strip()
+        if re.search(r'\w', key):
+            destinations.setdefault(key, deque()).append(number)
+    moved = []
+    for number, text in removed:
+        targets = destinations.get(text.strip())
+        if targets:
+            moved.append((number, targets.popleft(), text))
+    moved_old = {old for old, _, _ in moved}
+    moved_new = {new for _, new, _ in moved}
+    
+    # Reformatação: linhas alteradas que só mudaram espaços e continuam na
+    # mesma ordem em relação ao resto do código (casam no diff sem espaços),
+    # em linguagem onde a indentação não tem significado
+    reformatted = []
+    if removed and added and language in _WHITESPACE_INSENSITIVE_LANGUAGES:
+        def normalize(lines):
+            return [' '.join(line.split()) for line in lines]
+        
+        removed_numbers = {number for number, _ in removed}
+        added_numbers = {number for number, _ in added}
+        for tag, i1, i2, j1, j2 in diff_opcodes(normalize(old_lines), normalize(new_lines)):
+            if tag == 'equal':
+                reformatted.extend(
+                    (i + 1, j + 1, old_lines[i]) for i, j in zip(range(i1, i2), range(j1, j2))
+                    if i + 1 in removed_numbers and j + 1 in added_numbers
+                )
+    
+    hunks = []
+    group: List[Tuple] = []
+    for opcode in [op for op in opcodes if op[0] != 'equal'] + [None]:
+        if group and (opcode is None or opcode[1] - group[-1][2] > 2 * context):
+            i1 = max(0, group[0][1] - context)
+            j1 = group[0][3] - (group[0][1] - i1)
+            i2 = min(len(old_lines), group[-1][2] + context)
+            j2 = group[-1][4] + (i2 - group[-1][2])
+            lines, cursor = [], i1
+            for _, a1, a2, b1, b2 in group:
+                lines.extend(' ' + line for line in old_lines[cursor:a1])
+                lines.extend('-' + line for line in old_lines[a1:a2])
+                lines.extend('+' + line for line in new_lines[b1:b2])
+                cursor = a2
+            lines.extend(' ' + line for line in old_lines[cursor:i2])
+            hunks.append({'old_start': i1 + 1, 'old_count': i2 - i1,
+                          'new_start': j1 + 1, 'new_count': j2 - j1, 'lines': lines})
+            group = []
+        if opcode is not None:
+            group.append(opcode)
+    
+    symbols = []
+    if language:
+        touched = ((old_code, sorted(number for number, _ in removed)),
+                   (new_code, sorted(number for number, _ in added)))
+        for code, numbers in touched:
+            if not numbers:
+                continue
+            structure = extract_structure(code, language)
+            for kind in ('classes', 'components', 'functions'):
+                for symbol in structure[kind]:
+                    position = bisect.bisect_left(numbers, symbol['start'])
+                    if position < len(numbers) and numbers[position] <= symbol['end']:
+                        name = f"{symbol['parent']}.{symbol['name']}" if symbol.get('parent') else symbol['name']
+                        if name not in symbols:
+                            symbols.append(name)
+    
+    return {
+        'hunks': hunks,
+        'inserted': len(added) - len(moved),
+        'deleted': len(removed) - len(moved),
+        'moved': len(moved),
+        'inserted_lines': [(n, t) for n, t in added if n not in moved_new],
+        'deleted_lines': [(n, t) for n, t in removed if n not in moved_old],
+        'moved_lines': moved,
+        'reformatted': len(reformatted),
+        'reformatted_lines': reformatted,
+        'symbols': symbols
+    }
+
+
+def format_diff(diff: Dict, max_lines: int = 200) -> str:
+    """Hunks de diff_code() em texto unificado, cortado em max_lines linhas"""
+    output = []
+    for hunk in diff['hunks']:
+        output.append(f"@@ -{hunk['old_start']},{hunk['old_count']} +{hunk['new_start']},{hunk['new_count']} @@")
+        output.extend(hunk['lines'])
+    if len(output) > max_lines:
+        omitted = len(output) - max_lines
+        output = output[:max_lines] + [f"... ({omitted} linhas omitidas)"]
+    return '\n'.join(output)
+
+
+class CodeAnalyzer:
+    """Analisador profundo de código - LÊ e ENTENDE completamente"""
+    
+    # Incrementar sempre que o prompt ou o formato da análise mudar:
+    # invalida todas as análises persistidas das versões anteriores
+    PROMPT_VERSION = 'v5'
+    
+    # Orçamento (estimado) de tokens de código por chamada ao modelo
+    CHUNK_TOKEN_BUDGET = 3000
+    CHUNK_WORKERS = 4
+    
+    def __init__(self, model, cache: Optional[ContextCache] = None):
+        self.model = model
+        self.cache = cache
+        self.inflight = SingleFlight()
+    
+    def deep_analyze_file(self, file_path: str) -> Dict:
         """Análise PROFUNDA de um arquivo - entende TUDO"""
         
-        if not Path(file_path).exists():
-            return {'error': 'Arquivo não encontrado'}
+        if not Path(file_path).exists():
+            return {'error': 'Arquivo não encontrado'}
+        
+        print(f"\n📖 LENDO E ANALISANDO: {file_path}")
+        
+        try:
+            with open(file_path, 'r', encoding='utf-8') as f:
+                content = f.read()
+        except Exception as e:
+            return {'error': f'Erro ao ler arquivo: {e}'}
+        
+        # Metadados básicos
+        lines = content.split('\n')
+        total_lines = len(lines)
+        
+        print(f"   📄 Arquivo: {total_lines} linhas")
+        
+        # Detectar linguagem
+        language = self._detect_language(file_path)
+        print(f"   🔤 Linguagem: {language}")
+        
+        # Cache endereçado por conteúdo: arquivo inalterado = zero chamadas à IA
+        content_hash = hashlib.sha256(content.encode('utf-8')).hexdigest()
+        cache_key = f"analysis_{self.PROMPT_VERSION}_{language}_{content_hash}"
+        cached = self.cache.get(cache_key) if self.cache else None
+        
+        if cached:
+            print("   💾 Análise recuperada do cache (conteúdo inalterado)")
+            return {
+                **cached,
+                'file_path': file_path,
+                'content_hash': content_hash
+            }
+        
+        # Análises simultâneas do mesmo conteúdo compartilham uma única leitura por IA
+        analysis, shared = self.inflight.do(
+            cache_key,
+            lambda: self._analyze_content(file_path, content, language, total_lines, cache_key)
+        )
+        if shared:
+            print("   🔗 Análise idêntica já em andamento - resultado compartilhado")
+        
+        return {
+            **analysis,
+            'file_path': file_path,
+            'content_hash': content_hash
+        }
+    
+    def _analyze_content(self, file_path: str, content: str, language: str,
+                         total_lines: int, cache_key: str) -> Dict:
+        """Estrutura + leitura profunda por IA (persistida no cache)"""
+        
+        # Análise sintática básica
+        structure = self._analyze_structure(content, language)
+        print(f"   🏗️  Estrutura: {structure['summary']}")
+        
+        # ANÁLISE PROFUNDA COM IA
+        print(f"   🧠 IA analisando profundamente...")
+        
+        deep_analysis = self._ai_deep_read(file_path, content, language, structure)
+        
+        print(f"   ✓ Análise completa!")
+        
+        analysis = {
+            'language': language,
+            'total_lines': total_lines,
+            'structure': structure,
+            'deep_analysis': deep_analysis,
+            'timestamp': datetime.now().isoformat()
+        }
+        
+        # Não persistir análises degradadas: serão refeitas na próxima vez
+        if self.cache and not deep_analysis.get('fallback'):
+            self.cache.set(cache_key, analysis)
+        
+        return analysis
+    
+    def analyze_files(self, file_paths: List[str], max_workers: int = 4,
+                      timeout: float = 120.0) -> Dict[str, Dict]:
+        """Analisa vários arquivos em paralelo com concorrência limitada
+        
+        Cada arquivo tem seu próprio prazo, contado a partir do início da sua
+        análise. Arquivos que falham ou estouram o prazo retornam {'error': ...}
+        e os demais resultados são entregues normalmente.
+        """
+        if not file_paths:
+            return {}
+        
+        results = {}
+        started = {}
+        
+        def run(path):
+            started[path] = time.monotonic()
+            return self.deep_analyze_file(path)
+        
+        executor = ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(file_paths))))
+        futures = {executor.submit(run, path): path for path in file_paths}
+        pending = set(futures)
+        
+        try:
+            while pending:
+                now = time.monotonic()
+                remaining = [started[futures[f]] + timeout - now for f in pending if futures[f] in started]
+                done, pending = wait(
+                    pending,
+                    timeout=max(0.01, min(remaining)) if remaining else 0.05,
+                    return_when=FIRST_COMPLETED
+                )
+                
+                for future in done:
+                    path = futures[future]
+                    try:
+                        results[path] = future.result()
+                    except Exception as e:
+                        results[path] = {'error': f'Falha na análise: {e}'}
+                
+                now = time.monotonic()
+                for future in list(pending):
+                    path = futures[future]
+                    if path in started and now - started[path] >= timeout:
+                        pending.discard(future)
+                        results[path] = {'error': f'Tempo esgotado ({timeout:.0f}s)'}
+        finally:
+            # Não esperar análises que estouraram o prazo
+            executor.shutdown(wait=False, cancel_futures=True)
+        
+        return {path: results[path] for path in file_paths}
+    
+    def _detect_language(self, file_path: str) -> str:
+        """Detecta linguagem do arquivo"""
+        return detect_language(file_path)
+    
+    def _analyze_structure(self, content: str, language: str) -> Dict:
+        """Analisa estrutura do código em uma única passada"""
+        return extract_structure(content, language)
+    
+    def _ai_deep_read(self, file_path: str, content: str, language: str, structure: Dict) -> Dict:
+        """IA lê e ENTENDE profundamente o código
+        
+        Arquivos que cabem no orçamento de tokens vão inteiros no prompt.
+        Arquivos maiores são divididos em blocos estruturais (classes e
+        funções), resumidos em paralelo (map) e consolidados numa única
+        análise (reduce). Resumos de blocos ficam em cache pelo hash do bloco:
+        uma edição só re-resume os blocos alterados. Se algum bloco ficou sem
+        resumo, a análise volta marcada com 'fallback' e não é persistida.
+        """
+        
+        partial = False
+        if estimate_tokens(content) <= self.CHUNK_TOKEN_BUDGET:
+            code_section = f"""CÓDIGO COMPLETO:
+```{language.lower()}
+{content}
+```"""
+        else:
+            chunks = self._split_chunks(content, structure)
+            print(f"   🧩 Arquivo grande: {len(chunks)} blocos resumidos em paralelo")
+            summaries = self._summarize_chunks(file_path, language, chunks)
+            # Algum bloco sem resumo: a análise consolidada fica incompleta
+            partial = any(summary.get('fallback') for summary in summaries)
+            code_section = "RESUMOS DOS BLOCOS DO ARQUIVO (em ordem):\n" + '\n\n'.join(
+                f"[linhas {chunk['start']}-{chunk['end']}]\n{json.dumps(summary, ensure_ascii=False)}"
+                for chunk, summary in zip(chunks, summaries)
+            )
+        
+        prompt = f"""Você é um especialista em {language} analisando código em profundidade.
+
+ARQUIVO: {file_path}
+LINGUAGEM: {language}
+ESTRUTURA DETECTADA:
+- Classes: {[c['name'] for c in structure['classes']]}
+- Componentes: {[c['name'] for c in structure['components']]}
+- Funções: {[f['name'] for f in structure['functions']]}
+- Hooks: {structure['hooks']}
+
+{code_section}
+
+ANALISE PROFUNDAMENTE:
+
+1. **Propósito do Arquivo**
+   - O que este arquivo faz?
+   - Qual sua responsabilidade?
+
+2. **Estrutura e Organização**
+   - Como está organizado?
+   - Segue boas práticas?
+
+3. **Dependências e Imports**
+   - Quais bibliotecas usa?
+   - Há dependências circulares?
+
+4. **Componentes/Classes Principais**
+   - O que cada um faz?
+   - Como se relacionam?
+
+5. **Estado e Dados**
+   - Como gerencia estado?
+   - Quais dados manipula?
+
+6. **Lógica de Negócio**
+   - Principais funções e fluxos
+   - Validações e regras
+
+7. **Pontos de Atenção**
+   - Código complexo ou frágil
+   - Áreas que requerem cuidado
+   - Possíveis bugs
+
+8. **Como Editar com Segurança**
+   - Onde é seguro adicionar código
+   - O que NÃO deve ser tocado
+   - Dependências a considerar
+
+Responda em JSON:
+{{
+  "purpose": "propósito principal",
+  "main_components": ["lista de componentes principais"],
+  "key_functions": ["funções críticas"],
+  "state_management": "como gerencia estado",
+  "dependencies": ["dependências importantes"],
+  "complexity_level": "low|medium|high",
+  "safe_edit_zones": ["áreas seguras para editar"],
+  "danger_zones": ["áreas PERIGOSAS - não tocar"],
+  "recommendations": ["recomendações para edição"],
+  "understanding_score": 0.0-1.0
+}}
+"""
+        
+        try:
+            analysis = generate_structured(
+                self.model,
+                prompt,
+                'deep_read',
+                generation_config={
+                    'temperature': 0.1,
+                    'max_output_tokens': 4096
+                }
+            )
+            if analysis:
+                if partial:
+                    analysis['fallback'] = True
+                return analysis
+        except Exception as e:
+            print(f"   ⚠️  Erro na análise IA: {e}")
         
-        print(f"\n📖 LENDO E ANALISANDO: {file_path}")
+        return {
+            'purpose': 'Não foi possível determinar',
+            'understanding_score': 0.3,
+            'fallback': True
+        }
+    
+    def _split_chunks(self, content: str, structure: Dict) -> List[Dict]:
+        """Divide o arquivo em blocos nas fronteiras de classes/funções"""
+        lines = content.split('\n')
+        budget = self.CHUNK_TOKEN_BUDGET
+        
+        # Fronteiras estruturais (linhas 1-based onde começa um símbolo)
+        boundaries = {1}
+        for kind in ('classes', 'functions', 'components'):
+            for symbol in structure.get(kind, []):
+                if 1 < symbol.get('start', 0) <= len(lines):
+                    boundaries.add(symbol['start'])
+                if symbol.get('end', 0) < len(lines):
+                    boundaries.add(symbol['end'] + 1)
+        starts = sorted(boundaries)
+        segments = [(start, end - 1) for start, end in zip(starts, starts[1:] + [len(lines) + 1])]
+        
+        # Segmentos maiores que o orçamento são cortados por linhas
+        pieces = []
+        for start, end in segments:
+            piece_start, tokens = start, 0
+            for line_no in range(start, end + 1):
+                tokens += estimate_tokens(lines[line_no - 1])
+                if tokens > budget and line_no > piece_start:
+                    pieces.append((piece_start, line_no - 1))
+                    piece_start, tokens = line_no, estimate_tokens(lines[line_no - 1])
+            pieces.append((piece_start, end))
+        
+        # Segmentos vizinhos pequenos são agrupados até o orçamento
+        chunks = []
+        for start, end in pieces:
+            text = '\n'.join(lines[start - 1:end])
+            if chunks and estimate_tokens(chunks[-1]['text']) + estimate_tokens(text) <= budget:
+                chunks[-1]['text'] += '\n' + text
+                chunks[-1]['end'] = end
+            else:
+                chunks.append({'start': start, 'end': end, 'text': text})
+        return chunks
+    
+    def _summarize_chunks(self, file_path: str, language: str, chunks: List[Dict]) -> List[Dict]:
+        """Resume blocos em paralelo, reaproveitando resumos em cache"""
+        
+        def summarize(chunk):
+            chunk_hash = hashlib.sha256(chunk['text'].encode('utf-8')).hexdigest()
+            cache_key = f"analysis_chunk_{self.PROMPT_VERSION}_{language}_{chunk_hash}"
+            cached = self.cache.get(cache_key) if self.cache else None
+            if cached:
+                return cached
+            
+            summary = self._ai_summarize_chunk(file_path, language, chunk)
+            if self.cache and not summary.get('fallback'):
+                self.cache.set(cache_key, summary)
+            return summary
+        
+        with ThreadPoolExecutor(max_workers=self.CHUNK_WORKERS) as executor:
+            return list(executor.map(summarize, chunks))
+    
+    def _ai_summarize_chunk(self, file_path: str, language: str, chunk: Dict) -> Dict:
+        """IA resume um bloco do arquivo (etapa map)"""
+        
+        prompt = f"""Você é um especialista em {language}. Resuma este trecho de um arquivo maior.
+
+ARQUIVO: {file_path}
+LINHAS: {chunk['start']}-{chunk['end']}
+
+```{language.lower()}
+{chunk['text']}
+```
+
+Responda em JSON:
+{{
+  "summary": "o que este trecho faz",
+  "symbols": ["classes/funções/componentes definidos"],
+  "state": "estado ou dados manipulados",
+  "dependencies": ["dependências usadas"],
+  "danger_zones": ["pontos frágeis deste trecho"],
+  "safe_edit_zones": ["pontos seguros para editar neste trecho"]
+}}
+"""
         
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                content = f.read()
+            summary = generate_structured(
+                self.model,
+                prompt,
+                'chunk_summary',
+                generation_config={
+                    'temperature': 0.1,
+                    'max_output_tokens': 1024
+                }
+            )
+            if summary:
+                return summary
         except Exception as e:
-            return {'error': f'Erro ao ler arquivo: {e}'}
+            print(f"   ⚠️  Erro ao resumir linhas {chunk['start']}-{chunk['end']}: {e}")
         
-        # Metadados básicos
-        lines = content.split('\n')
-        total_lines = len(lines)
+        return {'summary': 'Trecho não analisado', 'fallback': True}
+
+
+DEFAULT_SCAN_EXCLUDES = ['vendor', 'node_modules', 'storage', '.git']
+
+
+class TreeScanner:
+    """Varredura paralela da árvore do painel com os.scandir
+    
+    Cada diretório é lido por um worker e seus subdiretórios viram novas
+    tarefas. Regras de exclusão: um nome simples ('vendor') exclui o
+    diretório em qualquer nível; um caminho relativo ('public/assets') ou
+    glob ('storage/*') exclui só o que casar. O resultado é uma tabela plana
+    {caminho relativo: {'size', 'mtime_ns', 'language'}}.
+    """
+    
+    def __init__(self, root: str, excludes: Optional[List[str]] = None, workers: int = 8):
+        self.root = str(root).rstrip('/') or '/'
+        rules = DEFAULT_SCAN_EXCLUDES if excludes is None else excludes
+        self.exclude_names = {r for r in rules if '/' not in r and not any(c in r for c in '*?[')}
+        self.exclude_patterns = [r.strip('/') for r in rules if r not in self.exclude_names]
+        self.workers = max(1, workers)
+        self.stats = {'files': 0, 'directories': 0, 'seconds': 0.0}
+    
+    def _excluded(self, name: str, relative: str) -> bool:
+        if name in self.exclude_names:
+            return True
+        return any(fnmatch.fnmatchcase(relative, pattern) for pattern in self.exclude_patterns)
+    
+    def _scan_dir(self, relative: str) -> Tuple[Dict[str, Dict], List[str]]:
+        """Lê um diretório: (arquivos, subdiretórios a visitar)"""
+        files, subdirs = {}, []
+        try:
+            with os.scandir(os.path.join(self.root, relative) if relative else self.root) as entries:
+                for entry in entries:
+                    child = f"{relative}/{entry.name}" if relative else entry.name
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            if not self._excluded(entry.name, child):
+                                subdirs.append(child)
+                        elif entry.is_file(follow_symlinks=False):
+                            stat = entry.stat(follow_symlinks=False)
+                            files[child] = {
+                                'size': stat.st_size,
+                                'mtime_ns': stat.st_mtime_ns,
+                                'language': detect_language(entry.name)
+                            }
+                    except OSError:
+                        continue
+        except OSError:
+            pass
+        return files, subdirs
+    
+    def scan(self) -> Dict[str, Dict]:
+        """Varre a árvore inteira e retorna a tabela plana de arquivos"""
+        started = time.perf_counter()
+        table = {}
+        directories = 0
         
-        print(f"   📄 Arquivo: {total_lines} linhas")
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            pending = {executor.submit(self._scan_dir, '')}
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    files, subdirs = future.result()
+                    directories += 1
+                    table.update(files)
+                    pending.update(executor.submit(self._scan_dir, d) for d in subdirs)
         
-        # Detectar linguagem
-        language = self._detect_language(file_path)
-        print(f"   🔤 Linguagem: {language}")
+        self.stats = {
+            'files': len(table),
+            'directories': directories,
+            'seconds': time.perf_counter() - started
+        }
+        return table
+
+
+class PanelWatcher:
+    """Observa a árvore do painel e entrega mudanças agrupadas
+    
+    Usa inotify (via ctypes) no Linux; sem ele, compara varreduras do
+    TreeScanner a cada poll_interval. Rajadas de eventos (git pull,
+    instalação de tema) são agrupadas: on_change recebe um único lote
+    {caminho absoluto: 'changed' | 'deleted'} depois de 'debounce' segundos
+    sem eventos novos (ou após max_delay, se a rajada não acabar).
+    Um lote com a chave '*' significa que eventos foram perdidos e é
+    preciso revarrer a árvore.
+    """
+    
+    IN_MODIFY = 0x00000002
+    IN_ATTRIB = 0x00000004
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    IN_DELETE_SELF = 0x00000400
+    IN_Q_OVERFLOW = 0x00004000
+    IN_IGNORED = 0x00008000
+    IN_ISDIR = 0x40000000
+    IN_NONBLOCK = 0o4000
+    IN_CLOEXEC = 0o2000000
+    
+    WATCH_MASK = (IN_CLOSE_WRITE | IN_MODIFY | IN_ATTRIB | IN_MOVED_FROM | IN_MOVED_TO
+                  | IN_CREATE | IN_DELETE | IN_DELETE_SELF)
+    
+    def __init__(self, root: str, on_change: Callable[[Dict[str, str]], None],
+                 excludes: Optional[List[str]] = None, debounce: float = 0.5,
+                 max_delay: float = 5.0, poll_interval: float = 2.0):
+        self.root = str(root).rstrip('/')
+        self.on_change = on_change
+        self.scanner = TreeScanner(root, excludes)
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.poll_interval = poll_interval
+        self.mode = None
+        self.stats = {'events': 0, 'batches': 0}
+        self._stop = threading.Event()
+        self._thread = None
+        self._fd = None
+        self._libc = None
+        self._watches: Dict[int, str] = {}
+    
+    def start(self) -> str:
+        """Inicia o observador em segundo plano; retorna 'inotify' ou 'polling'"""
+        self.mode = 'inotify' if self._init_inotify() else 'polling'
+        target = self._run_inotify if self.mode == 'inotify' else self._run_polling
+        self._thread = threading.Thread(target=target, name='ptero-panel-watcher', daemon=True)
+        self._thread.start()
+        return self.mode
+    
+    def stop(self):
+        """Para o observador"""
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=2)
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+    
+    def _init_inotify(self) -> bool:
+        if not sys.platform.startswith('linux'):
+            return False
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+            fd = libc.inotify_init1(self.IN_NONBLOCK | self.IN_CLOEXEC)
+        except (OSError, AttributeError):
+            return False
+        if fd < 0:
+            return False
+        libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self._libc, self._fd = libc, fd
+        if self._watch_tree('') is None:
+            # Sem watch na raiz (limite de watches, permissão): usar polling
+            os.close(fd)
+            self._fd = None
+            return False
+        return True
+    
+    def _watch_tree(self, relative: str) -> Optional[List[str]]:
+        """Registra watches no diretório e nos subdiretórios não excluídos
         
-        # Análise sintática básica
-        structure = self._analyze_structure(content, language)
-        print(f"   🏗️  Estrutura: {structure['summary']}")
+        Retorna os arquivos encontrados (caminhos relativos) ou None se nem o
+        diretório inicial pôde ser observado.
+        """
+        files = []
+        pending = [relative]
+        while pending:
+            current = pending.pop()
+            path = f"{self.root}/{current}" if current else self.root
+            wd = self._libc.inotify_add_watch(self._fd, os.fsencode(path), self.WATCH_MASK)
+            if wd < 0:
+                if current == relative:
+                    return None
+                continue
+            self._watches[wd] = current
+            found, subdirs = self.scanner._scan_dir(current)
+            files.extend(found)
+            pending.extend(subdirs)
+        return files
+    
+    def _run_inotify(self):
+        changes: Dict[str, str] = {}
+        first_event = last_event = 0.0
         
-        # ANÁLISE PROFUNDA COM IA
-        print(f"   🧠 IA analisando profundamente...")
+        while not self._stop.is_set():
+            timeout = self.debounce if changes else 0.5
+            readable, _, _ = select.select([self._fd], [], [], timeout)
+            now = time.monotonic()
+            
+            if readable:
+                try:
+                    data = os.read(self._fd, 64 * 1024)
+                except BlockingIOError:
+                    data = b''
+                for relative, mask in self._parse_events(data):
+                    self.stats['events'] += 1
+                    if not changes:
+                        first_event = now
+                    last_event = now
+                    self._record(changes, relative, mask)
+            
+            if changes and (now - last_event >= self.debounce or now - first_event >= self.max_delay):
+                self._deliver(changes)
+                changes = {}
+    
+    def _parse_events(self, data: bytes) -> Iterator[Tuple[Optional[str], int]]:
+        offset = 0
+        while offset + 16 <= len(data):
+            wd, mask, _cookie, length = struct.unpack_from('iIII', data, offset)
+            name = data[offset + 16:offset + 16 + length].rstrip(b'\0').decode('utf-8', errors='surrogateescape')
+            offset += 16 + length
+            
+            if mask & self.IN_Q_OVERFLOW:
+                yield None, mask
+                continue
+            if mask & self.IN_IGNORED:
+                self._watches.pop(wd, None)
+                continue
+            directory = self._watches.get(wd)
+            if directory is None:
+                continue
+            if not name:
+                # Evento do próprio diretório (ex.: IN_DELETE_SELF)
+                yield directory, mask
+            else:
+                yield f"{directory}/{name}" if directory else name, mask
+    
+    def _record(self, changes: Dict[str, str], relative: Optional[str], mask: int):
+        if relative is None:
+            changes['*'] = 'rescan'
+            return
+        name = relative.rsplit('/', 1)[-1]
+        if self.scanner._excluded(name, relative):
+            return
+        path = f"{self.root}/{relative}" if relative else self.root
         
-        deep_analysis = self._ai_deep_read(file_path, content, language, structure)
+        if mask & (self.IN_DELETE | self.IN_MOVED_FROM | self.IN_DELETE_SELF):
+            changes[path] = 'deleted'
+        elif mask & self.IN_ISDIR:
+            if mask & (self.IN_CREATE | self.IN_MOVED_TO):
+                # Diretório novo (ou movido para dentro): observar e tratar seus arquivos como novos
+                for child in self._watch_tree(relative) or []:
+                    changes[f"{self.root}/{child}"] = 'changed'
+        else:
+            changes[path] = 'changed'
+    
+    def _run_polling(self):
+        previous = self.scanner.scan()
+        changes: Dict[str, str] = {}
+        first_event = 0.0
         
-        print(f"   ✓ Análise completa!")
+        while not self._stop.wait(self.poll_interval):
+            current = self.scanner.scan()
+            found = {
+                f"{self.root}/{relative}": 'changed'
+                for relative, info in current.items()
+                if previous.get(relative) != info
+            }
+            found.update(
+                (f"{self.root}/{relative}", 'deleted') for relative in previous if relative not in current
+            )
+            previous = current
+            self.stats['events'] += len(found)
+            
+            now = time.monotonic()
+            if found and not changes:
+                first_event = now
+            changes.update(found)
+            # A rajada acabou quando uma varredura não traz nada novo
+            if changes and (not found or now - first_event >= self.max_delay):
+                self._deliver(changes)
+                changes = {}
+    
+    def _deliver(self, changes: Dict[str, str]):
+        self.stats['batches'] += 1
+        try:
+            self.on_change(changes)
+        except Exception as e:
+            print(f"⚠️  Erro ao aplicar mudanças do painel: {e}")
+
+
+class FileNameIndex:
+    """Índice em memória dos nomes de arquivo do painel
+    
+    Mapeia nome (basename), nome sem extensão e cada sufixo de caminho
+    ('console/ServerConsole.tsx', 'server/console/ServerConsole.tsx', ...)
+    para os arquivos correspondentes, tudo em minúsculas. Uma menção vira uma
+    consulta O(1) em hash; só quando nada casa é feita a busca aproximada.
+    """
+    
+    # Diretórios onde costuma estar o código que o usuário quer editar
+    PREFERRED_DIRS = ('resources/scripts/', 'app/', 'routes/', 'config/')
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.root = ''
+        self.paths = set()
+        self.by_name: Dict[str, List[str]] = {}
+        self.by_stem: Dict[str, List[str]] = {}
+        self.by_suffix: Dict[str, List[str]] = {}
+    
+    def build(self, root: str, table: Dict[str, Dict]):
+        """Indexa os arquivos da tabela do TreeScanner (caminhos relativos a root)"""
+        with self.lock:
+            self.root = str(root).rstrip('/')
+            self.paths = set()
+            self.by_name, self.by_stem, self.by_suffix = {}, {}, {}
+            for relative in table:
+                self._add(f"{self.root}/{relative}")
+    
+    def add(self, path: str):
+        """Inclui um arquivo novo"""
+        with self.lock:
+            if path not in self.paths:
+                self._add(path)
+    
+    def remove(self, path: str):
+        """Remove um arquivo apagado"""
+        with self.lock:
+            if path not in self.paths:
+                return
+            self.paths.discard(path)
+            for index, key in self._keys(path):
+                entries = index.get(key, [])
+                if path in entries:
+                    entries.remove(path)
+                    if not entries:
+                        del index[key]
+    
+    def _add(self, path: str):
+        self.paths.add(path)
+        for index, key in self._keys(path):
+            index.setdefault(key, []).append(path)
+    
+    def _keys(self, path: str) -> Iterator[Tuple[Dict, str]]:
+        relative = path[len(self.root) + 1:] if path.startswith(self.root + '/') else path
+        parts = relative.lower().split('/')
+        yield self.by_name, parts[-1]
+        yield self.by_stem, os.path.splitext(parts[-1])[0]
+        for i in range(len(parts) - 1):
+            yield self.by_suffix, '/'.join(parts[i:])
+    
+    def lookup(self, mention: str, limit: int = 5) -> List[Tuple[str, float]]:
+        """Arquivos que correspondem a uma menção, do mais provável ao menos
+        
+        Ordem: caminho/sufixo exato, nome exato, nome sem diferenciar caixa,
+        mesmo nome com outra extensão e, por fim, nomes parecidos.
+        """
+        mention = mention.strip().replace('\\', '/')
+        if mention.startswith(self.root + '/'):
+            mention = mention[len(self.root) + 1:]
+        mention = re.sub(r'^(?:\./)+', '', mention).lstrip('/')
+        if not mention:
+            return []
+        
+        key = mention.lower()
+        name = key.rsplit('/', 1)[-1]
+        stem, extension = os.path.splitext(name)
+        scores: Dict[str, float] = {}
+        
+        def offer(paths, score):
+            for path in paths:
+                if scores.get(path, 0) < score:
+                    scores[path] = score
+        
+        with self.lock:
+            if '/' in key:
+                offer(self.by_suffix.get(key, []), 1.0)
+            candidates = self.by_name.get(name, [])
+            offer([p for p in candidates if p.endswith('/' + mention.rsplit('/', 1)[-1])], 0.95)
+            offer(candidates, 0.9)
+            offer(self.by_stem.get(stem, []), 0.7)
+            
+            if not scores:
+                names = [n for n in self.by_name if n.endswith(extension)] if extension else list(self.by_name)
+                for match in difflib.get_close_matches(name, names, n=limit, cutoff=0.75):
+                    ratio = difflib.SequenceMatcher(None, name, match).ratio()
+                    offer(self.by_name[match], round(0.6 * ratio, 3))
+        
+        def rank(path):
+            relative = path[len(self.root) + 1:]
+            preferred = any(relative.startswith(d) for d in self.PREFERRED_DIRS)
+            return (-scores[path], not preferred, relative.count('/'), relative)
+        
+        return [(path, scores[path]) for path in sorted(scores, key=rank)[:limit]]
+    
+    def __len__(self):
+        return len(self.paths)
+
+
+# Palavras sem valor de busca: palavras-chave das linguagens e do português
+_SEARCH_STOPWORDS = {
+    'const', 'let', 'var', 'function', 'return', 'import', 'export', 'from', 'default', 'this',
+    'new', 'public', 'private', 'protected', 'static', 'class', 'extends', 'implements', 'self',
+    'def', 'if', 'else', 'for', 'while', 'null', 'true', 'false', 'none', 'void', 'async', 'await',
+    'use', 'namespace', 'string', 'number', 'boolean', 'array', 'type', 'interface', 'props',
+    'de', 'do', 'da', 'dos', 'das', 'para', 'em', 'no', 'na', 'nos', 'nas', 'um', 'uma', 'que',
+    'com', 'por', 'ao', 'os', 'as', 'the', 'and', 'or', 'to', 'of', 'in', 'is', 'it'
+}
+_SEARCH_WORD = re.compile(r'[^\W\d_][^\W_]*|[0-9]+')
+_CAMEL_PART = re.compile(r'[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|[0-9]+')
+
+
+def search_terms(text: str) -> List[str]:
+    """Termos de busca: identificadores inteiros e suas partes (camelCase/snake_case)"""
+    terms = []
+    for word in _SEARCH_WORD.findall(text):
+        lower = word.lower()
+        if len(lower) > 1 and lower not in _SEARCH_STOPWORDS:
+            terms.append(lower)
+        parts = _CAMEL_PART.findall(word) if word.isascii() else []
+        if len(parts) > 1:
+            terms.extend(
+                part.lower() for part in parts
+                if len(part) > 1 and part.lower() not in _SEARCH_STOPWORDS
+            )
+    return terms
+
+
+class SymbolIndex:
+    """Índice persistente de símbolos do painel (SQLite em modo WAL)
+    
+    Guarda, para todo o código do Pterodactyl, as definições (classes,
+    componentes, funções e hooks com seus spans), as referências (nomes usados
+    em cada arquivo) e os arquivos indexados com mtime, tamanho e hash.
+    A primeira chamada de refresh() faz a varredura completa; as seguintes só
+    reprocessam arquivos cujo mtime/tamanho mudou e cujo conteúdo de fato mudou.
+    
+    Também mantém o grafo de dependências: cada import (PHP via PSR-4, TS/TSX
+    via caminhos relativos e aliases como '@/', Python via pacotes) vira uma
+    aresta para a chave de módulo do alvo, e referências a classes,
+    componentes e hooks definidos num único arquivo viram arestas de uso.
+    
+    Por fim, é um índice invertido BM25 sobre blocos do código (classes e
+    funções de topo; classes grandes entram método a método), usado para
+    levar aos prompts só os trechos relevantes para a requisição.
+    """
+    
+    SCHEMA_VERSION = 5
+    
+    # Parâmetros do BM25 e tamanho máximo de um bloco indexado
+    BM25_K1 = 1.2
+    BM25_B = 0.75
+    MAX_CHUNK_LINES = 120
+    
+    # Aliases usados quando composer.json/tsconfig.json não estão disponíveis
+    DEFAULT_PSR4 = {'Pterodactyl\\': 'app/', 'App\\': 'app/'}
+    DEFAULT_TS_ALIASES = {'@/': 'resources/scripts/'}
+    
+    _TS_IMPORT = re.compile(r"""(?:\bfrom|\bimport\s*\(?|\brequire\s*\()\s*['"]([^'"\n]+)['"]""")
+    _PHP_USE = re.compile(r'^\s*use\s+\\?([\w\\]+?)(?:\\\{([^}]*)\}|\s+as\s+\w+)?\s*;', re.MULTILINE)
+    # Uma linha só, ou a forma entre parênteses (que pode quebrar linhas)
+    _PY_FROM = re.compile(
+        r'^[ \t]*from[ \t]+(\.*)([\w.]*)[ \t]+import[ \t]*(?:\(([^)]*)\)|([\w \t,*]+))', re.MULTILINE
+    )
+    _PY_IMPORT = re.compile(r'^\s*import\s+([\w.]+(?:\s*,\s*[\w.]+)*)', re.MULTILINE)
+    _SCRIPT_EXTENSIONS = ('.js', '.jsx', '.ts', '.tsx', '.mjs', '.cjs')
+    
+    # Nomes que parecem referências a símbolos: tipos/componentes, hooks e chamadas
+    _REFERENCE = re.compile(r'\b(?:[A-Z][\w]+|use[A-Z]\w*|[a-z_]\w{2,}(?=\s*\())')
+    _NOT_REFERENCES = {'if', 'for', 'while', 'switch', 'catch', 'function', 'return', 'isset',
+                       'empty', 'array', 'list', 'print', 'len', 'range', 'super', 'require'}
+    
+    def __init__(self, db_path: Path):
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(str(db_path), check_same_thread=False, isolation_level=None)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY,
+                mtime_ns INTEGER NOT NULL,
+                size INTEGER NOT NULL,
+                hash TEXT NOT NULL,
+                language TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS symbols (
+                name TEXT NOT NULL COLLATE NOCASE,
+                kind TEXT NOT NULL,
+                path TEXT NOT NULL,
+                start INTEGER NOT NULL,
+                end INTEGER NOT NULL,
+                parent TEXT
+            );
+            CREATE TABLE IF NOT EXISTS refs (
+                name TEXT NOT NULL COLLATE NOCASE,
+                path TEXT NOT NULL,
+                line INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_symbols_name ON symbols (name);
+            CREATE INDEX IF NOT EXISTS idx_symbols_path ON symbols (path);
+            CREATE TABLE IF NOT EXISTS imports (
+                path TEXT NOT NULL,
+                module TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_refs_name ON refs (name);
+            CREATE INDEX IF NOT EXISTS idx_refs_path ON refs (path);
+            CREATE INDEX IF NOT EXISTS idx_imports_module ON imports (module);
+            CREATE INDEX IF NOT EXISTS idx_imports_path ON imports (path);
+            CREATE TABLE IF NOT EXISTS chunks (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                path TEXT NOT NULL,
+                name TEXT,
+                start INTEGER NOT NULL,
+                end INTEGER NOT NULL,
+                length INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS postings (
+                term TEXT NOT NULL,
+                chunk_id INTEGER NOT NULL,
+                tf INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_chunks_path ON chunks (path);
+            CREATE INDEX IF NOT EXISTS idx_postings_term ON postings (term);
+            CREATE INDEX IF NOT EXISTS idx_postings_chunk ON postings (chunk_id);
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value INTEGER NOT NULL
+            );
+        """)
+        
+        # Geração do índice: sobe a cada transação que altera o conteúdo indexado
+        row = self.conn.execute("SELECT value FROM meta WHERE key = 'generation'").fetchone()
+        self.generation = row[0] if row else 0
+        self._changed = False
+        
+        # Índices de versões anteriores (sem imports ou com imports mal lidos, spans antigos): reindexar tudo
+        if self.conn.execute('PRAGMA user_version').fetchone()[0] < self.SCHEMA_VERSION:
+            self.conn.execute('DELETE FROM files')
+            self.conn.execute(f'PRAGMA user_version = {self.SCHEMA_VERSION}')
+        
+        self.root = ''
+        self.psr4 = dict(self.DEFAULT_PSR4)
+        self.ts_aliases = dict(self.DEFAULT_TS_ALIASES)
+    
+    def _load_aliases(self, root: str):
+        """Lê PSR-4 do composer.json e 'paths' do tsconfig.json do painel"""
+        try:
+            with open(os.path.join(root, 'composer.json')) as f:
+                composer = json.load(f)
+            psr4 = {}
+            for section in ('autoload', 'autoload-dev'):
+                for prefix, directory in composer.get(section, {}).get('psr-4', {}).items():
+                    psr4[prefix] = (directory[0] if isinstance(directory, list) else directory).rstrip('/') + '/'
+            if psr4:
+                self.psr4 = psr4
+        except (OSError, ValueError, AttributeError):
+            pass
+        
+        try:
+            with open(os.path.join(root, 'tsconfig.json')) as f:
+                options = json.load(f).get('compilerOptions', {})
+            base = options.get('baseUrl', '.')
+            aliases = {}
+            for alias, targets in options.get('paths', {}).items():
+                if alias.endswith('/*') and targets:
+                    target = os.path.normpath(os.path.join(base, targets[0].rstrip('*')))
+                    aliases[alias[:-1]] = target.rstrip('/') + '/'
+            if aliases:
+                self.ts_aliases = aliases
+        except (OSError, ValueError, AttributeError):
+            # tsconfig com comentários não é JSON válido: ficam os padrões
+            pass
+    
+    
+    def refresh(self, root: str, table: Dict[str, Dict]) -> Dict:
+        """Sincroniza o índice com a tabela do TreeScanner (incremental por mtime e hash)"""
+        root = str(root).rstrip('/')
+        started = time.perf_counter()
+        if root != self.root:
+            self.root = root
+            self._load_aliases(root)
+        with self.lock:
+            known = {
+                path: (mtime_ns, size, digest)
+                for path, mtime_ns, size, digest in self.conn.execute(
+                    'SELECT path, mtime_ns, size, hash FROM files'
+                )
+            }
+        
+        seen = set()
+        changed = []
+        for relative, info in table.items():
+            if info['language'] != 'Python' and info['language'] not in _SCRIPT_LANGUAGES:
+                continue
+            path = f"{root}/{relative}"
+            seen.add(path)
+            entry = known.get(path)
+            if entry is None or entry[0] != info['mtime_ns'] or entry[1] != info['size']:
+                changed.append((path, entry[2] if entry else None))
+        removed = [path for path in known if path not in seen and path.startswith(root + '/')]
+        
+        reindexed = 0
+        with self._transaction():
+            for path, old_hash in changed:
+                reindexed += self._index_file(path, old_hash)
+            for path in removed:
+                self._forget(path)
         
         return {
-            'file_path': file_path,
-            'language': language,
-            'total_lines': total_lines,
-            'structure': structure,
-            'content': content,
-            'deep_analysis': deep_analysis,
-            'timestamp': datetime.now().isoformat()
+            'files': len(seen),
+            'changed': reindexed,
+            'removed': len(removed),
+            'seconds': time.perf_counter() - started
         }
     
-    def _detect_language(self, file_path: str) -> str:
-        """Detecta linguagem do arquivo"""
-        ext = Path(file_path).suffix.lower()
-        
-        lang_map = {
-            '.py': 'Python',
-            '.js': 'JavaScript',
-            '.jsx': 'React JSX',
-            '.ts': 'TypeScript',
-            '.tsx': 'React TypeScript',
-            '.php': 'PHP',
-            '.css': 'CSS',
-            '.html': 'HTML',
-            '.json': 'JSON',
-            '.md': 'Markdown'
+    def update_file(self, path: str) -> bool:
+        """Reindexa um único arquivo (ou o remove se não existe mais)"""
+        with self.lock:
+            row = self.conn.execute('SELECT hash FROM files WHERE path = ?', (path,)).fetchone()
+        with self._transaction():
+            if not os.path.exists(path):
+                self._forget(path)
+                return row is not None
+            return bool(self._index_file(path, row[0] if row else None))
+    
+    def remove_tree(self, path: str) -> int:
+        """Remove do índice um arquivo ou um diretório inteiro"""
+        path = path.rstrip('/')
+        escaped = path.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        with self._transaction():
+            paths = [
+                row[0] for row in self.conn.execute(
+                    "SELECT path FROM files WHERE path = ? OR path LIKE ? ESCAPE '\\'",
+                    (path, escaped + '/%')
+                )
+            ]
+            for indexed in paths:
+                self._forget(indexed)
+        return len(paths)
+    
+    @contextmanager
+    def _transaction(self):
+        with self.lock:
+            self.conn.execute('BEGIN')
+            self._changed = False
+            try:
+                yield
+                if self._changed:
+                    self.conn.execute(
+                        "INSERT INTO meta (key, value) VALUES ('generation', ?) "
+                        "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+                        (self.generation + 1,)
+                    )
+            except BaseException:
+                self.conn.execute('ROLLBACK')
+                raise
+            self.conn.execute('COMMIT')
+            if self._changed:
+                self.generation += 1
+    
+    def _index_file(self, path: str, old_hash: Optional[str]) -> int:
+        """Extrai símbolos e referências de um arquivo (chamar com a transação aberta)
+        
+        Retorna 1 se o conteúdo mudou e os símbolos foram regravados.
+        """
+        try:
+            stat = os.stat(path)
+            with open(path, 'rb') as f:
+                raw = f.read()
+        except OSError:
+            self._forget(path)
+            return 0
+        
+        digest = hashlib.sha256(raw).hexdigest()
+        language = detect_language(path)
+        self.conn.execute(
+            'INSERT INTO files (path, mtime_ns, size, hash, language) VALUES (?, ?, ?, ?, ?) '
+            'ON CONFLICT(path) DO UPDATE SET mtime_ns = excluded.mtime_ns, '
+            'size = excluded.size, hash = excluded.hash',
+            (path, stat.st_mtime_ns, stat.st_size, digest, language)
+        )
+        if digest == old_hash:
+            # Só o mtime mudou (touch, checkout): símbolos continuam válidos
+            return 0
+        
+        content = raw.decode('utf-8', errors='ignore')
+        structure = extract_structure(content, language)
+        
+        symbols = []
+        for kind, entries in (('class', structure['classes']), ('component', structure['components']),
+                              ('function', structure['functions'])):
+            for symbol in entries:
+                symbol_kind = 'hook' if kind == 'function' and re.match(r'use[A-Z]', symbol['name']) else kind
+                symbols.append((symbol['name'], symbol_kind, path, symbol['start'],
+                                symbol['end'], symbol.get('parent')))
+        
+        references = {}
+        line, last_pos = 1, 0
+        for match in self._REFERENCE.finditer(content):
+            name = match.group()
+            if name in references or name in self._NOT_REFERENCES:
+                continue
+            line += content.count('\n', last_pos, match.start())
+            last_pos = match.start()
+            references[name] = line
+        
+        modules = self._imported_modules(path, content, language)
+        
+        self._forget(path, keep_file=True)
+        self.conn.executemany('INSERT INTO symbols VALUES (?, ?, ?, ?, ?, ?)', symbols)
+        self.conn.executemany(
+            'INSERT INTO refs VALUES (?, ?, ?)',
+            [(name, path, line) for name, line in references.items()]
+        )
+        self.conn.executemany('INSERT INTO imports VALUES (?, ?)', [(path, m) for m in modules])
+        
+        lines = content.split('\n')
+        for name, start, end in self._chunk_spans(structure, len(lines)):
+            counts = Counter(search_terms('\n'.join(lines[start - 1:end])))
+            if not counts:
+                continue
+            chunk_id = self.conn.execute(
+                'INSERT INTO chunks (path, name, start, end, length) VALUES (?, ?, ?, ?, ?)',
+                (path, name, start, end, sum(counts.values()))
+            ).lastrowid
+            self.conn.executemany(
+                'INSERT INTO postings VALUES (?, ?, ?)',
+                [(term, chunk_id, tf) for term, tf in counts.items()]
+            )
+        return 1
+    
+    def _chunk_spans(self, structure: Dict, total_lines: int) -> List[Tuple[Optional[str], int, int]]:
+        """Blocos indexados: símbolos de topo; os grandes descem para os filhos ou janelas"""
+        symbols = [
+            s for kind in ('classes', 'components', 'functions') for s in structure.get(kind, [])
+        ]
+        children: Dict[str, List[Dict]] = {}
+        for symbol in symbols:
+            if symbol.get('parent'):
+                children.setdefault(symbol['parent'], []).append(symbol)
+        
+        def windows(name, start, end):
+            step = self.MAX_CHUNK_LINES
+            return [(name, s, min(end, s + step - 1)) for s in range(start, end + 1, step)]
+        
+        spans = []
+        for symbol in sorted((s for s in symbols if not s.get('parent')), key=lambda s: s['start']):
+            start, end = symbol['start'], symbol['end']
+            if end - start < self.MAX_CHUNK_LINES:
+                spans.append((symbol['name'], start, end))
+            elif symbol['name'] in children:
+                for child in children[symbol['name']]:
+                    spans.extend(windows(f"{symbol['name']}.{child['name']}", child['start'], child['end']))
+            else:
+                spans.extend(windows(symbol['name'], start, end))
+        
+        # Arquivos sem símbolos (configs, rotas, scripts) entram em janelas
+        return spans or windows(None, 1, total_lines)
+    
+    def _forget(self, path: str, keep_file: bool = False):
+        self._changed = True
+        self.conn.execute(
+            'DELETE FROM postings WHERE chunk_id IN (SELECT id FROM chunks WHERE path = ?)', (path,)
+        )
+        tables = ('symbols', 'refs', 'imports', 'chunks')
+        for table in tables if keep_file else ('files',) + tables:
+            self.conn.execute(f'DELETE FROM {table} WHERE path = ?', (path,))
+    
+    def search(self, query: str, limit: int = 8, boost_paths: Optional[List[str]] = None) -> List[Dict]:
+        """Blocos de código mais relevantes para a consulta (BM25)
+        
+        Arquivos em boost_paths (os alvos da requisição) pesam 50% a mais.
+        """
+        terms = list(dict.fromkeys(search_terms(query)))
+        if not terms:
+            return []
+        
+        marks = ', '.join('?' * len(terms))
+        with self.lock:
+            total, average = self.conn.execute('SELECT COUNT(*), AVG(length) FROM chunks').fetchone()
+            if not total:
+                return []
+            frequencies = dict(self.conn.execute(
+                f'SELECT term, COUNT(*) FROM postings WHERE term IN ({marks}) GROUP BY term', terms
+            ).fetchall())
+            rows = self.conn.execute(f"""
+                SELECT p.term, p.tf, c.id, c.path, c.name, c.start, c.end, c.length
+                FROM postings p JOIN chunks c ON c.id = p.chunk_id
+                WHERE p.term IN ({marks})
+            """, terms).fetchall()
+        
+        idf = {
+            term: math.log(1 + (total - df + 0.5) / (df + 0.5)) for term, df in frequencies.items()
         }
+        k1, b = self.BM25_K1, self.BM25_B
+        boost = set(boost_paths or [])
+        scores: Dict[int, float] = {}
+        chunks: Dict[int, Dict] = {}
+        for term, tf, chunk_id, path, name, start, end, length in rows:
+            weight = idf[term] * tf * (k1 + 1) / (tf + k1 * (1 - b + b * length / average))
+            scores[chunk_id] = scores.get(chunk_id, 0.0) + weight
+            chunks[chunk_id] = {'path': path, 'name': name, 'start': start, 'end': end}
         
-        return lang_map.get(ext, 'Unknown')
+        for chunk_id, chunk in chunks.items():
+            if chunk['path'] in boost:
+                scores[chunk_id] *= 1.5
+        
+        best = heapq.nlargest(limit, scores, key=scores.get)
+        return [{**chunks[chunk_id], 'score': round(scores[chunk_id], 3)} for chunk_id in best]
     
-    def _analyze_structure(self, content: str, language: str) -> Dict:
-        """Analisa estrutura do código"""
-        
-        structure = {
-            'functions': [],
-            'classes': [],
-            'imports': [],
-            'exports': [],
-            'components': [],
-            'hooks': [],
-            'summary': ''
+    @staticmethod
+    def _module_keys(path: str) -> List[str]:
+        """Chaves pelas quais um arquivo pode ser importado
+        
+        O caminho completo, o caminho sem extensão e, para index.* e
+        __init__.py, o próprio diretório.
+        """
+        stem, _ = os.path.splitext(path)
+        keys = [path, stem]
+        if os.path.basename(stem) in ('index', '__init__'):
+            keys.append(os.path.dirname(stem))
+        return keys
+    
+    def _imported_modules(self, path: str, content: str, language: str) -> Set[str]:
+        """Chaves de módulo (caminhos absolutos sem extensão) importadas pelo arquivo"""
+        root = self.root or os.path.dirname(path)
+        directory = os.path.dirname(path)
+        modules = set()
+        
+        if language == 'PHP':
+            prefixes = sorted(self.psr4.items(), key=lambda item: -len(item[0]))
+            for match in self._PHP_USE.finditer(content):
+                base, group = match.group(1), match.group(2)
+                names = [f"{base}\\{n.strip()}" for n in group.split(',') if n.strip()] if group else [base]
+                for fqcn in names:
+                    for prefix, target in prefixes:
+                        if fqcn.startswith(prefix):
+                            relative = fqcn[len(prefix):].replace('\\', '/')
+                            modules.add(os.path.join(root, target, relative))
+                            break
+        
+        elif language == 'Python':
+            for match in self._PY_FROM.finditer(content):
+                dots, module, grouped, inline = match.groups()
+                if dots:
+                    base = directory
+                    for _ in range(len(dots) - 1):
+                        base = os.path.dirname(base)
+                else:
+                    base = root
+                target = os.path.join(base, *module.split('.')) if module else base
+                modules.add(target)
+                names = re.sub(r'#[^\n]*', '', grouped) if grouped is not None else inline
+                for name in names.split(','):
+                    name = name.split()[0] if name.split() else ''
+                    if name and name != '*':
+                        modules.add(os.path.join(target, name))
+            for match in self._PY_IMPORT.finditer(content):
+                for module in match.group(1).split(','):
+                    modules.add(os.path.join(root, *module.strip().split('.')))
+        
+        else:
+            for match in self._TS_IMPORT.finditer(content):
+                spec = match.group(1)
+                if spec.startswith('.'):
+                    target = os.path.normpath(os.path.join(directory, spec))
+                else:
+                    alias = next((a for a in self.ts_aliases if spec.startswith(a)), None)
+                    if alias is None:
+                        continue  # pacote do node_modules
+                    target = os.path.normpath(os.path.join(root, self.ts_aliases[alias], spec[len(alias):]))
+                if target.endswith(self._SCRIPT_EXTENSIONS):
+                    target = os.path.splitext(target)[0]
+                modules.add(target)
+        
+        return modules
+    
+    def dependents(self, path: str, max_depth: int = 8, limit: int = 500) -> Dict[str, int]:
+        """Arquivos que dependem de path, direta ou transitivamente
+        
+        Retorna {caminho: distância}. Segue imports e usos de classes,
+        componentes e hooks definidos num único arquivo.
+        """
+        found: Dict[str, int] = {}
+        frontier = [path]
+        depth = 0
+        
+        with self.lock:
+            while frontier and depth < max_depth and len(found) < limit:
+                depth += 1
+                keys = [key for p in frontier for key in self._module_keys(p)]
+                marks = ', '.join('?' * len(keys))
+                importers = self.conn.execute(
+                    f'SELECT DISTINCT path FROM imports WHERE module IN ({marks})', keys
+                ).fetchall()
+                
+                marks = ', '.join('?' * len(frontier))
+                users = self.conn.execute(f"""
+                    SELECT DISTINCT r.path FROM symbols s JOIN refs r ON r.name = s.name
+                    WHERE s.path IN ({marks}) AND s.parent IS NULL
+                      AND s.kind IN ('class', 'component', 'hook') AND r.path != s.path
+                      AND NOT EXISTS (
+                          SELECT 1 FROM symbols o
+                          WHERE o.name = s.name AND o.path != s.path AND o.parent IS NULL
+                      )
+                """, frontier).fetchall()
+                
+                frontier = []
+                for (dependent,) in importers + users:
+                    if dependent != path and dependent not in found:
+                        found[dependent] = depth
+                        frontier.append(dependent)
+        
+        return found
+    
+    def definitions(self, name: str, kinds: Optional[List[str]] = None) -> List[Dict]:
+        """Onde um símbolo é definido (nome sem diferenciar caixa)"""
+        sql = 'SELECT name, kind, path, start, end, parent FROM symbols WHERE name = ?'
+        params = [name]
+        if kinds:
+            sql += f" AND kind IN ({', '.join('?' * len(kinds))})"
+            params.extend(kinds)
+        with self.lock:
+            rows = self.conn.execute(sql, params).fetchall()
+        
+        # Classes e componentes antes de funções; nome com a mesma caixa primeiro
+        order = {'class': 0, 'component': 0, 'hook': 1, 'function': 2}
+        rows.sort(key=lambda r: (r[0] != name, order.get(r[1], 3), r[5] is not None, len(r[2])))
+        return [
+            {'name': r[0], 'kind': r[1], 'path': r[2], 'start': r[3], 'end': r[4], 'parent': r[5]}
+            for r in rows
+        ]
+    
+    def references(self, name: str, limit: int = 50) -> List[Dict]:
+        """Arquivos que usam um símbolo"""
+        with self.lock:
+            rows = self.conn.execute(
+                'SELECT path, line FROM refs WHERE name = ? ORDER BY path LIMIT ?', (name, limit)
+            ).fetchall()
+        return [{'path': path, 'line': line} for path, line in rows]
+    
+    def stats(self) -> Dict:
+        """Totais de arquivos, símbolos e referências"""
+        with self.lock:
+            return {
+                table: self.conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+                for table in ('files', 'symbols', 'refs', 'imports', 'chunks')
+            }
+    
+    def close(self):
+        """Fecha o banco"""
+        with self.lock:
+            self.conn.close()
+
+
+class DecisionJournal:
+    """Diário persistente de decisões (SQLite, somente inserção)
+    
+    Cada decisão vira um registro compacto (requisição, ação, confiança,
+    nível de segurança, riscos, plano e arquivos) indexado por data, ação,
+    nível de segurança e arquivo. Só as últimas decisões ficam em memória.
+    """
+    
+    def __init__(self, db_path: Path, tail_size: int = 50):
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(str(db_path), check_same_thread=False, isolation_level=None)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS decisions (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                ts REAL NOT NULL,
+                action TEXT NOT NULL,
+                security_level TEXT,
+                record TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS decision_files (
+                decision_id INTEGER NOT NULL,
+                path TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_decisions_ts ON decisions (ts);
+            CREATE INDEX IF NOT EXISTS idx_decisions_action ON decisions (action, ts);
+            CREATE INDEX IF NOT EXISTS idx_decisions_level ON decisions (security_level, ts);
+            CREATE INDEX IF NOT EXISTS idx_decision_files_path ON decision_files (path);
+        """)
+        self.tail = deque(reversed(self.query(limit=tail_size)), maxlen=tail_size)
+    
+    def append(self, user_request: str, decision: AIDecision, files: List[str]) -> Dict:
+        """Registra uma decisão"""
+        validation = decision.validation
+        record = {
+            'ts': time.time(),
+            'request': user_request,
+            'action': decision.action,
+            'confidence': decision.confidence,
+            'security_level': validation.security_level.value if validation else None,
+            'risks': validation.risks if validation else [],
+            'plan': decision.execution_plan,
+            'files': files
         }
         
-        lines = content.split('\n')
-        
-        if language == 'Python':
-            # Funções
-            for i, line in enumerate(lines, 1):
-                if line.strip().startswith('def '):
-                    func_name = line.strip().split('(')[0].replace('def ', '')
-                    structure['functions'].append({
-                        'name': func_name,
-                        'line': i
-                    })
-                elif line.strip().startswith('class '):
-                    class_name = line.strip().split('(')[0].replace('class ', '').replace(':', '')
-                    structure['classes'].append({
-                        'name': class_name,
-                        'line': i
-                    })
-                elif line.strip().startswith(('import ', 'from ')):
-                    structure['imports'].append(line.strip())
-        
-        elif language in ['JavaScript', 'TypeScript', 'React JSX', 'React TypeScript']:
-            for i, line in enumerate(lines, 1):
-                stripped = line.strip()
-                
-                # Funções
-                if 'function ' in stripped or '=>' in stripped:
-                    if 'function ' in stripped:
-                        func_match = re.search(r'function\s+(\w+)', stripped)
-                        if func_match:
-                            structure['functions'].append({
-                                'name': func_match.group(1),
-                                'line': i
-                            })
-                    elif 'const ' in stripped and '=>' in stripped:
-                        func_match = re.search(r'const\s+(\w+)\s*=', stripped)
-                        if func_match:
-                            structure['functions'].append({
-                                'name': func_match.group(1),
-                                'line': i
-                            })
-                
-                # Classes/Components
-                if 'class ' in stripped:
-                    class_match = re.search(r'class\s+(\w+)', stripped)
-                    if class_match:
-                        structure['classes'].append({
-                            'name': class_match.group(1),
-                            'line': i
-                        })
-                
-                # Componentes React
-                if re.search(r'(const|function)\s+([A-Z]\w+)', stripped):
-                    comp_match = re.search(r'(const|function)\s+([A-Z]\w+)', stripped)
-                    if comp_match:
-                        structure['components'].append({
-                            'name': comp_match.group(2),
-                            'line': i
-                        })
-                
-                # Hooks React
-                if 'useState' in stripped or 'useEffect' in stripped or 'use' in stripped:
-                    hook_match = re.search(r'use\w+', stripped)
-                    if hook_match:
-                        if hook_match.group() not in structure['hooks']:
-                            structure['hooks'].append(hook_match.group())
-                
-                # Imports
-                if stripped.startswith('import '):
-                    structure['imports'].append(stripped)
-                
-                # Exports
-                if stripped.startswith('export '):
-                    structure['exports'].append(stripped)
-        
-        # Gerar summary
-        parts = []
-        if structure['classes']:
-            parts.append(f"{len(structure['classes'])} classes")
-        if structure['components']:
-            parts.append(f"{len(structure['components'])} components")
-        if structure['functions']:
-            parts.append(f"{len(structure['functions'])} functions")
-        if structure['hooks']:
-            parts.append(f"{len(structure['hooks'])} hooks")
-        
-        structure['summary'] = ', '.join(parts) if parts else 'código simples'
-        
-        return structure
+        with self.lock:
+            self.conn.execute('BEGIN')
+            try:
+                cursor = self.conn.execute(
+                    'INSERT INTO decisions (ts, action, security_level, record) VALUES (?, ?, ?, ?)',
+                    (record['ts'], record['action'], record['security_level'],
+                     json.dumps(record, ensure_ascii=False, separators=(',', ':')))
+                )
+                self.conn.executemany(
+                    'INSERT INTO decision_files (decision_id, path) VALUES (?, ?)',
+                    [(cursor.lastrowid, path) for path in files]
+                )
+                self.conn.execute('COMMIT')
+            except BaseException:
+                self.conn.execute('ROLLBACK')
+                raise
+            self.tail.append(record)
+        return record
     
-    def _ai_deep_read(self, file_path: str, content: str, language: str, structure: Dict) -> Dict:
-        """IA lê e ENTENDE profundamente o código"""
+    def query(self, since: Optional[float] = None, until: Optional[float] = None,
+              action: Optional[str] = None, file: Optional[str] = None,
+              security_level: Optional[str] = None, limit: int = 50) -> List[Dict]:
+        """Busca decisões (mais recentes primeiro)
         
-        # Limitar conteúdo para não estourar token limit
-        content_preview = '\n'.join(content.split('\n')[:200])  # Primeiras 200 linhas
+        'file' casa com o final do caminho (ex.: 'Foo.tsx' ou 'server/Foo.tsx').
+        """
+        sql = 'SELECT DISTINCT d.id, d.record FROM decisions d'
+        where, params = [], []
+        if file:
+            sql += ' JOIN decision_files f ON f.decision_id = d.id'
+            where.append("(f.path = ? OR f.path LIKE ? ESCAPE '\\')")
+            escaped = file.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+            params.extend([file, f'%/{escaped}'])
+        if since is not None:
+            where.append('d.ts >= ?')
+            params.append(since)
+        if until is not None:
+            where.append('d.ts < ?')
+            params.append(until)
+        if action:
+            where.append('d.action = ?')
+            params.append(action)
+        if security_level:
+            where.append('d.security_level = ?')
+            params.append(security_level)
+        if where:
+            sql += ' WHERE ' + ' AND '.join(where)
+        sql += ' ORDER BY d.ts DESC, d.id DESC LIMIT ?'
+        params.append(limit)
         
-        prompt = f"""Você é um especialista em {language} analisando código em profundidade.
-
-ARQUIVO: {file_path}
-LINGUAGEM: {language}
-ESTRUTURA DETECTADA:
-- Classes: {[c['name'] for c in structure['classes']]}
-- Componentes: {[c['name'] for c in structure['components']]}
-- Funções: {[f['name'] for f in structure['functions']]}
-- Hooks: {structure['hooks']}
-
-CÓDIGO (primeiras 200 linhas):
-```{language.lower()}
-{content_preview}
-```
-
-ANALISE PROFUNDAMENTE:
-
-1. **Propósito do Arquivo**
-   - O que este arquivo faz?
-   - Qual sua responsabilidade?
-
-2. **Estrutura e Organização**
-   - Como está organizado?
-   - Segue boas práticas?
-
-3. **Dependências e Imports**
-   - Quais bibliotecas usa?
-   - Há dependências circulares?
-
-4. **Componentes/Classes Principais**
-   - O que cada um faz?
-   - Como se relacionam?
-
-5. **Estado e Dados**
-   - Como gerencia estado?
-   - Quais dados manipula?
-
-6. **Lógica de Negócio**
-   - Principais funções e fluxos
-   - Validações e regras
-
-7. **Pontos de Atenção**
-   - Código complexo ou frágil
-   - Áreas que requerem cuidado
-   - Possíveis bugs
+        with self.lock:
+            rows = self.conn.execute(sql, params).fetchall()
+        return [json.loads(record) for _, record in rows]
+    
+    def recent(self, limit: int = 10) -> List[Dict]:
+        """Últimas decisões (mais recentes primeiro), servidas da memória quando cabem nela"""
+        if limit > self.tail.maxlen:
+            return self.query(limit=limit)
+        with self.lock:
+            return list(reversed(self.tail))[:limit]
+    
+    def close(self):
+        """Fecha o banco"""
+        with self.lock:
+            self.conn.close()
 
-8. **Como Editar com Segurança**
-   - Onde é seguro adicionar código
-   - O que NÃO deve ser tocado
-   - Dependências a considerar
 
-Responda em JSON:
-{{
-  "purpose": "propósito principal",
-  "main_components": ["lista de componentes principais"],
-  "key_functions": ["funções críticas"],
-  "state_management": "como gerencia estado",
-  "dependencies": ["dependências importantes"],
-  "complexity_level": "low|medium|high",
-  "safe_edit_zones": ["áreas seguras para editar"],
-  "danger_zones": ["áreas PERIGOSAS - não tocar"],
-  "recommendations": ["recomendações para edição"],
-  "understanding_score": 0.0-1.0
-}}
-"""
-        
-        try:
-            response = self.model.generate_content(
-                prompt,
-                generation_config={
-                    'temperature': 0.1,
-                    'max_output_tokens': 4096
-                }
-            )
-            text = response.text
-            
-            # Extrair JSON
-            start = text.find('{')
-            end = text.rfind('}') + 1
-            
-            if start >= 0 and end > start:
-                analysis = json.loads(text[start:end])
-                
-                # Adicionar insights textuais
-                analysis['full_text'] = text
-                
-                return analysis
-        except Exception as e:
-            print(f"   ⚠️  Erro na análise IA: {e}")
-        
+class FileKnowledge:
+    """Conhecimento dos arquivos analisados, enxuto e com limite de entradas
+    
+    Cada entrada guarda só o hash do conteúdo, os spans dos símbolos e os
+    campos compactos da leitura profunda; o conteúdo nunca fica em memória.
+    Acima de max_entries, as análises usadas há mais tempo são descartadas
+    (LRU).
+    """
+    
+    DEEP_FIELDS = ('purpose', 'complexity_level', 'key_functions', 'safe_edit_zones',
+                   'danger_zones', 'recommendations', 'understanding_score', 'fallback')
+    
+    def __init__(self, max_entries: int = 64):
+        self.lock = threading.Lock()
+        self.max_entries = max(1, max_entries)
+        self.entries: 'OrderedDict[str, Dict]' = OrderedDict()
+        self.evictions = 0
+    
+    @classmethod
+    def compact(cls, analysis: Dict) -> Dict:
+        """Reduz uma análise completa ao que precisa ficar residente"""
+        structure = analysis.get('structure', {})
+        deep = analysis.get('deep_analysis', {})
         return {
-            'purpose': 'Não foi possível determinar',
-            'understanding_score': 0.3
+            'file_path': analysis.get('file_path'),
+            'content_hash': analysis.get('content_hash'),
+            'language': analysis.get('language'),
+            'total_lines': analysis.get('total_lines', 0),
+            'symbols': [
+                (kind, symbol['name'], symbol['start'], symbol['end'])
+                for kind in ('classes', 'components', 'functions')
+                for symbol in structure.get(kind, [])
+            ],
+            'deep_analysis': {key: deep[key] for key in cls.DEEP_FIELDS if key in deep},
+            'timestamp': analysis.get('timestamp')
         }
+    
+    def __setitem__(self, path: str, analysis: Dict):
+        entry = self.compact(analysis)
+        with self.lock:
+            self.entries[path] = entry
+            self.entries.move_to_end(path)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+    
+    def get(self, path: str, default: Optional[Dict] = None) -> Optional[Dict]:
+        with self.lock:
+            entry = self.entries.get(path)
+            if entry is None:
+                return default
+            self.entries.move_to_end(path)
+            return entry
+    
+    def pop(self, path: str, default: Optional[Dict] = None) -> Optional[Dict]:
+        with self.lock:
+            return self.entries.pop(path, default)
+    
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+    
+    def items(self) -> List[Tuple[str, Dict]]:
+        """Cópia das entradas, da usada há mais tempo à mais recente"""
+        with self.lock:
+            return list(self.entries.items())
+    
+    def __contains__(self, path: str) -> bool:
+        with self.lock:
+            return path in self.entries
+    
+    def __iter__(self) -> Iterator[str]:
+        with self.lock:
+            return iter(list(self.entries))
+    
+    def __len__(self):
+        return len(self.entries)
 
 
 class SmartAIEngine:
     """Motor de IA com múltiplas camadas de inteligência"""
     
-    def __init__(self, api_key: str, context_cache: ContextCache):
-        genai.configure(api_key=api_key)
+    # Trechos de código levados ao prompt do plano: candidatos e orçamento de tokens
+    RETRIEVAL_TOP_K = 8
+    RETRIEVAL_TOKEN_BUDGET = 2000
+    
+    # Menções de arquivo só viram alvo com nome exato (0.9+ no FileNameIndex);
+    # mesmo nome-base ou nome parecido vai ao plano apenas como sugestão
+    TARGET_MIN_SCORE = 0.9
+    
+    def __init__(self, api_key: str, context_cache: ContextCache,
+                 analysis_workers: int = 4, analysis_timeout: float = 120.0,
+                 knowledge_max_entries: int = 64, security_rules_file: Optional[str] = None):
+        model_registry.configure(api_key)
         
         # Modelo principal (raciocínio)
-        self.main_model = genai.GenerativeModel('gemini-1.5-flash')
+        self.main_model = model_registry.get('gemini-1.5-flash')
         
         # Modelo de validação (crítico)
-        self.validator_model = genai.GenerativeModel('gemini-1.5-flash')
+        self.validator_model = model_registry.get('gemini-1.5-flash')
         
         self.cache = context_cache
-        self.validator = AIValidator(self.validator_model)
-        self.code_analyzer = CodeAnalyzer(self.main_model)  # NOVO!
-        self.chat = self.main_model.start_chat(history=[])
-        self.decision_history = []
-        self.file_knowledge = {}  # Cache de conhecimento de arquivos
+        self.symbol_index = SymbolIndex(context_cache.cache_dir / 'symbols.db')
+        self.security_rules = (SecurityRuleEngine.load(security_rules_file) if security_rules_file
+                               else SecurityRuleEngine(DEFAULT_SECURITY_RULES))
+        self.validator = AIValidator(self.validator_model, self.symbol_index, self.security_rules)
+        self.code_analyzer = CodeAnalyzer(self.main_model, context_cache)
+        self.journal = DecisionJournal(context_cache.cache_dir / 'decisions.db')
+        self.file_index = FileNameIndex()
+        self.file_knowledge = FileKnowledge(knowledge_max_entries)  # Análises compactas (LRU)
+        self.pipeline_workers = 4  # Etapas do pipeline executadas em paralelo
+        self.inflight_requests = SingleFlight()
+        self.analysis_workers = analysis_workers  # Arquivos analisados em paralelo
+        self.analysis_timeout = analysis_timeout  # Prazo por arquivo (segundos)
     
     def analyze_request(self, user_request: str, system_context: Dict) -> AIDecision:
         """Analisa requisição do usuário com inteligência avançada"""
         
+        # Arquivos alvo são resolvidos antes do cache: a chave depende do conteúdo deles
+        target_files = self._identify_target_files(user_request)
+        
         # Verificar cache
-        cache_key = hashlib.md5(user_request.encode()).hexdigest()
+        cache_key = self._request_cache_key(user_request, target_files, system_context)
         cached = self.cache.get(f"request_{cache_key}")
         
         if cached:
             print("💾 Resposta recuperada do cache")
-            return AIDecision(**cached)
+            return AIDecision.from_dict(cached)
+        
+        # Requisições idênticas simultâneas compartilham uma única execução
+        decision, shared = self.inflight_requests.do(
+            cache_key,
+            lambda: self._run_analysis(user_request, system_context, target_files, cache_key)
+        )
+        if shared:
+            print("🔗 Análise idêntica já em andamento - resultado compartilhado")
+        return decision
+    
+    def _run_analysis(self, user_request: str, system_context: Dict,
+                      target_files: List[str], cache_key: str) -> AIDecision:
+        """Executa o pipeline completo de análise (sem consultar o cache)"""
         
         # Análise em múltiplas etapas
         print("🧠 Analisando requisição em múltiplas camadas...")
         
-        # Etapa 1: Compreensão da intenção
-        intent = self._analyze_intent(user_request)
-        print(f"   1/6 Intenção: {intent['type']}")
-        
-        # Etapa 2: Identificar arquivos alvos
-        target_files = self._identify_target_files(user_request, intent)
-        print(f"   2/6 Arquivos alvo: {len(target_files)}")
+        # As etapas formam um grafo de dependências: etapas independentes
+        # (intenção x leitura dos arquivos, validação x alternativas) rodam em
+        # paralelo e a latência total cai para o caminho crítico
+        def stage_intent():
+            # Etapa 1: Compreensão da intenção
+            intent = self._analyze_intent(user_request)
+            print(f"   1/6 Intenção: {intent['type']}")
+            if not target_files and 'target' in intent:
+                # Buscar baseado no alvo do intent
+                print(f"   🔎 Buscando arquivo para: {intent['target']}")
+            return intent
         
-        # Etapa 2.5: ANÁLISE PROFUNDA DOS ARQUIVOS (NOVO!)
-        files_analysis = {}
-        if target_files:
+        def stage_files():
+            # Etapa 2: ANÁLISE PROFUNDA DOS ARQUIVOS ALVO
+            print(f"   2/6 Arquivos alvo: {len(target_files)}")
+            if not target_files:
+                return {}
+            
             print(f"\n   🔍 ANALISANDO ARQUIVOS PROFUNDAMENTE...")
-            for file_path in target_files:
-                if file_path not in self.file_knowledge:
-                    analysis = self.code_analyzer.deep_analyze_file(file_path)
-                    self.file_knowledge[file_path] = analysis
-                    files_analysis[file_path] = analysis
+            # O analisador reaproveita o cache persistente se o conteúdo não mudou
+            files_analysis = self.code_analyzer.analyze_files(
+                target_files, max_workers=self.analysis_workers, timeout=self.analysis_timeout
+            )
+            for file_path, analysis in files_analysis.items():
+                if 'error' in analysis:
+                    print(f"   ⚠️  {file_path}: {analysis['error']}")
                 else:
-                    print(f"   💾 {file_path} já analisado (cache)")
-                    files_analysis[file_path] = self.file_knowledge[file_path]
+                    self.file_knowledge[file_path] = analysis
+            return files_analysis
         
-        # Etapa 3: Análise de contexto (agora com conhecimento dos arquivos)
-        context_analysis = self._analyze_context(user_request, system_context, files_analysis)
-        print(f"   3/6 Contexto: {len(context_analysis['relevant_files'])} arquivos relevantes")
+        def stage_context(files):
+            # Etapa 3: Análise de contexto (com conhecimento dos arquivos)
+            context_analysis = self._analyze_context(user_request, system_context, files)
+            print(f"   3/6 Contexto: {len(context_analysis['relevant_files'])} arquivos relevantes")
+            return context_analysis
         
-        # Etapa 4: Geração de plano de execução (com conhecimento profundo)
-        execution_plan = self._generate_execution_plan_smart(
-            user_request, intent, context_analysis, files_analysis
-        )
-        print(f"   4/6 Plano: {len(execution_plan)} etapas")
+        def stage_plan(intent, context, files):
+            # Etapa 4: Geração de plano de execução (com conhecimento profundo)
+            execution_plan = self._generate_execution_plan_smart(user_request, intent, context, files)
+            print(f"   4/6 Plano: {len(execution_plan)} etapas")
+            return execution_plan
+        
+        def stage_validation(plan):
+            # Etapa 5: Validação de segurança
+            validation = self._validate_plan(plan, system_context)
+            print(f"   5/6 Segurança: {validation.security_level.value}")
+            return validation
         
-        # Etapa 5: Validação de segurança
-        validation = self._validate_plan(execution_plan, system_context)
-        print(f"   5/6 Segurança: {validation.security_level.value}")
+        def stage_alternatives(plan):
+            # Etapa 6: Geração de alternativas
+            alternatives = self._generate_alternatives(user_request, plan)
+            print(f"   6/6 Alternativas: {len(alternatives)}")
+            return alternatives
         
-        # Etapa 6: Geração de alternativas
-        alternatives = self._generate_alternatives(user_request, execution_plan)
-        print(f"   6/6 Alternativas: {len(alternatives)}")
+        results = (
+            StageGraph(max_workers=self.pipeline_workers)
+            .add('intent', stage_intent)
+            .add('files', stage_files)
+            .add('context', stage_context, deps=['files'])
+            .add('plan', stage_plan, deps=['intent', 'context', 'files'])
+            .add('validation', stage_validation, deps=['plan'])
+            .add('alternatives', stage_alternatives, deps=['plan'])
+            .run()
+        )
+        intent = results['intent']
+        files_analysis = results['files']
+        execution_plan = results['plan']
+        validation = results['validation']
+        alternatives = results['alternatives']
         
         # Criar decisão
         decision = AIDecision(
@@ -688,45 +4030,79 @@ class SmartAIEngine:
         self.cache.set(f"request_{cache_key}", decision.__dict__)
         
         # Adicionar ao histórico
-        self.decision_history.append({
-            'timestamp': datetime.now().isoformat(),
-            'request': user_request,
-            'decision': decision.__dict__,
-            'files_analyzed': list(files_analysis.keys())
-        })
+        self.journal.append(user_request, decision, list(files_analysis.keys()))
         
         return decision
     
-    def _identify_target_files(self, user_request: str, intent: Dict) -> List[str]:
-        """Identifica quais arquivos serão afetados"""
-        
-        target_files = []
+    def _request_cache_key(self, user_request: str, target_files: List[str], system_context: Dict) -> str:
+        """Chave do cache de requisições
         
-        # Extrair menções diretas de arquivos
-        file_patterns = re.findall(r'[\w/\.-]+\.(tsx?|jsx?|php|py|css|json)', user_request, re.IGNORECASE)
+        Combina o texto normalizado (caixa e espaços), a impressão digital do
+        conteúdo de cada arquivo alvo, a versão do contexto do sistema e a
+        geração do índice de símbolos (trechos e definições do prompt vêm de
+        outros arquivos): um arquivo editado invalida o plano, uma digitação
+        diferente não.
+        """
+        normalized = ' '.join(user_request.lower().split())
+        parts = [normalized, context_version(system_context), f"index:{self.symbol_index.generation}"]
+        parts.extend(f"{path}:{file_fingerprint(path)}" for path in sorted(target_files))
+        return hashlib.sha256('\n'.join(parts).encode('utf-8')).hexdigest()
+    
+    def _identify_target_files(self, user_request: str) -> List[str]:
+        """Identifica quais arquivos serão afetados"""
         
-        for file_pattern in file_patterns:
-            # Buscar arquivo no sistema
-            possible_paths = [
-                f"/var/www/pterodactyl/{file_pattern}",
-                f"/var/www/pterodactyl/resources/scripts/{file_pattern}",
-                f"/var/www/pterodactyl/resources/scripts/components/{file_pattern}",
-                f"/var/www/pterodactyl/app/Http/Controllers/{file_pattern}",
-            ]
-            
-            for path in possible_paths:
-                if Path(path).exists():
-                    target_files.append(path)
-                    break
+        # Menções diretas de arquivos, resolvidas pelo índice de nomes do painel
+        target_files, suggestions = self._resolve_file_mentions(user_request)
+        for mention, path in suggestions.items():
+            print(f"   🔎 '{mention}' não encontrado; parecido: {path} (sugestão, não será editado)")
         
-        # Se não encontrou arquivo explícito, usar intent
-        if not target_files and 'target' in intent:
-            # Buscar baseado no alvo do intent
-            target = intent['target']
-            print(f"   🔎 Buscando arquivo para: {target}")
+        # Símbolos citados (componentes, classes, hooks) resolvidos pelo índice
+        for name in self._mentioned_symbols(user_request):
+            definitions = [d for d in self.symbol_index.definitions(name) if d['name'] == name]
+            for definition in definitions[:2]:
+                if definition['path'] not in target_files:
+                    target_files.append(definition['path'])
         
         return target_files
     
+    # Menções de arquivos e só palavras com cara de código: CamelCase com duas
+    # ou mais corcovas, hooks, snake_case, chamadas 'nome()' e identificadores
+    # entre crases ou aspas (palavras capitalizadas comuns ficam de fora)
+    _FILE_MENTION = re.compile(r'[\w/\.-]+\.(?:tsx?|jsx?|php|py|css|json)\b', re.IGNORECASE)
+    _SYMBOL_MENTION = re.compile(
+        r"""([`'"])(?P<quoted>[A-Za-z_$][\w$]*)\1"""
+        r'|\b(?P<bare>[A-Z][a-z0-9]+(?:[A-Z][a-z0-9]*)+|use[A-Z]\w*|[a-z]+_\w+|[A-Za-z_]\w*(?=\(\)))\b'
+    )
+    
+    def _mentioned_files(self, user_request: str) -> List[str]:
+        """Arquivos citados na requisição (nomes ou caminhos)"""
+        return list(dict.fromkeys(self._FILE_MENTION.findall(user_request)))
+    
+    def _resolve_file_mentions(self, user_request: str) -> Tuple[List[str], Dict[str, str]]:
+        """(arquivos confirmados, {menção: arquivo parecido}) das menções de arquivos
+        
+        Uma menção sem correspondência exata pode ser um arquivo a criar
+        ('Sidebar2.tsx', 'config.ts'): o parecido nunca vira alvo de edição.
+        """
+        confirmed, suggestions = [], {}
+        for mention in self._mentioned_files(user_request):
+            matches = self.file_index.lookup(mention, limit=1)
+            if not matches:
+                continue
+            path, score = matches[0]
+            if score < self.TARGET_MIN_SCORE:
+                suggestions[mention] = path
+            elif path not in confirmed:
+                confirmed.append(path)
+        return confirmed, suggestions
+    
+    def _mentioned_symbols(self, user_request: str) -> List[str]:
+        """Identificadores citados na requisição (sem extensões de arquivo)"""
+        text = self._FILE_MENTION.sub(' ', user_request)
+        return list(dict.fromkeys(
+            match.group('quoted') or match.group('bare') for match in self._SYMBOL_MENTION.finditer(text)
+        ))
+    
     def _analyze_intent(self, user_request: str) -> Dict:
         """Analisa a intenção do usuário"""
         
@@ -745,18 +4121,7 @@ Responda em JSON:
 }}
 """
         
-        try:
-            response = self.main_model.generate_content(prompt)
-            text = response.text
-            start = text.find('{')
-            end = text.rfind('}') + 1
-            
-            if start >= 0 and end > start:
-                return json.loads(text[start:end])
-        except Exception as e:
-            print(f"   Erro na análise de intenção: {e}")
-        
-        return {
+        fallback = {
             "type": "other",
             "target": "unknown",
             "reasoning": "Não foi possível determinar a intenção",
@@ -764,37 +4129,66 @@ Responda em JSON:
             "requires_files": [],
             "action_verb": "process"
         }
+        
+        try:
+            intent = generate_structured(self.main_model, prompt, 'intent')
+            if intent:
+                return {**fallback, **intent}
+        except Exception as e:
+            print(f"   Erro na análise de intenção: {e}")
+        
+        return fallback
     
     def _analyze_context(self, user_request: str, system_context: Dict, files_analysis: Dict = None) -> Dict:
         """Analisa contexto necessário (com conhecimento profundo dos arquivos)"""
         
         # Extrair arquivos mencionados
-        mentioned_files = re.findall(r'[\w/\.-]+\.(tsx?|jsx?|php|py|css|json)', user_request, re.IGNORECASE)
-        
-        # Buscar arquivos similares no sistema
-        relevant_files = []
+        mentioned_files = self._mentioned_files(user_request)
         
+        # Arquivos irmãos dos mencionados (mesmo nome-base: testes, estilos, tipos)
         ptero_structure = system_context.get('pterodactyl', {}).get('structure', {})
+        stems = {os.path.splitext(os.path.basename(m))[0].lower() for m in mentioned_files}
+        relevant_files = [
+            relative for relative in ptero_structure
+            if os.path.basename(relative).lower().split('.', 1)[0] in stems
+        ][:20] if stems else []
         
-        def search_files(structure, path=''):
-            for name, info in structure.items():
-                current_path = f"{path}/{name}" if path else name
-                if info.get('type') == 'file':
-                    # Verificar se arquivo é relevante
-                    if any(mentioned in current_path for mentioned in mentioned_files):
-                        relevant_files.append(current_path)
-                elif info.get('type') == 'directory':
-                    search_files(info.get('children', {}), current_path)
+        # Definições e usos dos símbolos citados, direto do índice
+        symbols = {}
+        for name in self._mentioned_symbols(user_request):
+            definitions = [d for d in self.symbol_index.definitions(name) if d['name'] == name]
+            if definitions:
+                symbols[name] = {
+                    'defined_in': [f"{d['path']}:{d['start']}-{d['end']}" for d in definitions[:3]],
+                    'used_in': [r['path'] for r in self.symbol_index.references(name, limit=10)]
+                }
         
-        search_files(ptero_structure)
+        _, suggested_files = self._resolve_file_mentions(user_request)
         
         return {
             'mentioned_files': mentioned_files,
+            'suggested_files': suggested_files,
             'relevant_files': relevant_files,
+            'symbols': symbols,
+            'code_snippets': self._retrieve_code(user_request, list(files_analysis or {})),
             'system_state': system_context,
             'files_deep_knowledge': files_analysis or {}  # NOVO!
         }
     
+    def _retrieve_code(self, query: str, boost_paths: List[str]) -> str:
+        """Trechos mais relevantes do painel (BM25 local) dentro do orçamento de tokens"""
+        sections = []
+        used = 0
+        for chunk in self.symbol_index.search(query, limit=self.RETRIEVAL_TOP_K, boost_paths=boost_paths):
+            text = read_lines(chunk['path'], chunk['start'], chunk['end'])
+            cost = estimate_tokens(text)
+            if not text or used + cost > self.RETRIEVAL_TOKEN_BUDGET:
+                continue
+            label = f" ({chunk['name']})" if chunk['name'] else ''
+            sections.append(f"[{chunk['path']}:{chunk['start']}-{chunk['end']}{label}]\n{text}")
+            used += cost
+        return '\n\n'.join(sections)
+    
     def _generate_execution_plan_smart(self, user_request: str, intent: Dict, 
                                       context: Dict, files_analysis: Dict) -> List[str]:
         """Gera plano de execução COM conhecimento profundo dos arquivos"""
@@ -824,7 +4218,12 @@ CONHECIMENTO PROFUNDO DOS ARQUIVOS:
 
 CONTEXTO ADICIONAL:
 - Arquivos mencionados: {context['mentioned_files']}
+- Arquivos parecidos com menções sem correspondência exata (só sugestão; o usuário precisa confirmar antes de editá-los): {context.get('suggested_files', {})}
 - Arquivos relevantes: {context['relevant_files']}
+- Símbolos no projeto: {json.dumps(context.get('symbols', {}), ensure_ascii=False)}
+
+TRECHOS RELEVANTES DO CÓDIGO (busca local):
+{context.get('code_snippets') or 'nenhum'}
 
 Com base no seu ENTENDIMENTO PROFUNDO do código, crie um plano que:
 
@@ -867,19 +4266,18 @@ Responda em JSON:
 """
         
         try:
-            response = self.main_model.generate_content(prompt)
-            text = response.text
-            start = text.find('{')
-            end = text.rfind('}') + 1
-            
-            if start >= 0 and end > start:
-                plan_data = json.loads(text[start:end])
-                
+            plan_data = generate_structured(self.main_model, prompt, 'plan')
+            steps = [
+                step['action'] for step in (plan_data or {}).get('steps', [])
+                if isinstance(step, dict) and step.get('action')
+            ]
+            if steps:
                 # Mostrar raciocínio
-                if plan_data.get('confidence', 0) > 0.8:
-                    print(f"\n   ✓ Plano gerado com alta confiança ({plan_data['confidence']*100:.0f}%)")
+                confidence = plan_data.get('confidence', 0)
+                if isinstance(confidence, (int, float)) and confidence > 0.8:
+                    print(f"\n   ✓ Plano gerado com alta confiança ({confidence*100:.0f}%)")
                 
-                return [step['action'] for step in plan_data.get('steps', [])]
+                return steps
         except Exception as e:
             print(f"   ⚠️  Erro ao gerar plano: {e}")
         
@@ -918,16 +4316,12 @@ Responda em JSON:
 """
         
         try:
-            response = self.validator_model.generate_content(validation_prompt)
-            text = response.text
-            start = text.find('{')
-            end = text.rfind('}') + 1
-            
-            if start >= 0 and end > start:
-                validation_data = json.loads(text[start:end])
+            validation_data = generate_structured(self.validator_model, validation_prompt, 'plan_validation')
+            if validation_data:
                 risks.extend(validation_data.get('risks', []))
-        except:
-            pass
+        except Exception as e:
+            # Retries/backoff já foram esgotados no backend
+            print(f"   ⚠️  Erro na validação do plano: {e}")
         
         # Determinar nível de segurança
         if len(risks) == 0:
@@ -962,13 +4356,24 @@ Responda como lista simples, uma alternativa por linha.
 """
         
         try:
-            response = self.main_model.generate_content(prompt)
+            response = self.main_model.generate_content(prompt, stage='alternatives')
             alternatives = [line.strip() for line in response.text.split('\n') if line.strip() and not line.startswith('#')]
             return alternatives[:3]
-        except:
+        except Exception as e:
+            print(f"   ⚠️  Erro ao gerar alternativas: {e}")
             return []
 
 
+# Requisições típicas usadas pelo comando 'bench'
+BENCHMARK_REQUESTS = [
+    "Mudar a cor do botão de login para azul",
+    "Adicionar um aviso de manutenção no dashboard",
+    "Otimizar a listagem de servidores",
+    "Corrigir o layout do console do servidor no mobile",
+    "Criar uma página de status dos nodes",
+]
+
+
 class PteroAIUltraPro:
     """Sistema Ultra Profissional de IA - Versão 2.0"""
     
@@ -980,38 +4385,90 @@ class PteroAIUltraPro:
         
         # Cache inteligente
         cache_dir = Path(self.config['cache_path'])
-        self.cache = ContextCache(cache_dir)
+        self.cache = ContextCache(cache_dir, **self.config['cache_limits'])
+        
+        # Cota, retries e prazos compartilhados por todas as chamadas ao LLM
+        model_registry.configure_limits(**self.config['llm_limits'])
+        
+        # Backend de LLM: Gemini (padrão) ou local determinístico (offline)
+        if self.config['llm_backend'] == 'local':
+            model_registry.use_local_backend(LocalBackend.from_config(self.config['local_backend']))
+            print("🧪 Backend local ativo (respostas simuladas, sem rede)")
         
         # Motor de IA avançado
-        self.ai = SmartAIEngine(api_key, self.cache)
+        self.ai = SmartAIEngine(
+            api_key, self.cache,
+            analysis_workers=self.config['analysis_workers'],
+            analysis_timeout=self.config['analysis_timeout'],
+            knowledge_max_entries=self.config['knowledge_max_entries'],
+            security_rules_file=self.config['security_rules_file']
+        )
         
         # Contexto do sistema
         self.system_context = {}
         
+        # Observador do painel (iniciado na primeira varredura)
+        self.watcher = None
+        
         print("✓ Sistema inicializado com sucesso\n")
     
     def load_config(self):
         """Carrega configuração"""
+        defaults = {
+            'ptero_path': self.detect_pterodactyl_path(),
+            'backup_path': str(Path.home() / 'ptero_ultra_backups'),
+            'cache_path': str(Path.home() / 'ptero_ultra_cache'),
+            'safety_mode': True,
+            'auto_backup': True,
+            'max_backups': 100,
+            'ai_confidence_threshold': 0.7,
+            'require_confirmation': {
+                'critical': True,
+                'high': True,
+                'medium': True,
+                'low_risk': False,
+                'safe': False
+            },
+            'llm_backend': 'gemini',
+            'local_backend': {
+                'latency_ms': 300,
+                'jitter_ms': 200,
+                'responses_file': None
+            },
+            'llm_limits': {
+                'requests_per_minute': 60,
+                'burst': 10,
+                'max_retries': 4,
+                'backoff_base': 1.0,
+                'backoff_max': 30.0,
+                'call_deadline': 90.0
+            },
+            'chat_model': 'gemini-pro',
+            'analysis_workers': 4,
+            'analysis_timeout': 120,
+            'knowledge_max_entries': 64,
+            'security_rules_file': str(Path.home() / 'ptero_ai_ultra_rules.json'),
+            'scan_excludes': DEFAULT_SCAN_EXCLUDES,
+            'scan_workers': 8,
+            'watch_panel': True,
+            'watch_debounce': 0.5,
+            'watch_poll_interval': 2.0,
+            'cache_limits': {
+                'max_entries': 5000,
+                'max_bytes': 50 * 1024 * 1024,
+                'sweep_interval': 300,
+                'namespaces': DEFAULT_CACHE_NAMESPACES
+            }
+        }
+        
         if self.config_file.exists():
             with open(self.config_file) as f:
                 self.config = json.load(f)
+            # Configs antigas não têm as chaves novas
+            for key, value in defaults.items():
+                self.config.setdefault(key, value)
         else:
-            self.config = {
-                'ptero_path': self.detect_pterodactyl_path(),
-                'backup_path': str(Path.home() / 'ptero_ultra_backups'),
-                'cache_path': str(Path.home() / 'ptero_ultra_cache'),
-                'safety_mode': True,
-                'auto_backup': True,
-                'max_backups': 100,
-                'ai_confidence_threshold': 0.7,
-                'require_confirmation': {
-                    'critical': True,
-                    'high': True,
-                    'medium': True,
-                    'low_risk': False,
-                    'safe': False
-                }
-            }
+            self.config = defaults
             self.save_config()
         
         # Criar diretórios
@@ -1039,26 +4496,120 @@ class PteroAIUltraPro:
         return '/var/www/pterodactyl'
     
     def analyze_system(self):
-        """Analisa sistema completo (versão otimizada com cache)"""
+        """Analisa sistema completo (versão otimizada com cache)
+        
+        Só a análise básica vem do cache; a árvore do painel é sempre
+        revarrida (é rápida) para que os índices reflitam o disco.
+        """
         cache_key = "full_system_analysis"
         cached = self.cache.get(cache_key)
         
         if cached:
             print("💾 Análise do sistema recuperada do cache")
             self.system_context = cached
+        else:
+            print("🔍 Analisando sistema completo...")
+            
+            # Análise básica
+            self.system_context = {
+                'pterodactyl': {'installed': Path(self.config['ptero_path']).exists()},
+                'services': [],
+                'timestamp': datetime.now().isoformat()
+            }
+            self.system_context['version'] = context_version(self.system_context)
+            
+            self.cache.set(cache_key, self.system_context)
+            print("✓ Análise concluída\n")
+        
+        self.scan_panel()
+    
+    def scan_panel(self):
+        """Varre a árvore do painel e sincroniza os índices de nomes e símbolos"""
+        root = self.config['ptero_path']
+        if not Path(root).exists():
             return
         
-        print("🔍 Analisando sistema completo...")
+        scanner = TreeScanner(root, self.config['scan_excludes'], self.config['scan_workers'])
+        table = scanner.scan()
         
-        # Análise básica
+        # A tabela não vai para o cache: é refeita a cada varredura
         self.system_context = {
-            'pterodactyl': {'installed': Path(self.config['ptero_path']).exists()},
-            'services': [],
-            'timestamp': datetime.now().isoformat()
+            **self.system_context,
+            'pterodactyl': {**self.system_context.get('pterodactyl', {}), 'structure': table}
         }
         
-        self.cache.set(cache_key, self.system_context)
-        print("✓ Análise concluída\n")
+        self.ai.file_index.build(root, table)
+        result = self.ai.symbol_index.refresh(root, table)
+        print(f"🗂️  Painel: {scanner.stats['files']} arquivos em {scanner.stats['directories']} diretórios "
+              f"({scanner.stats['seconds'] * 1000:.0f} ms) | símbolos: {result['changed']} reindexados, "
+              f"{result['removed']} removidos ({result['seconds'] * 1000:.0f} ms)")
+        
+        if self.config['watch_panel'] and self.watcher is None:
+            self.watcher = PanelWatcher(
+                root, self.apply_panel_changes,
+                excludes=self.config['scan_excludes'],
+                debounce=self.config['watch_debounce'],
+                poll_interval=self.config['watch_poll_interval']
+            )
+            print(f"👁️  Observando alterações no painel ({self.watcher.start()})")
+    
+    def apply_panel_changes(self, changes: Dict[str, str]):
+        """Aplica um lote de mudanças do observador
+        
+        Só os arquivos afetados saem de file_knowledge e são atualizados nos
+        índices e na tabela do painel. Análises em cache são endereçadas pelo
+        hash do conteúdo e continuam válidas; a análise do sistema é descartada.
+        
+        Roda na thread do observador: a tabela é alterada numa cópia e trocada
+        de uma vez em system_context, como em scan_panel, para que quem a
+        percorre na thread principal nunca veja um dict mudando de tamanho.
+        """
+        if '*' in changes:
+            # Eventos perdidos (fila do inotify estourou): revarrer, ainda incremental
+            self.ai.file_knowledge.clear()
+            self.cache.delete('full_system_analysis')
+            self.scan_panel()
+            return
+        
+        root = str(self.config['ptero_path']).rstrip('/')
+        current = self.system_context.get('pterodactyl', {}).get('structure')
+        if current is None:
+            return
+        table = dict(current)
+        
+        updated = removed = 0
+        for path, kind in changes.items():
+            relative = path[len(root) + 1:]
+            if kind == 'deleted':
+                # Pode ser um diretório: remover tudo abaixo dele
+                gone = [r for r in table if r == relative or r.startswith(relative + '/')]
+                for entry in gone:
+                    del table[entry]
+                    self.ai.file_index.remove(f"{root}/{entry}")
+                    self.ai.file_knowledge.pop(f"{root}/{entry}", None)
+                self.ai.symbol_index.remove_tree(path)
+                removed += len(gone)
+                continue
+            
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            language = detect_language(path)
+            table[relative] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'language': language}
+            self.ai.file_index.add(path)
+            self.ai.file_knowledge.pop(path, None)
+            if language == 'Python' or language in _SCRIPT_LANGUAGES:
+                self.ai.symbol_index.update_file(path)
+            updated += 1
+        
+        if updated or removed:
+            self.system_context = {
+                **self.system_context,
+                'pterodactyl': {**self.system_context.get('pterodactyl', {}), 'structure': table}
+            }
+            self.cache.delete('full_system_analysis')
+            print(f"\n🔄 Painel alterado: {updated} arquivos atualizados, {removed} removidos")
     
     def process_request(self, user_request: str):
         """Processa requisição do usuário com inteligência ultra avançada"""
@@ -1073,7 +4624,7 @@ class PteroAIUltraPro:
         # Mostrar conhecimento adquirido dos arquivos
         if hasattr(self.ai, 'file_knowledge') and self.ai.file_knowledge:
             print("\n📚 CONHECIMENTO DOS ARQUIVOS:")
-            for file_path, analysis in self.ai.file_knowledge.items():
+            for file_path, analysis in list(self.ai.file_knowledge.items()):
                 deep = analysis.get('deep_analysis', {})
                 score = deep.get('understanding_score', 0)
                 
@@ -1134,26 +4685,276 @@ class PteroAIUltraPro:
     def chat(self, user_message: str) -> str:
         """Modo chat simples sem confirmações (para interface gráfica)"""
         try:
-            # Usar GenerativeModel diretamente com modelo simples
-            import google.generativeai as genai
-            
-            model = genai.GenerativeModel('gemini-pro')
-            response = model.generate_content(
-                f"Você é PTERO-AI Ultra Pro, um assistente especializado em Pterodactyl Panel.\n\n"
-                f"Usuário: {user_message}\n\n"
-                f"Responda de forma útil e amigável. Se for sobre Pterodactyl, seja específico. "
-                f"Se for uma saudação, seja breve e pergunte como pode ajudar."
+            return ''.join(self.chat_stream(user_message))
+        except Exception as e:
+            return self.chat_error_message(e)
+    
+    def chat_stream(self, user_message: str) -> Iterator[str]:
+        """Modo chat com streaming: produz trechos conforme o modelo gera"""
+        # Cliente compartilhado do registro (construído uma única vez)
+        model = model_registry.get(self.config['chat_model'])
+        response = model.generate_content(
+            f"Você é PTERO-AI Ultra Pro, um assistente especializado em Pterodactyl Panel.\n\n"
+            f"Usuário: {user_message}\n\n"
+            f"Responda de forma útil e amigável. Se for sobre Pterodactyl, seja específico. "
+            f"Se for uma saudação, seja breve e pergunte como pode ajudar.",
+            stream=True,
+            stage='chat'
+        )
+        
+        for chunk in response:
+            try:
+                text = chunk.text
+            except ValueError:
+                # Trecho sem conteúdo textual (ex.: bloqueado por filtro)
+                continue
+            if text:
+                yield text
+    
+    def chat_error_message(self, error: Exception) -> str:
+        """Mensagem de erro amigável para falhas no chat"""
+        # Se o modelo do chat falhar, mostrar modelos disponíveis (descoberta em cache)
+        try:
+            available_models = model_registry.available_models()
+            return f"❌ Erro: {str(error)}\n\nModelos disponíveis: {', '.join(available_models[:5])}"
+        except:
+            return f"❌ Erro ao processar: {str(error)}"
+    
+    def stream_chat_to_terminal(self, user_message: str):
+        """Imprime a resposta do chat no terminal conforme ela é gerada"""
+        print("\n🤖 PTERO-AI: ", end='', flush=True)
+        try:
+            for chunk in self.chat_stream(user_message):
+                print(chunk, end='', flush=True)
+        except Exception as e:
+            print(self.chat_error_message(e), end='')
+        print()
+    
+    def show_history(self, args: List[str]):
+        """Mostra decisões do diário, com filtros chave=valor"""
+        filters = dict(arg.split('=', 1) for arg in args if '=' in arg)
+        
+        since = None
+        try:
+            if filters.get('since'):
+                value = filters['since']
+                units = {'d': 86400, 'h': 3600, 'm': 60}
+                if value[-1] in units and value[:-1].isdigit():
+                    since = time.time() - int(value[:-1]) * units[value[-1]]
+                else:
+                    since = datetime.fromisoformat(value).timestamp()
+            limit = int(filters.get('limit', 10))
+            if limit < 1:
+                raise ValueError(limit)
+        except ValueError:
+            print("   Uso: history [file=Arquivo.tsx] [action=modify] [level=high] "
+                  "[since=30d|12h|45m|2024-01-31] [limit=10]")
+            return
+        
+        if since is None and not any(filters.get(key) for key in ('action', 'file', 'level')):
+            entries = self.ai.journal.recent(limit)
+        else:
+            entries = self.ai.journal.query(
+                since=since,
+                action=filters.get('action'),
+                file=filters.get('file'),
+                security_level=filters.get('level'),
+                limit=limit
             )
+        
+        print("\n📜 HISTÓRICO DE DECISÕES:")
+        if not entries:
+            print("   Nenhuma decisão encontrada")
+        for i, entry in enumerate(entries, 1):
+            print(f"\n{i}. [{datetime.fromtimestamp(entry['ts']).isoformat(timespec='seconds')}]")
+            print(f"   Requisição: {entry['request']}")
+            print(f"   Ação: {entry['action']} | Segurança: {entry['security_level']}")
+            if entry['files']:
+                print(f"   Arquivos: {', '.join(Path(f).name for f in entry['files'])}")
+    
+    def show_status(self):
+        """Mostra status atual do sistema"""
+        usage = self.cache.usage()
+        print("\n📊 STATUS:")
+        print(f"   Pterodactyl: {self.config['ptero_path']}")
+        print(f"   Cache: {usage['entries']} entradas, {usage['bytes'] / 1024:.1f} KB")
+        print(f"   Namespaces: {usage['namespaces']}")
+        print(f"   Hits/Misses: {usage['hits']}/{usage['misses']} | "
+              f"Despejos: {usage['evictions']} | Expiradas: {usage['expirations']}")
+        
+        structured = structured_output_stats
+        print(f"   JSON estruturado: {structured['calls']} chamadas | reparados localmente: "
+              f"{structured['repaired']} | re-perguntas: {structured['reasked']} | "
+              f"falhas: {structured['failed']}")
+        
+        validator = self.ai.validator.stats
+        print(f"   Validações: {validator['validations']} | IA chamada: {validator['ai_calls']} | "
+              f"IA evitada pela cascata: {validator['ai_skipped']}")
+        
+        if self.watcher:
+            print(f"   Observador: {self.watcher.mode} | {self.watcher.stats['events']} eventos em "
+                  f"{self.watcher.stats['batches']} lotes")
+        
+        symbols = self.ai.symbol_index.stats()
+        print(f"   Índice de símbolos: {symbols['files']} arquivos | {symbols['symbols']} definições | "
+              f"{symbols['refs']} referências | {symbols['imports']} imports")
+        
+        knowledge = self.ai.file_knowledge
+        print(f"   Análises em memória: {len(knowledge)}/{knowledge.max_entries} | "
+              f"descartadas (LRU): {knowledge.evictions}")
+    
+    def benchmark(self, requests: Optional[List[str]] = None, rounds: int = 3, concurrency: int = 4):
+        """Mede vazão, latência e eficiência de cache do pipeline de análise
+        
+        Só roda com 'llm_backend': 'local' (sem rede e sem gastar cota). O
+        pipeline usa um cache e um diário descartáveis: a primeira rodada
+        parte do cache vazio e as seguintes medem o efeito do cache, sem
+        gravar nada no histórico nem no cache de requisições reais.
+        """
+        if self.config['llm_backend'] != 'local':
+            print("   O benchmark só roda com o backend local (\"llm_backend\": \"local\" na configuração)")
+            return
+        
+        requests = requests or BENCHMARK_REQUESTS
+        backend = model_registry.get('gemini-1.5-flash')
+        calls_before = backend.calls
+        latencies = []
+        
+        with tempfile.TemporaryDirectory(prefix='ptero-bench-') as scratch:
+            cache = ContextCache(Path(scratch), sweep_interval=0)
+            engine = copy.copy(self.ai)
+            engine.cache = cache
+            engine.journal = DecisionJournal(Path(scratch) / 'decisions.db')
+            engine.code_analyzer = CodeAnalyzer(engine.main_model, cache)
+            engine.file_knowledge = FileKnowledge(self.ai.file_knowledge.max_entries)
+            engine.inflight_requests = SingleFlight()
+            
+            def timed(request):
+                start = time.perf_counter()
+                engine.analyze_request(request, self.system_context)
+                return time.perf_counter() - start
+            
+            print(f"\n⏱️  Benchmark: {len(requests)} requisições x {rounds} rodadas "
+                  f"(backend {backend.name}, concorrência {concurrency})")
             
-            return response.text
-        except Exception as e:
-            # Se gemini-pro falhar, tentar listar modelos disponíveis
             try:
-                import google.generativeai as genai
-                available_models = [m.name for m in genai.list_models() if 'generateContent' in m.supported_generation_methods]
-                return f"❌ Erro: {str(e)}\n\nModelos disponíveis: {', '.join(available_models[:5])}"
-            except:
-                return f"❌ Erro ao processar: {str(e)}"
+                started = time.perf_counter()
+                with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                    for _ in range(rounds):
+                        latencies.extend(executor.map(timed, requests))
+                elapsed = time.perf_counter() - started
+                hits = cache.stats['hits']
+            finally:
+                engine.journal.close()
+                cache.close()
+        
+        latencies.sort()
+        
+        def percentile(p):
+            return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000
+        
+        total = len(latencies)
+        print(f"   Requisições: {total} em {elapsed:.2f}s ({total / elapsed:.1f} req/s)")
+        print(f"   Latência p50/p95/p99: {percentile(0.50):.0f} / {percentile(0.95):.0f} / "
+              f"{percentile(0.99):.0f} ms")
+        print(f"   Chamadas ao LLM: {backend.calls - calls_before} "
+              f"({(backend.calls - calls_before) / total:.2f} por requisição)")
+        print(f"   Acertos de cache: {hits}")
+    
+    def benchmark_structure(self, limit: int = 20, rounds: int = 5):
+        """Mede o custo da extração de estrutura nos maiores arquivos do painel
+        
+        Sem instalação do Pterodactyl, usa o próprio código do PTERO-AI.
+        """
+        root = Path(self.config['ptero_path'])
+        if not root.exists():
+            root = Path(__file__).parent
+        
+        analyzer = self.ai.code_analyzer
+        table = TreeScanner(root, self.config['scan_excludes'], self.config['scan_workers']).scan()
+        candidates = [
+            (info['size'], os.path.join(root, relative), info['language'])
+            for relative, info in table.items()
+            if info['language'] == 'Python' or info['language'] in _SCRIPT_LANGUAGES
+        ]
+        
+        files = heapq.nlargest(limit, candidates)
+        if not files:
+            print("   Nenhum arquivo de código encontrado")
+            return
+        
+        print(f"\n⏱️  Benchmark de estrutura: {len(files)} maiores arquivos de {root} x {rounds} rodadas")
+        total_bytes = total_lines = 0
+        total_time = 0.0
+        for size, path, language in files:
+            content = Path(path).read_text(encoding='utf-8', errors='ignore')
+            best = float('inf')
+            for _ in range(rounds):
+                start = time.perf_counter()
+                structure = analyzer._analyze_structure(content, language)
+                best = min(best, time.perf_counter() - start)
+            lines = content.count('\n') + 1
+            total_bytes += size
+            total_lines += lines
+            total_time += best
+            print(f"   {Path(path).name:<40} {lines:>7} linhas {best * 1000:>8.2f} ms  ({structure['summary']})")
+        
+        print(f"   Total: {total_lines} linhas em {total_time * 1000:.1f} ms "
+              f"({total_lines / total_time:,.0f} linhas/s, {total_bytes / total_time / 1e6:.1f} MB/s)")
+    
+    def security_scan(self, args: List[str]):
+        """Varre todo o painel com as regras de segurança, em paralelo
+        
+        Filtros: severity=<nível mínimo> limit=<ocorrências exibidas> workers=<processos>
+        """
+        options = dict(arg.split('=', 1) for arg in args if '=' in arg)
+        order = [level.value for level in SecurityLevel]
+        minimum = options.get('severity', 'safe')
+        if minimum not in order:
+            print(f"   Nível inválido: {minimum} (use {', '.join(order)})")
+            return
+        try:
+            limit = int(options.get('limit', 50))
+            workers = int(options['workers']) if 'workers' in options else None
+        except ValueError:
+            print("   limit= e workers= precisam ser números")
+            return
+        
+        root = str(self.config['ptero_path'] or '')
+        if not root or not Path(root).exists():
+            print("   Pterodactyl não encontrado")
+            return
+        root = root.rstrip('/')
+        
+        table = self.system_context.get('pterodactyl', {}).get('structure')
+        if table is None:
+            table = TreeScanner(root, self.config['scan_excludes'], self.config['scan_workers']).scan()
+        
+        rules = self.ai.security_rules
+        extensions = rules.extensions() or set(LANGUAGE_BY_EXTENSION)
+        paths = [f"{root}/{relative}" for relative in table
+                 if os.path.splitext(relative)[1].lower() in extensions]
+        
+        print(f"\n🛡️  Varredura de segurança: {len(paths)} arquivos, {len(rules)} regras")
+        result = rules.sweep(paths, workers)
+        
+        findings = [f for f in result['findings'] if order.index(f['severity']) >= order.index(minimum)]
+        findings.sort(key=lambda f: -order.index(f['severity']))
+        for finding in findings[:limit]:
+            print(f"   [{finding['severity'].upper()}] {finding['path'][len(root) + 1:]}:"
+                  f"{finding['line']}:{finding['column']}  {finding['message']}")
+            print(f"      {finding['text']}")
+        if len(findings) > limit:
+            print(f"   ... mais {len(findings) - limit} ocorrências (use limit=)")
+        
+        by_rule = Counter(f['rule'] for f in findings)
+        if by_rule:
+            print(f"   Por regra: {' | '.join(f'{rule} {count}' for rule, count in by_rule.most_common())}")
+        
+        megabytes = result['bytes'] / 1e6
+        print(f"   Total: {result['files']} arquivos, {megabytes:.1f} MB em {result['seconds']:.2f} s "
+              f"({megabytes / max(result['seconds'], 1e-9):.1f} MB/s, {result['workers']} processos) | "
+              f"{len(findings)} ocorrências")
     
     def _simulate_execution(self, decision: AIDecision):
         """Simula execução sem aplicar mudanças"""
@@ -1176,8 +4977,12 @@ class PteroAIUltraPro:
         print("\nComandos:")
         print("  analyze  - Análise completa do sistema")
         print("  status   - Status atual")
-        print("  history  - Histórico de decisões")
+        print("  history  - Histórico de decisões (filtros: file= action= level= since=30d limit=)")
         print("  config   - Ver/editar configuração")
+        print("  chat <mensagem> - Conversa rápida (resposta em tempo real)")
+        print("  bench [n] - Benchmark do pipeline (n rodadas)")
+        print("  bench structure - Benchmark da extração de estrutura")
+        print("  scan [severity=high] [limit=50] [workers=N] - Varredura de segurança do painel")
         print("  exit     - Sair")
         print("\nOu converse naturalmente sobre qualquer coisa!")
         print("=" * 70 + "\n")
@@ -1197,22 +5002,40 @@ class PteroAIUltraPro:
                     break
                 
                 elif user_input.lower() == 'analyze':
-                    self.cache.memory.clear()  # Limpar cache para nova análise
+                    self.cache.clear()  # Limpar cache para nova análise
                     self.analyze_system()
                     continue
                 
-                elif user_input.lower() == 'history':
-                    print("\n📜 HISTÓRICO DE DECISÕES:")
-                    for i, entry in enumerate(self.ai.decision_history[-10:], 1):
-                        print(f"\n{i}. [{entry['timestamp']}]")
-                        print(f"   Requisição: {entry['request']}")
-                        print(f"   Ação: {entry['decision']['action']}")
+                elif user_input.lower() == 'status':
+                    self.show_status()
+                    continue
+                
+                elif user_input.lower().split()[0] == 'history':
+                    self.show_history(user_input.split()[1:])
                     continue
                 
                 elif user_input.lower() == 'config':
                     print(json.dumps(self.config, indent=2))
                     continue
                 
+                elif user_input.lower().split()[0] == 'bench':
+                    args = user_input.split()[1:]
+                    if args and args[0] == 'structure':
+                        self.benchmark_structure()
+                    elif args and (not args[0].isdigit() or int(args[0]) < 1):
+                        print("   Uso: bench [rodadas] | bench structure")
+                    else:
+                        self.benchmark(rounds=int(args[0]) if args else 3)
+                    continue
+                
+                elif user_input.lower().split()[0] == 'scan':
+                    self.security_scan(user_input.split()[1:])
+                    continue
+                
+                elif user_input.lower().startswith('chat '):
+                    self.stream_chat_to_terminal(user_input[5:].strip())
+                    continue
+                
                 # Processar requisição
                 self.process_request(user_input)
                 
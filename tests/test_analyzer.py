@@ -0,0 +1,41 @@
+"""Leitura profunda de arquivos grandes (map/reduce)"""
+
+import threading
+
+from ptero_ai_ultra_pro import CodeAnalyzer, ContextCache, LLMBackend, LLMResponse
+
+
+DEEP_READ = ('{"purpose": "x", "complexity_level": "low", "safe_edit_zones": [], "danger_zones": [], '
+             '"recommendations": [], "understanding_score": 0.9}')
+
+
+class FlakyChunkBackend(LLMBackend):
+    """Falha no resumo do bloco que contém 'quebrado'; o resto responde normalmente"""
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stages = []
+    
+    def generate_content(self, prompt, generation_config=None, stage=None, **kwargs):
+        with self.lock:
+            self.stages.append(stage)
+        if stage == 'chunk_summary':
+            return LLMResponse('erro' if 'quebrado' in prompt else '{"summary": "ok"}')
+        return LLMResponse(DEEP_READ)
+
+
+def test_reduce_over_a_failed_chunk_is_not_cached(tmp_path):
+    functions = [f"def f{i}():\n" + "    valor = 'texto de preenchimento'\n" * 60 for i in range(6)]
+    functions[3] = functions[3].replace('texto', 'quebrado')
+    path = tmp_path / 'grande.py'
+    path.write_text('\n'.join(functions))
+    
+    cache = ContextCache(tmp_path / 'cache', sweep_interval=0)
+    model = FlakyChunkBackend()
+    analyzer = CodeAnalyzer(model, cache)
+    
+    analysis = analyzer.deep_analyze_file(str(path))
+    assert analysis['deep_analysis']['fallback'] is True
+    assert 'deep_read' in model.stages
+    assert not any(key.startswith('analysis_v') for key in cache.memory)
+    cache.close()
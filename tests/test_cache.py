@@ -0,0 +1,20 @@
+"""Cache de contexto"""
+
+from ptero_ai_ultra_pro import ContextCache
+
+
+def test_file_analyses_stay_on_disk(tmp_path):
+    cache = ContextCache(tmp_path, sweep_interval=0)
+    cache.set('analysis_abc', {'purpose': 'x' * 1000})
+    cache.set('request_abc', {'plan': 1})
+    assert 'data' not in cache.memory['analysis_abc']
+    assert cache.memory['request_abc']['data'] == {'plan': 1}
+    assert cache.get('analysis_abc') == {'purpose': 'x' * 1000}
+    cache.close()
+    
+    reopened = ContextCache(tmp_path, sweep_interval=0)
+    assert 'data' not in reopened.memory['analysis_abc']
+    assert reopened.memory['analysis_abc']['size'] > 1000
+    assert reopened.get('analysis_abc') == {'purpose': 'x' * 1000}
+    assert reopened.get('request_abc') == {'plan': 1}
+    reopened.close()
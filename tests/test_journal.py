@@ -0,0 +1,32 @@
+"""Diário de decisões"""
+
+import types
+
+from ptero_ai_ultra_pro import AIDecision, DecisionJournal, PteroAIUltraPro
+
+
+def journal_with(tmp_path, count):
+    journal = DecisionJournal(tmp_path / 'decisions.db', tail_size=3)
+    for i in range(count):
+        journal.append(f"pedido {i}", AIDecision('modify', 'ok', 0.9), [f"/painel/F{i}.tsx"])
+    return journal
+
+
+def test_recent_comes_from_memory_and_falls_back_to_the_database(tmp_path):
+    journal = journal_with(tmp_path, 5)
+    journal.query = None  # o caminho em memória não pode tocar no banco
+    assert [e['request'] for e in journal.recent(2)] == ['pedido 4', 'pedido 3']
+    del journal.query
+    assert [e['request'] for e in journal.recent(5)] == [f"pedido {i}" for i in range(4, -1, -1)]
+    journal.close()
+
+
+def test_history_rejects_malformed_filters(tmp_path, capsys):
+    app = object.__new__(PteroAIUltraPro)
+    app.ai = types.SimpleNamespace(journal=journal_with(tmp_path, 1))
+    for args in (['since=ontem'], ['limit=dez'], ['limit=0']):
+        app.show_history(args)
+        assert 'Uso: history' in capsys.readouterr().out
+    app.show_history(['limit=1'])
+    assert 'pedido 0' in capsys.readouterr().out
+    app.ai.journal.close()
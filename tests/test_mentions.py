@@ -0,0 +1,35 @@
+"""Símbolos citados numa requisição"""
+
+from ptero_ai_ultra_pro import FileNameIndex, SmartAIEngine, SymbolIndex
+
+
+def mentioned(text):
+    return SmartAIEngine._mentioned_symbols(object.__new__(SmartAIEngine), text)
+
+
+def test_plain_capitalized_words_are_not_symbols():
+    assert mentioned("Mude a Cor do Botão na Página de Servidores, Por favor") == []
+
+
+def test_code_like_mentions_are_symbols():
+    text = ("Altere ServerConsole e useServerState, chame render() em ServerRow.tsx, "
+            "ajuste `Navigation`, o componente \"Sidebar\" e update_server")
+    assert mentioned(text) == ['ServerConsole', 'useServerState', 'render', 'Navigation', 'Sidebar', 'update_server']
+
+
+def test_only_exact_file_names_become_targets(tmp_path, capsys):
+    engine = object.__new__(SmartAIEngine)
+    engine.file_index = FileNameIndex()
+    engine.file_index.build('/painel', {
+        'resources/scripts/components/Sidebar.tsx': {}, 'resources/scripts/config.js': {},
+        'app/Http/Kernel.php': {}
+    })
+    engine.symbol_index = SymbolIndex(tmp_path / 'index.db')
+    
+    targets = engine._identify_target_files("crie Sidebar2.tsx e config.ts, e ajuste Kernel.php")
+    
+    assert targets == ['/painel/app/Http/Kernel.php']
+    _, suggestions = engine._resolve_file_mentions("crie Sidebar2.tsx e config.ts")
+    assert suggestions == {'Sidebar2.tsx': '/painel/resources/scripts/components/Sidebar.tsx',
+                           'config.ts': '/painel/resources/scripts/config.js'}
+    assert 'sugestão' in capsys.readouterr().out
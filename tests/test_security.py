@@ -0,0 +1,40 @@
+"""Motor de regras de segurança"""
+
+from ptero_ai_ultra_pro import DEFAULT_SECURITY_RULES, SecurityRuleEngine
+
+
+def test_unanchored_patterns_are_compiled_separately():
+    rules = SecurityRuleEngine([
+        {'id': 'named', 'pattern': r'(?P<fn>eval)\s*\(', 'message': 'eval', 'severity': 'high'},
+        {'id': 'flagged', 'pattern': r'(?s)secret\s*=', 'message': 'segredo', 'severity': 'medium'},
+        {'id': 'broken', 'pattern': r'(unclosed', 'message': 'inválida'},
+        {'id': 'bad-anchors', 'pattern': r'x', 'message': 'x', 'anchors': 'x'},
+        {'pattern': r'y', 'message': 'sem id'},
+    ])
+    assert [rule['id'] for rule in rules.rules] == ['named', 'flagged']
+    
+    findings = rules.scan("a = 1\nsecret = eval(input)\n", '.py')
+    assert [(f['rule'], f['line'], f['column']) for f in findings] == [('flagged', 2, 1), ('named', 2, 10)]
+
+
+def test_php_shell_ignores_member_and_static_calls():
+    rules = SecurityRuleEngine(DEFAULT_SECURITY_RULES)
+    code = "<?php\n$this->system(1);\n$x->popen($a);\nFoo::passthru();\n$out = system('ls');\n\\system('id');\n"
+    findings = [f for f in rules.scan(code, '.php') if f['rule'] == 'php-shell']
+    assert [f['line'] for f in findings] == [5, 6]
+
+
+def test_case_sensitive_pack_still_finds_mixed_case_sources():
+    rules = SecurityRuleEngine(DEFAULT_SECURITY_RULES, ignore_case=False)
+    php = rules.scan('<?php\n$rows = DB::raw("select * from users where id = $id");\n', '.php')
+    js = rules.scan("el.innerHTML = html;\n<div dangerouslySetInnerHTML={x} />\n", '.jsx')
+    assert [f['rule'] for f in php] == ['raw-sql-interpolation']
+    assert [f['rule'] for f in js] == ['inner-html', 'react-inner-html']
+
+
+def test_specific_anchors_keep_api_key_and_shell_findings():
+    rules = SecurityRuleEngine(DEFAULT_SECURITY_RULES)
+    code = "<?php\n$api = new Api($system);\n$apiKey = 'abc';\n$API_KEY = \"x\";\nsystem ('ls');\n"
+    assert [(f['rule'], f['line']) for f in rules.scan(code, '.php')] == [
+        ('plain-api-key', 3), ('plain-api-key', 4), ('php-shell', 5)
+    ]
@@ -0,0 +1,56 @@
+"""Extração de estrutura (tokenizador JS/TS/TSX/PHP)"""
+
+import time
+
+from ptero_ai_ultra_pro import extract_structure
+
+
+def test_jsx_text_starting_with_import_is_linear():
+    # Texto JSX com uma linha começando por "import" e nenhuma aspa depois:
+    # o padrão de import não pode retroceder exponencialmente
+    content = (
+        "export const Help = () => {\n"
+        "    return (\n"
+        "        <div>\n"
+        "import things from the panel without any quote\n"
+        + "".join(f"            <p>linha {i} de texto</p>\n" for i in range(200))
+        + "        </div>\n"
+        "    );\n"
+        "};\n"
+    )
+    started = time.perf_counter()
+    structure = extract_structure(content, 'React TypeScript')
+    assert time.perf_counter() - started < 1.0
+    assert [c['name'] for c in structure['components']] == ['Help']
+    assert structure['imports'] == []
+
+
+def test_multiline_import_is_still_recognized():
+    content = "import React from 'react';\nimport {\n  a,\n  b\n} from \"./x\";\n"
+    assert extract_structure(content, 'TypeScript')['imports'] == [
+        "import React from 'react';",
+        'import { a, b } from "./x";',
+    ]
+
+
+def test_expression_bodied_arrow_components_span_their_body():
+    content = (
+        "const Title = ({ name }: Props) => (\n"     # 1
+        "    <h1 className={cx('a', { b: true })}>\n"
+        "        {name}\n"
+        "    </h1>\n"
+        ");\n"                                       # 5
+        "\n"
+        "export const List = () => (\n"              # 7
+        "    <ul>\n"
+        "        {items.map(item => (\n"
+        "            <li key={item.id}>{item.name}</li>\n"
+        "        ))}\n"
+        "    </ul>\n"
+        ")\n"                                        # 13
+        "\n"
+        "const double = (x: number) => x * 2;\n"     # 15
+    )
+    structure = extract_structure(content, 'React TypeScript')
+    spans = {s['name']: (s['start'], s['end']) for s in structure['components'] + structure['functions']}
+    assert spans == {'Title': (1, 5), 'List': (7, 13), 'double': (15, 15)}
@@ -0,0 +1,50 @@
+"""Saída estruturada (generate_structured)"""
+
+from ptero_ai_ultra_pro import LLMBackend, LLMResponse, generate_structured
+
+
+class ScriptedBackend(LLMBackend):
+    """Devolve as respostas na ordem e guarda os prompts recebidos"""
+    
+    def __init__(self, *answers):
+        self.answers = list(answers)
+        self.prompts = []
+    
+    def generate_content(self, prompt, generation_config=None, stage=None, **kwargs):
+        self.prompts.append(prompt)
+        return LLMResponse(self.answers.pop(0))
+
+
+def test_reask_carries_compact_task_context():
+    prompt = "TAREFA: resuma o arquivo Foo.tsx\n" + "código " * 2000 + "\nResponda em JSON"
+    model = ScriptedBackend('{"symbols": ["Foo"]}', '{"summary": "renderiza Foo"}')
+    
+    data = generate_structured(model, prompt, 'chunk_summary')
+    
+    assert data == {'symbols': ['Foo'], 'summary': 'renderiza Foo'}
+    reask = model.prompts[1]
+    assert 'TAREFA: resuma o arquivo Foo.tsx' in reask and 'Responda em JSON' in reask
+    assert len(reask) < len(prompt) // 2
+    assert '"symbols": ["Foo"]' in reask and '"summary": "string"' in reask
+
+
+def test_missing_decision_fields_are_not_reasked():
+    model = ScriptedBackend('{"bugs_potential": [], "recommendation": "approve"}')
+    assert generate_structured(model, 'valide o diff', 'code_validation') is None
+    assert len(model.prompts) == 1
+    
+    model = ScriptedBackend('{"estimated_time": "5 min"}')
+    assert generate_structured(model, 'planeje', 'plan') is None
+    assert len(model.prompts) == 1
+
+
+def test_still_incomplete_after_reask_is_marked_fallback():
+    model = ScriptedBackend('{"symbols": ["Foo"]}', '{"state": "nenhum"}')
+    data = generate_structured(model, 'resuma', 'chunk_summary')
+    assert data == {'symbols': ['Foo'], 'fallback': True}
+
+
+def test_nothing_usable_is_not_reasked():
+    model = ScriptedBackend('não sei')
+    assert generate_structured(model, 'prompt', 'intent') is None
+    assert len(model.prompts) == 1
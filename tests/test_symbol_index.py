@@ -0,0 +1,42 @@
+"""Imports resolvidos pelo SymbolIndex"""
+
+import os
+
+from ptero_ai_ultra_pro import SymbolIndex
+
+
+def modules(tmp_path, content):
+    index = SymbolIndex(tmp_path / 'index.db')
+    index.root = str(tmp_path)
+    path = os.path.join(str(tmp_path), 'app', 'urls.py')
+    found = index._imported_modules(path, content, 'Python')
+    return {os.path.relpath(m, str(tmp_path)) for m in found}
+
+
+def test_single_line_from_import_stops_at_end_of_line(tmp_path):
+    found = modules(tmp_path, "from pkg import mod\nimport os\n\nfrom . import views\n\ndef f():\n    pass\n")
+    assert found == {'pkg', 'pkg/mod', 'os', 'app', 'app/views'}
+
+
+def test_parenthesised_from_import_spans_lines(tmp_path):
+    found = modules(tmp_path, "from pkg.sub import (\n    first,  # comentário\n    second as alias,\n)\nvalue = 1\n")
+    assert found == {'pkg/sub', 'pkg/sub/first', 'pkg/sub/second'}
+
+
+def test_generation_moves_only_when_indexed_content_changes(tmp_path):
+    source = tmp_path / 'painel' / 'app.py'
+    source.parent.mkdir()
+    source.write_text("def first():\n    pass\n")
+    index = SymbolIndex(tmp_path / 'index.db')
+    table = {'app.py': {'language': 'Python', 'mtime_ns': 1, 'size': 1}}
+    
+    index.refresh(str(source.parent), table)
+    assert index.generation == 1
+    index.update_file(str(source))  # conteúdo igual
+    assert index.generation == 1
+    
+    source.write_text("def second():\n    pass\n")
+    index.update_file(str(source))
+    assert index.generation == 2
+    index.close()
+    assert SymbolIndex(tmp_path / 'index.db').generation == 2
@@ -0,0 +1,80 @@
+"""Camadas locais do AIValidator"""
+
+import inspect
+import sys
+
+from ptero_ai_ultra_pro import AIValidator, SecurityLevel, SecurityRuleEngine, diff_code, diff_opcodes
+
+
+OLD_PHP = """<?php
+function destroy($user, $server) {
+    if (!$user->is_admin) {
+        throw new Exception('forbidden');
+    }
+    $server->delete();
+}
+"""
+
+REORDERED_PHP = """<?php
+function destroy($user, $server) {
+    $server->delete();
+    if (!$user->is_admin) {
+        throw new Exception('forbidden');
+    }
+}
+"""
+
+
+def test_reordered_permission_check_is_not_auto_approved():
+    validator = AIValidator(None)
+    impact, _ = validator._analyze_impact('app/Server.php', OLD_PHP, REORDERED_PHP)
+    assert impact != 'low'
+    recommendation, confidence = validator._cascade_verdict('app/Server.php', [], impact)
+    assert confidence < validator.CASCADE_THRESHOLD
+
+
+def test_python_dedent_out_of_if_counts_as_change():
+    old = "def f(x):\n    if x:\n        check()\n        run()\n"
+    new = "def f(x):\n    if x:\n        check()\n    run()\n"
+    impact, _ = AIValidator(None)._analyze_impact('app/f.py', old, new)
+    assert impact != 'low'
+
+
+def test_reindentation_in_free_form_language_is_ignored():
+    body = ''.join(f"  call{i}();\n" for i in range(30))
+    old = "function f() {\n  if (a) {\n" + body + "  }\n}\n"
+    new = old.replace("\n  ", "\n    ")
+    diff = diff_code(old, new, 'JavaScript')
+    assert diff['moved'] > 0
+    assert diff['reformatted'] == diff['moved'] + diff['inserted']
+    assert AIValidator(None)._analyze_impact('app/f.js', old, new) == ('low', {})
+
+
+def test_rule_severity_drives_security_level():
+    old = "<?php\n$a = 1;\n"
+    new = "<?php\n$a = unserialize($_GET['a']);\n"
+    result = AIValidator(None).validate_code_change('app/a.php', old, new)
+    assert result.security_level in (SecurityLevel.HIGH, SecurityLevel.CRITICAL)
+
+
+def test_user_rule_declared_critical_rejects():
+    rules = SecurityRuleEngine([{'id': 'debug-dump', 'pattern': r'\bdd\s*\(', 'anchors': ['dd'],
+                                 'message': 'dd() esquecido', 'severity': 'critical'}])
+    validator = AIValidator(None, rules=rules)
+    result = validator.validate_code_change('app/a.php', "<?php\n", "<?php\ndd($user);\n")
+    assert result.security_level == SecurityLevel.CRITICAL
+    assert not result.valid
+    assert validator.stats['ai_skipped'] == 1
+
+
+def test_diff_depth_does_not_grow_with_the_size_of_the_change():
+    old = [f"linha {i}" for i in range(6000)]
+    new = [old[i ^ 1] for i in range(len(old))]  # todo par de linhas trocado
+    limit = sys.getrecursionlimit()
+    sys.setrecursionlimit(len(inspect.stack()) + 40)
+    try:
+        opcodes = diff_opcodes(old, new)
+    finally:
+        sys.setrecursionlimit(limit)
+    rebuilt = [line for tag, i1, i2, j1, j2 in opcodes for line in (old[i1:i2] if tag == 'equal' else new[j1:j2])]
+    assert rebuilt == new